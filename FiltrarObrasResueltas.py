@@ -1,27 +1,154 @@
-import pandas as pd
+import argparse
+import datetime
+import sys
+from collections import defaultdict
+import metrics
+from result_writer import ResultWriter, parse_formats
+from xlsx_reader import XlsxReader
 
 # Ruta del archivo Excel de entrada
 input_file = 'Licitaciones2021.xlsx'  # Reemplaza con la ruta de tu archivo
 output_file = 'licitaciones_filtradas.xlsx'   # Nombre del archivo de salida
 
-try:
-    # Leer la hoja 'Licitaciones' del archivo Excel
-    df = pd.read_excel(input_file, sheet_name='Licitaciones')
-    
-    # Filtrar por Estado = 'Resuelta' y Tipo de contrato = 'Obras'
-    filtered_df = df[(df['Estado'] == 'Resuelta') & (df['Tipo de contrato'] == 'Obras')]
-    
-    # Guardar los datos filtrados en un nuevo archivo Excel
-    filtered_df.to_excel(output_file, index=False)
-    
-    print(f"Datos filtrados exportados correctamente a {output_file}")
-    
-except FileNotFoundError:
-    print("Error: El archivo de entrada no se encuentra. Verifica la ruta.")
-except ValueError as ve:
-    if "No sheet named" in str(ve):
-        print("Error: La hoja 'Licitaciones' no existe en el archivo Excel.")
-    else:
-        print("Error: Verifica que las columnas 'Estado' y 'Tipo de contrato' existan en la hoja.")
-except Exception as e:
-    print(f"Error inesperado: {str(e)}")
\ No newline at end of file
+# Hoja que se lee de cada archivo y hoja del archivo de salida (la que escribía pandas.to_excel)
+HOJA_ENTRADA = 'Licitaciones'
+HOJA_SALIDA = 'Sheet1'
+
+# Filtros por defecto: columna -> valores aceptados. Una fila se exporta si cumple todos.
+FILTROS = {'Estado': ['Resuelta'], 'Tipo de contrato': ['Obras']}
+
+# Convierte "Columna=Valor1|Valor2" en (columna, [valores])
+def parse_filtro(value):
+    columna, sep, valores = value.partition('=')
+    if not sep or not columna.strip():
+        raise argparse.ArgumentTypeError(f"filtro '{value}' no válido, se esperaba Columna=Valor")
+    return columna.strip(), valores.split('|')
+
+# Valor de una celda como texto, para compararlo con los valores de los filtros también en las
+# columnas de números y fechas: los enteros sin decimales y las fechas sin hora como AAAA-MM-DD.
+# El texto se compara tal cual, como hacía pandas ('Resuelta ' no es 'Resuelta').
+def texto_celda(valor):
+    if isinstance(valor, str):
+        return valor
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    if isinstance(valor, datetime.datetime) and valor.time() == datetime.time():
+        return valor.date().isoformat()
+    return str(valor)
+
+# Nombres de las columnas como los pone pandas.read_excel: sin las cabeceras vacías del final,
+# 'Unnamed: n' para las vacías y X.1, X.2... para las repetidas
+def nombres_columnas(cabecera):
+    cabecera = list(cabecera)
+    while cabecera and cabecera[-1] in (None, ''):
+        cabecera.pop()
+    nombres = []
+    vistos = defaultdict(int)
+    for i, nombre in enumerate(cabecera):
+        if nombre in (None, ''):
+            nombre = f"Unnamed: {i}"
+        repeticiones = vistos[nombre]
+        while repeticiones > 0:
+            vistos[nombre] = repeticiones + 1
+            nombre = f"{nombre}.{repeticiones}"
+            repeticiones = vistos[nombre]
+        vistos[nombre] = repeticiones + 1
+        nombres.append(nombre)
+    return nombres
+
+# Escribe en output_file las filas de los archivos que cumplen los filtros, según se leen, sin
+# cargar los libros en memoria. De cada fila solo se decodifican las celdas de las columnas de
+# los filtros, y la fila entera si los cumple. Las columnas de salida son las del primer
+# archivo; las de los demás se colocan por nombre. Con formats=['parquet'] la salida es
+# <output>.parquet, con los tipos de las celdas.
+# Devuelve (filas leídas, filas exportadas, archivos guardados).
+def filtrar(input_files, output_file=output_file, filtros=FILTROS, hoja=HOJA_ENTRADA, formats=('xlsx',)):
+    salida = ResultWriter(output_file, formats, [HOJA_SALIDA])
+    try:
+        leidas, exportadas = filtrar_archivos(input_files, salida, filtros, hoja)
+    except BaseException:
+        salida.discard()
+        raise
+    with metrics.timer('stage_seconds', stage='write'):
+        guardados = salida.close()
+    metrics.inc('rows_read', leidas)
+    metrics.inc('rows_written', exportadas)
+    return leidas, exportadas, guardados
+
+def filtrar_archivos(input_files, salida, filtros, hoja):
+    columnas = None
+    leidas = exportadas = 0
+    for path in input_files:
+        reader = XlsxReader(path)
+        try:
+            if hoja not in reader.sheetnames:
+                raise ValueError(f"No sheet named '{hoja}'")
+            filas = reader.rows(hoja)
+            cabecera = nombres_columnas(reader.values(next(filas, [])))
+            faltan = [columna for columna in filtros if columna not in cabecera]
+            if faltan:
+                raise KeyError(f"Faltan las columnas {faltan} en la hoja '{hoja}' de {path}")
+            if columnas is None:
+                columnas = cabecera
+            posiciones = [cabecera.index(columna) if columna in cabecera else None for columna in columnas]
+            if posiciones == list(range(len(cabecera))):
+                posiciones = None
+            condiciones = [(cabecera.index(columna), set(valores)) for columna, valores in filtros.items()]
+            leidas_archivo = exportadas_archivo = 0
+            with metrics.timer('stage_seconds', stage='filter'):
+                for celdas in filas:
+                    leidas_archivo += 1
+                    if not all(i < len(celdas) and texto_celda(reader.value(celdas[i])) in valores for i, valores in condiciones):
+                        continue
+                    fila = reader.values(celdas, len(cabecera))
+                    if posiciones is not None:
+                        fila = [fila[i] if i is not None else None for i in posiciones]
+                    salida.add_rows(0, exportadas + exportadas_archivo, [dict(zip(columnas, fila))])
+                    exportadas_archivo += 1
+        finally:
+            reader.close()
+        print(f"{path}: {leidas_archivo} filas leídas, {exportadas_archivo} cumplen los filtros")
+        leidas += leidas_archivo
+        exportadas += exportadas_archivo
+    return leidas, exportadas
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Filtrar las licitaciones de las exportaciones anuales de PLACSP")
+    parser.add_argument('input_files', nargs='*', default=[input_file],
+                        help=f"Archivos Excel de entrada, p. ej. uno por año (por defecto: {input_file})")
+    parser.add_argument('--output', default=output_file, help="Archivo de salida (por defecto: %(default)s)")
+    parser.add_argument('--formats', type=parse_formats, default=['xlsx'],
+                        help="Formatos de salida separados por comas: xlsx, csv, parquet (por defecto: xlsx)")
+    parser.add_argument('--hoja', default=HOJA_ENTRADA, help="Hoja de los archivos de entrada (por defecto: %(default)s)")
+    parser.add_argument('--filtro', type=parse_filtro, action='append', default=None,
+                        help="Columna=Valor1|Valor2; se puede repetir y se deben cumplir todos "
+                             "(por defecto: Estado=Resuelta y Tipo de contrato=Obras)")
+    return parser.parse_args(argv)
+
+# Devuelve False si no se pudo filtrar
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    filtros = dict(args.filtro) if args.filtro else FILTROS
+    try:
+        _, _, guardados = filtrar(args.input_files, args.output, filtros, args.hoja, args.formats)
+        print(f"Datos filtrados exportados correctamente a {', '.join(guardados)}")
+        metrics.report('FiltrarObrasResueltas')
+        return True
+    except FileNotFoundError as e:
+        print(f"Error: El archivo de entrada no se encuentra. Verifica la ruta. ({e.filename})")
+    except KeyError as e:
+        print(f"Error: Verifica que las columnas {list(filtros)} existan en la hoja. {e.args[0]}")
+    except ValueError as ve:
+        if "No sheet named" in str(ve):
+            print(f"Error: La hoja '{args.hoja}' no existe en el archivo Excel.")
+        else:
+            print(f"Error inesperado: {str(ve)}")
+    except Exception as e:
+        print(f"Error inesperado: {str(e)}")
+    return False
+
+if __name__ == '__main__':
+    sys.exit(1 if main(parse_args()) is False else 0)
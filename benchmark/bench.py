@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from fixtures import FIXTURES_DIR, MANIFEST, load_manifest
+
+# Benchmark of the crawl stages against a fixture corpus served by fixture_server.py.
+#   python benchmark/bench.py run --output before.json
+#   python benchmark/bench.py run --output after.json
+#   python benchmark/bench.py compare before.json after.json
+# Each target runs in its own process so peak RSS is measured per target.
+TARGETS = ['prefetch_urls', 'process_row_sync', 'extract_criteria']
+STAGES = ['fetch', 'parse', 'extract', 'write', 'cache_write']
+
+# Metrics compared by `compare`; True when higher is better. The hit rate is compared in
+# absolute terms (0.05 = 5 points), the others relative to the old value.
+METRICS = {'tenders_per_s': True, 'peak_rss_mb': False, 'cache_hit_rate': True}
+ABSOLUTE_METRICS = {'cache_hit_rate'}
+
+# Wall time of the calls to the functions of each stage
+class StageTimer:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def wrap(self, stage, func):
+        if asyncio.iscoroutinefunction(func):
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.samples[stage].append(time.perf_counter() - start)
+            return timed_async
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def patch(self, stage, module, name):
+        setattr(module, name, self.wrap(stage, getattr(module, name)))
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[stage] = {'calls': len(samples), 'total_s': round(sum(samples), 4),
+                             'mean_ms': round(statistics.mean(samples) * 1000, 3),
+                             'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+                             'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3)}
+        return result
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def load_rows():
+    conn = sqlite3.connect('licitaciones.db')
+    rows = conn.execute("SELECT Identificador, [Link licitación] FROM licitaciones").fetchall()
+    conn.close()
+    return rows
+
+def cache_hit_rate(stats):
+    lookups = stats['hits'] + stats['misses']
+    return round(stats['hits'] / lookups, 4) if lookups else None
+
+def setup_op2(args):
+    import log_config
+    import op2
+    import url_cache
+    # op2 no longer configures logging on import; log to its file as an op2 run does
+    log_config.setup_logging(op2.LOG_FILE)
+    op2.PARSER_ENGINE = args.parser_engine
+    conn = url_cache.setup_cache()
+    if args.cache in ('warm', 'stale'):
+        asyncio.run(op2.prefetch_urls(load_rows(), args.timeout, conn, args.concurrency, args.rps))
+        url_cache.flush_cache(conn)
+    if args.cache == 'stale':
+        conn.execute('UPDATE cache SET fetched_at = 0 WHERE doc_class = ?', (url_cache.DOC_TENDER,))
+        conn.commit()
+    url_cache.reset_stats()
+    return op2, url_cache, conn
+
+def run_prefetch_urls(args, timer):
+    op2, url_cache, conn = setup_op2(args)
+    timer.patch('fetch', op2, 'fetch_all')
+    timer.patch('parse', op2, 'parse_document_table')
+    timer.patch('cache_write', url_cache, 'flush_cache')
+    rows = load_rows()
+    start = time.perf_counter()
+    asyncio.run(op2.prefetch_urls(rows, args.timeout, conn, args.concurrency, args.rps))
+    url_cache.flush_cache(conn)
+    seconds = time.perf_counter() - start
+    url_cache.close_cache(conn)
+    return len(rows), seconds, cache_hit_rate(url_cache.stats)
+
+def run_process_row_sync(args, timer):
+    op2, url_cache, conn = setup_op2(args)
+    import lxml_engine
+    from result_writer import ResultWriter
+    for name in ['get_cached_content', 'fetch_url_sync']:
+        timer.patch('fetch', op2, name)
+    for name in ['parse_page', 'parse_document_table']:
+        timer.patch('parse', op2, name)
+    timer.patch('parse', lxml_engine, 'parse_document')
+    for name in ['list_documents', 'extract_modification', 'extract_adjudication']:
+        timer.patch('extract', op2, name)
+    timer.patch('extract', lxml_engine, 'extract_adjudication')
+    timer.patch('cache_write', url_cache, 'flush_cache')
+    rows = load_rows()
+    start = time.perf_counter()
+    writer = ResultWriter('resultados_licitaciones.xlsx')
+    add = timer.wrap('write', writer.add)
+    for i, row in enumerate(rows):
+        mods_before, adjs_before = len(op2.modificaciones), len(op2.adjudicaciones)
+        resultado = op2.process_row_sync(row, args.timeout, conn)
+        add(i, resultado, op2.modificaciones[mods_before:], op2.adjudicaciones[adjs_before:])
+    timer.wrap('write', writer.close)()
+    url_cache.flush_cache(conn)
+    seconds = time.perf_counter() - start
+    url_cache.close_cache(conn)
+    return len(rows), seconds, cache_hit_rate(url_cache.stats)
+
+# With --cache warm the cache holds what op2's prefetch_urls downloaded, as after an op2 run
+def run_extract_criteria(args, timer):
+    _, url_cache, conn = setup_op2(args)
+    import criteriosLici
+    logging.getLogger().setLevel(logging.WARNING)
+    timer.patch('fetch', criteriosLici, 'fetch_page')
+    timer.patch('parse', criteriosLici, 'BeautifulSoup')
+    timer.patch('extract', criteriosLici, 'extract_criteria')
+    timer.patch('cache_write', url_cache, 'flush_cache')
+    rows = load_rows()
+    start = time.perf_counter()
+    criteriosLici.open_results()
+    asyncio.run(criteriosLici.crawl(rows, conn, args.concurrency, args.timeout))
+    url_cache.flush_cache(conn)
+    timer.wrap('write', criteriosLici.save_results)()
+    seconds = time.perf_counter() - start
+    url_cache.close_cache(conn)
+    return len(rows), seconds, cache_hit_rate(url_cache.stats)
+
+# Run one target in this process (called by `run` in a fresh process, from the work directory)
+def run_target(args):
+    timer = StageTimer()
+    tenders, seconds, hit_rate = globals()[f'run_{args.target}'](args, timer)
+    print(json.dumps({'tenders': tenders, 'seconds': round(seconds, 4),
+                      'tenders_per_s': round(tenders / seconds, 3) if seconds else None,
+                      'stages': timer.summary(), 'peak_rss_mb': peak_rss_mb(), 'cache_hit_rate': hit_rate}))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(args, port):
+    command = [sys.executable, os.path.join(BENCH_DIR, 'fixture_server.py'), args.fixtures, '--port', str(port),
+               '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    server.stdout.readline()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Fixture server did not start")
+
+def make_work_dir(manifest, base):
+    work_dir = tempfile.mkdtemp(prefix='op2_bench_')
+    conn = sqlite3.connect(os.path.join(work_dir, 'licitaciones.db'))
+    conn.execute('CREATE TABLE licitaciones (Identificador INTEGER, "Link licitación" TEXT)')
+    conn.executemany('INSERT INTO licitaciones VALUES (?, ?)',
+                     [(tender['Identificador'], base + tender['path']) for tender in manifest['tenders']])
+    conn.commit()
+    conn.close()
+    return work_dir
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    if not os.path.exists(os.path.join(args.fixtures, MANIFEST)):
+        print(f"No corpus in {args.fixtures}, generating a synthetic one")
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'fixtures.py'), 'synthetic', '--out', args.fixtures],
+                       check=True)
+    manifest = load_manifest(args.fixtures)
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    server = start_server(args, port)
+    targets = {}
+    try:
+        for target in args.targets.split(','):
+            runs = []
+            for repeat in range(args.repeat):
+                work_dir = make_work_dir(manifest, base)
+                command = [sys.executable, os.path.abspath(__file__), 'target', target,
+                           '--cache', args.cache, '--timeout', str(args.timeout),
+                           '--concurrency', str(args.concurrency), '--rps', str(args.rps),
+                           '--parser-engine', args.parser_engine]
+                completed = subprocess.run(command, cwd=work_dir, capture_output=True, text=True)
+                shutil.rmtree(work_dir, ignore_errors=True)
+                if completed.returncode != 0:
+                    print(completed.stderr[-2000:])
+                    raise RuntimeError(f"Target {target} failed")
+                runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+                print(f"{target} run {repeat + 1}/{args.repeat}: {runs[-1]['tenders_per_s']} tenders/s")
+            # Report the median run by wall time
+            result = sorted(runs, key=lambda r: r['seconds'])[len(runs) // 2]
+            result['runs_seconds'] = [r['seconds'] for r in runs]
+            targets[target] = result
+    finally:
+        server.terminate()
+        server.wait()
+    report = {'meta': {'corpus': manifest['name'], 'corpus_kind': manifest['kind'], 'tenders': len(manifest['tenders']),
+                       'latency_ms': args.latency, 'jitter_ms': args.jitter, 'error_rate': args.error_rate,
+                       'cache': args.cache, 'concurrency': args.concurrency, 'rps': args.rps, 'repeat': args.repeat,
+                       'parser_engine': args.parser_engine,
+                       'git': git_revision(), 'python': platform.python_version(),
+                       'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'targets': targets}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f"Results saved to {args.output}")
+
+def print_report(report):
+    for target, result in report['targets'].items():
+        hit_rate = '-' if result['cache_hit_rate'] is None else f"{result['cache_hit_rate']:.1%}"
+        print(f"\n{target}: {result['tenders']} tenders in {result['seconds']:.2f}s, "
+              f"{result['tenders_per_s']} tenders/s, peak RSS {result['peak_rss_mb']} MB, cache hit rate {hit_rate}")
+        for stage, values in result['stages'].items():
+            print(f"  {stage:<12} {values['calls']:>7} calls  {values['total_s']:>9.3f}s  "
+                  f"mean {values['mean_ms']:>8.3f}ms  p50 {values['p50_ms']:>8.3f}ms  p95 {values['p95_ms']:>8.3f}ms")
+
+# Print old vs new for every metric and flag the ones that got worse by more than the threshold
+def compare(args):
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    if old['meta']['corpus'] != new['meta']['corpus'] or old['meta']['latency_ms'] != new['meta']['latency_ms']:
+        print("Warning: runs used different corpora or server settings")
+    regressions = 0
+    print(f"{'target':<18} {'metric':<22} {'old':>12} {'new':>12} {'change':>9}")
+    for target in old['targets']:
+        if target not in new['targets']:
+            continue
+        a, b = old['targets'][target], new['targets'][target]
+        metrics = [(name, a.get(name), b.get(name), higher) for name, higher in METRICS.items()]
+        for stage in STAGES:
+            if stage in a['stages'] and stage in b['stages']:
+                metrics.append((f'{stage} mean_ms', a['stages'][stage]['mean_ms'], b['stages'][stage]['mean_ms'], False))
+        for name, before, after, higher in metrics:
+            if before is None or after is None:
+                continue
+            if name in ABSOLUTE_METRICS:
+                change = after - before
+            else:
+                change = (after - before) / before if before else 0.0
+            worse = -change if higher else change
+            flag = ''
+            if worse > args.threshold:
+                flag = 'REGRESSION'
+                regressions += 1
+            elif -worse > args.threshold:
+                flag = 'improved'
+            print(f"{target:<18} {name:<22} {before:>12} {after:>12} {change:>+8.1%} {flag}")
+    if regressions:
+        print(f"\n{regressions} metrics regressed by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+def add_run_options(parser):
+    parser.add_argument('--cache', choices=['cold', 'warm', 'stale'], default='cold',
+                        help="Start from an empty URL cache, from one filled by prefetch_urls, or from one whose "
+                             "tender pages have expired and must be revalidated (default: %(default)s)")
+    parser.add_argument('--timeout', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--rps', type=float, default=0, help="Rate limit for the async fetches; 0 disables it (default: %(default)s)")
+    parser.add_argument('--parser-engine', choices=['bs4', 'lxml'], default='bs4',
+                        help="op2 --parser-engine for the op2 targets (default: %(default)s)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark op2.py and criteriosLici.py against a local fixture server")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Run the benchmark and save the results as JSON")
+    run_parser.add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, 'synthetic'),
+                            help="Corpus directory; a synthetic corpus is generated there if it is missing")
+    run_parser.add_argument('--targets', default=','.join(TARGETS), help="Comma-separated among " + ', '.join(TARGETS))
+    run_parser.add_argument('--latency', type=float, default=20, help="Server response delay in ms (default: %(default)s)")
+    run_parser.add_argument('--jitter', type=float, default=5, help="Uniform +/- variation of the delay in ms (default: %(default)s)")
+    run_parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with HTTP 500")
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--repeat', type=int, default=3, help="Runs per target; the median run is reported (default: %(default)s)")
+    run_parser.add_argument('--output', default='bench_results.json')
+    add_run_options(run_parser)
+    compare_parser = subparsers.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="Relative change counted as a regression (default: %(default)s)")
+    target_parser = subparsers.add_parser('target')
+    target_parser.add_argument('target', choices=TARGETS)
+    add_run_options(target_parser)
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        sys.exit(compare(args))
+    else:
+        run_target(args)
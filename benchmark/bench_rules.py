@@ -0,0 +1,71 @@
+import argparse
+import os
+import re
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import extraction_rules as rules
+from fixtures import FIXTURES_DIR, load_manifest
+
+# Micro-benchmark of the label classification done for every criterion <li> in
+# criteriosLici.extract_criteria: the former if/elif chain of re.search calls against
+# extraction_rules.classify_criteria_label, with and without its memo.
+#   python benchmark/bench_rules.py [--fixtures DIR]
+
+# Labels seen on PLACSP adjudication documents, used when no corpus is given
+SAMPLE_LABELS = ['Subtipo Criterio', 'Ponderación', 'Cantidad Mínima', 'Cantidad Máxima', 'Puntuación Mínima',
+                 'Puntuación Máxima', 'Expresión de evaluación', 'Fórmula', 'P = Pmax * Omin / Oi',
+                 'Descripción', 'Umbral', 'Tipo de Criterio']
+
+def classify_chain(span_text):
+    if re.search(r'subtipo\s*criterio', span_text, re.IGNORECASE):
+        return 'Subtipo Criterio'
+    elif re.search(r'ponderación', span_text, re.IGNORECASE):
+        return 'Ponderación'
+    elif re.search(r'(puntuación|cantidad)\s*mínima', span_text, re.IGNORECASE):
+        return 'Cantidad Mínima'
+    elif re.search(r'(puntuación|cantidad)\s*máxima', span_text, re.IGNORECASE):
+        return 'Cantidad Máxima'
+    elif re.search(r'(expresión\s*de\s*evaluación|fórmula)', span_text, re.IGNORECASE) or re.match(r'P\s*=.*', span_text, re.IGNORECASE):
+        return 'Fórmula o Detalle'
+    return None
+
+# <span> labels of the criterion <li> elements of the adjudication documents in a corpus
+def corpus_labels(fixtures_dir):
+    from bs4 import BeautifulSoup
+    manifest = load_manifest(fixtures_dir)
+    labels = []
+    for path, file in manifest['pages'].items():
+        if 'detalle_licitacion' in path:
+            continue
+        with open(os.path.join(fixtures_dir, file), encoding='utf-8') as f:
+            soup = BeautifulSoup(f.read(), 'lxml')
+        for span in soup.select('li span'):
+            labels.append(span.get_text(strip=True))
+    return labels
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the criteria label classification per <li>")
+    parser.add_argument('--fixtures', default=None, help=f"Corpus to take the labels from (e.g. {os.path.join(FIXTURES_DIR, 'synthetic')})")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    labels = corpus_labels(args.fixtures) if args.fixtures else SAMPLE_LABELS * 1000
+    for label in set(labels):
+        assert classify_chain(label) == rules.classify_criteria_label(label), label
+    uncached = rules.classify_criteria_label.__wrapped__
+    candidates = [('if/elif chain of re.search', classify_chain),
+                  ('combined regex', uncached),
+                  ('combined regex, memoized', rules.classify_criteria_label)]
+    print(f"{len(labels)} labels, {len(set(labels))} distinct")
+    baseline = None
+    for name, classify in candidates:
+        best = min(timeit.repeat(lambda: [classify(label) for label in labels], number=1, repeat=args.repeat))
+        per_li = best / len(labels) * 1e9
+        baseline = baseline or per_li
+        print(f"  {name:<28} {per_li:8.0f} ns per <li>  ({baseline / per_li:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fixtures import load_manifest
+
+# Differential test of op2's --parser-engine: runs the BeautifulSoup and the lxml Adjudicación
+# extractor on every document page of a corpus or a URL cache and reports the pages where the
+# Adj N/<label> keys and values, the Adjudicacion row or the error raised differ.
+#   python benchmark/diff_engines.py --fixtures benchmark/fixtures/recorded
+#   python benchmark/diff_engines.py --cache url_cache.db --fuzz 5
+# Exits with status 1 when any page differs.
+
+PREFIX = 'Adj 1'
+LINK = 'https://contrataciondelestado.es/wps/poc?uri=deeplink:detalle_licitacion&idEvl=diff'
+IDENTIFICADOR = 'diff'
+
+def corpus_pages(fixtures_dir):
+    manifest = load_manifest(fixtures_dir)
+    tender_paths = {tender['path'] for tender in manifest['tenders']}
+    for path, file in manifest['pages'].items():
+        if path in tender_paths:
+            continue
+        with open(os.path.join(fixtures_dir, file), encoding='utf-8') as f:
+            yield path, f.read()
+
+def cache_pages(cache_file):
+    import url_cache
+    conn = url_cache.setup_cache(cache_file)
+    rows = conn.execute('SELECT url, content, codec FROM cache WHERE doc_class = ?', (url_cache.DOC_DOCUMENT,)).fetchall()
+    url_cache.close_cache(conn)
+    for url, content, codec in rows:
+        yield url, url_cache.decompress(content, codec)
+
+# Markup variations that the portal produces or that stress the BeautifulSoup emulation:
+# comments, whitespace and &nbsp; between tags, inline wrappers, scripts and unclosed tags
+PERTURBATIONS = [
+    lambda m, rng: m.group(0) + '<!-- == $0 -->',
+    lambda m, rng: m.group(0) + rng.choice(['\n  ', ' ', '&nbsp;', '\xa0', '\t']),
+    lambda m, rng: m.group(0) + '<b>x</b>' if not m.group(0).startswith('</') else m.group(0),
+    lambda m, rng: m.group(0) + '<script>var a = 1;</script>',
+    lambda m, rng: '' if m.group(0) in ('</li>', '</span>', '</div>') else m.group(0),
+    lambda m, rng: m.group(0) + '<span></span>',
+]
+TAG = re.compile(r'<[^<>!]+>')
+
+def perturb(content, rng):
+    tags = list(TAG.finditer(content))
+    if not tags:
+        return content
+    chosen = {id(m): rng.choice(PERTURBATIONS) for m in rng.sample(tags, max(1, len(tags) // 10))}
+    pieces, last = [], 0
+    for m in tags:
+        if id(m) in chosen:
+            pieces.append(content[last:m.start()])
+            pieces.append(chosen[id(m)](m, rng))
+            last = m.end()
+    pieces.append(content[last:])
+    return ''.join(pieces)
+
+def run_engine(extract, parse, content, url):
+    try:
+        return extract(parse(content), content, url, PREFIX, LINK, IDENTIFICADOR)
+    except Exception as e:
+        return ('error', type(e).__name__, str(e))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare op2's bs4 and lxml Adjudicación extractors page by page")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--fixtures', help="Corpus directory written by fixtures.py")
+    source.add_argument('--cache', help="URL cache to read the document pages from")
+    parser.add_argument('--fuzz', type=int, default=0, help="Also compare N perturbed copies of every page")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    import op2
+    import lxml_engine
+    engines = {'bs4': (op2.extract_adjudication, lambda content: op2.parse_page(content, LINK)),
+               'lxml': (lxml_engine.extract_adjudication, lxml_engine.parse_document)}
+    pages = corpus_pages(args.fixtures) if args.fixtures else cache_pages(args.cache)
+    rng = random.Random(args.seed)
+    seconds = {name: 0.0 for name in engines}
+    compared = with_data = mismatches = 0
+    for url, content in pages:
+        variants = [content] + [perturb(content, rng) for _ in range(args.fuzz)]
+        for n, variant in enumerate(variants):
+            outputs = {}
+            for name, (extract, parse) in engines.items():
+                start = time.perf_counter()
+                outputs[name] = run_engine(extract, parse, variant, url)
+                seconds[name] += time.perf_counter() - start
+            compared += 1
+            if outputs['bs4'][0] != 'error' and outputs['bs4'][1]:
+                with_data += 1
+            if outputs['bs4'] != outputs['lxml']:
+                mismatches += 1
+                print(f"MISMATCH {url}" + (f" (perturbation {n})" if n else ''))
+                print(f"  bs4:  {outputs['bs4']}")
+                print(f"  lxml: {outputs['lxml']}")
+    print(f"{compared} pages compared, {with_data} with adjudication data, {mismatches} mismatches")
+    for name, total in seconds.items():
+        print(f"  {name:<5} {total:8.3f}s parse + extract ({total / compared * 1000 if compared else 0:.2f} ms per page)")
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+from aiohttp import web
+
+from fixtures import BASE_PLACEHOLDER, load_manifest
+
+# Local stand-in for the PLACSP portal: serves a fixture corpus with configurable latency
+# and error rate, so op2.py and criteriosLici.py can be benchmarked without the live site.
+# Pages carry an ETag and a Last-Modified date and conditional requests get 304 Not Modified.
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+def make_app(fixtures_dir, base, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, seed=None):
+    manifest = load_manifest(fixtures_dir)
+    pages = {}
+    for path, file in manifest['pages'].items():
+        with open(os.path.join(fixtures_dir, file), encoding='utf-8') as f:
+            pages[path] = f.read().replace(BASE_PLACEHOLDER, base)
+    etags = {path: '"' + hashlib.sha1(page.encode('utf-8')).hexdigest()[:16] + '"' for path, page in pages.items()}
+    rng = random.Random(seed)
+
+    async def handle(request):
+        delay = latency + rng.uniform(-jitter, jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rng.random() < error_rate:
+            return web.Response(status=error_status, text="Injected error")
+        path = request.raw_path if request.raw_path in pages else request.path_qs
+        page = pages.get(path)
+        if page is None:
+            raise web.HTTPNotFound()
+        headers = {'ETag': etags[path], 'Last-Modified': LAST_MODIFIED}
+        if (request.headers.get('If-None-Match') == etags[path]
+                or request.headers.get('If-Modified-Since') == LAST_MODIFIED):
+            return web.Response(status=304, headers=headers)
+        return web.Response(text=page, content_type='text/html', charset='utf-8', headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fixture corpus as a stand-in for the PLACSP portal")
+    parser.add_argument('fixtures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=20, help="Response delay in ms (default: %(default)s)")
+    parser.add_argument('--jitter', type=float, default=0, help="Uniform +/- variation of the delay in ms")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    app = make_app(args.fixtures, f'http://{args.host}:{args.port}', args.latency / 1000, args.jitter / 1000,
+                   args.error_rate, args.error_status, args.seed)
+    print(f"Serving {args.fixtures} on http://{args.host}:{args.port}", flush=True)
+    web.run_app(app, host=args.host, port=args.port, print=None)
@@ -0,0 +1,171 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# A fixture corpus is a directory with manifest.json and a pages/ folder. The manifest lists the
+# tenders (Identificador and path of the main page) and maps every path?query served by
+# fixture_server.py to its page file. Links inside the pages use BASE_PLACEHOLDER instead of
+# the portal origin; the server replaces it with its own address.
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+BASE_PLACEHOLDER = '{{BASE}}'
+MANIFEST = 'manifest.json'
+
+DOCUMENT_PATH = '/wps/wcm/connect/PLACE_es/Site/area/docAccCmpnt?srv=cmpnt&cmpntname=GetDocumentByIdServlet&DocumentIdParam={}'
+TENDER_PATH = '/wps/poc?uri=deeplink:detalle_licitacion&idEvl={}'
+
+def url_path(url):
+    parts = urlsplit(url)
+    return parts.path + (f'?{parts.query}' if parts.query else '')
+
+def page_file(path):
+    return f"pages/{hashlib.sha1(path.encode('utf-8')).hexdigest()}.html"
+
+def load_manifest(fixtures_dir):
+    with open(os.path.join(fixtures_dir, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+def write_corpus(out_dir, name, kind, tenders, pages):
+    os.makedirs(os.path.join(out_dir, 'pages'), exist_ok=True)
+    files = {}
+    for path, content in pages.items():
+        files[path] = page_file(path)
+        with open(os.path.join(out_dir, files[path]), 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'name': name, 'kind': kind, 'tenders': tenders, 'pages': files}, f, ensure_ascii=False, indent=1)
+    print(f"Wrote {len(tenders)} tenders and {len(pages)} pages to {out_dir}")
+
+# Copy the pages of already crawled tenders from url_cache.db, so benchmarks run on real
+# PLACSP markup without touching the portal
+def record(args):
+    import op2
+    import url_cache
+    url_cache.CACHE_TTL = 0
+    conn_data = sqlite3.connect(args.db)
+    rows = conn_data.execute("SELECT Identificador, [Link licitación] FROM licitaciones").fetchall()[args.offset:]
+    conn_data.close()
+    conn_cache = url_cache.setup_cache(args.cache)
+    tenders, pages, origins = [], {}, set()
+    for identificador, link in rows:
+        if len(tenders) >= args.limit:
+            break
+        content = url_cache.get_cached_content(conn_cache, link)
+        if not content:
+            continue
+        urls = {link: content}
+        for doc in op2.list_documents(op2.parse_document_table(content, link), link):
+            if doc['html_url']:
+                doc_content = url_cache.get_cached_content(conn_cache, doc['html_url'])
+                if doc_content:
+                    urls[doc['html_url']] = doc_content
+        for url, page in urls.items():
+            parts = urlsplit(url)
+            origins.add(f'{parts.scheme}://{parts.netloc}')
+            pages[url_path(url)] = page
+        tenders.append({'Identificador': identificador, 'path': url_path(link)})
+    url_cache.close_cache(conn_cache)
+    # Longest first so https://host:port is replaced before https://host
+    for origin in sorted(origins, key=len, reverse=True):
+        pages = {path: page.replace(origin, BASE_PLACEHOLDER) for path, page in pages.items()}
+    write_corpus(args.out, os.path.basename(os.path.normpath(args.out)), 'recorded', tenders, pages)
+
+def synthetic_main_page(identificador, documentos, padding):
+    filas = []
+    for fecha, documento, path in documentos:
+        if path:
+            enlaces = (f'<a title="Este documento se abrirá en una nueva ventana" target="_blank" '
+                       f'href="{BASE_PLACEHOLDER}{path.replace("&", "&amp;")}">Html</a> <a href="#">Pdf</a>')
+        else:
+            enlaces = '-'
+        filas.append(f'<tr><td>{fecha}</td><td>{documento}</td><td>{enlaces}</td></tr>')
+    relleno = '<div class="capaAtributos"><span>Órgano de Contratación</span> Ayuntamiento</div>' * padding
+    return (f'<html><head><title>Detalle licitación {identificador}</title></head><body>'
+            f'<div id="fila0">{relleno}</div>'
+            f'<table id="myTablaDetalleVISUOE"><tr><th>Fecha</th><th>Documento</th><th>Ver</th></tr>{"".join(filas)}</table>'
+            f'</body></html>')
+
+def synthetic_modification_page(identificador, j, rng):
+    return (f'<html><body><h3>Modificación del contrato</h3><ul>'
+            f'<li><span>Número de contrato</span> C-{identificador}-{j}</li>'
+            f'<li><span>Fecha de modificación</span> {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2022</li>'
+            f'<li><span>Importe total</span><ul><li><span>Sin impuestos</span>'
+            f'<div class="noremarca">{rng.randint(1000, 900000)},00 EUR</div></li></ul></li>'
+            f'</ul></body></html>')
+
+def synthetic_criteria(rng):
+    bloques = []
+    for categoria in ['Criterios evaluables mediante juicio de valor', 'Criterios evaluables mediante aplicación de fórmulas']:
+        items = []
+        for k in range(rng.randint(1, 3)):
+            items.append(f'<li><div class="noremarca">Criterio {k + 1}</div></li>'
+                         f'<li><div class="noremarca"><span>Subtipo Criterio</span> Subtipo {k + 1}</div></li>'
+                         f'<li><div class="noremarca"><span>Ponderación</span> {rng.randint(5, 60)}</div></li>'
+                         f'<li><div class="noremarca"><span>Expresión de evaluación</span> P = Pmax * Omin / Oi</div></li>')
+        bloques.append(f'<h6>{categoria}</h6><ul>{"".join(items)}</ul>')
+    return f'<div class="boxWithBackground"><h5>Criterios de Adjudicación</h5>{"".join(bloques)}</div>'
+
+def synthetic_adjudication_page(identificador, j, rng):
+    return (f'<html><body><div class="boxWithBackground"><h5>Información Sobre las Ofertas</h5>'
+            f'<div class="leftCol"><ul><li><span>Ofertas recibidas</span> {rng.randint(1, 12)}</li>'
+            f'<li><span>Precio de la oferta más baja</span><div class="noremarca">{rng.randint(1000, 900000)},50 EUR.</div></li></ul></div>'
+            f'<div class="rigCol"><ul><li><span>Se han excluido ofertas</span><span>No</span></li>'
+            f'<li><span>Número de ofertas</span><ul><li><span>PYMEs</span><div class="noremarca">{j}</div></li></ul></li></ul></div></div>'
+            f'{synthetic_criteria(rng)}</body></html>')
+
+# Deterministic corpus shaped like PLACSP tenders, for when no recorded corpus is available
+def synthetic(args):
+    rng = random.Random(args.seed)
+    tenders, pages = [], {}
+    documento_id = 0
+    for i in range(args.tenders):
+        identificador = 100000 + i
+        documentos = [('01/02/2021 10:00', 'Anuncio de Licitación', None), ('01/02/2021', 'Pliego', None)]
+        for j in range(rng.randint(0, 2)):
+            documento_id += 1
+            path = DOCUMENT_PATH.format(documento_id)
+            pages[path] = synthetic_adjudication_page(identificador, j, rng)
+            documentos.append((f'{j + 1:02d}/03/2021 12:00:01', 'Adjudicación', path))
+        for j in range(rng.randint(0, 3)):
+            documento_id += 1
+            path = DOCUMENT_PATH.format(documento_id)
+            pages[path] = synthetic_modification_page(identificador, j, rng)
+            documentos.append((f'{j + 1:02d}/05/2022', 'Modificación de contrato', path))
+        documentos.append(('02/06/2022', 'Formalización', None))
+        path = TENDER_PATH.format(identificador)
+        pages[path] = synthetic_main_page(identificador, documentos, args.padding)
+        tenders.append({'Identificador': identificador, 'path': path})
+    write_corpus(args.out, os.path.basename(os.path.normpath(args.out)), 'synthetic', tenders, pages)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build fixture corpora for benchmark/bench.py")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help="Copy crawled tenders from url_cache.db into a corpus")
+    record_parser.add_argument('--db', default='licitaciones.db')
+    record_parser.add_argument('--cache', default='url_cache.db')
+    record_parser.add_argument('--offset', type=int, default=0)
+    record_parser.add_argument('--limit', type=int, default=200, help="Number of tenders to record (default: %(default)s)")
+    record_parser.add_argument('--out', default=os.path.join(FIXTURES_DIR, 'recorded'))
+    synthetic_parser = subparsers.add_parser('synthetic', help="Generate a synthetic corpus")
+    synthetic_parser.add_argument('--tenders', type=int, default=200)
+    synthetic_parser.add_argument('--padding', type=int, default=400,
+                                  help="Filler blocks per main page, to approach the size of real pages (default: %(default)s)")
+    synthetic_parser.add_argument('--seed', type=int, default=1)
+    synthetic_parser.add_argument('--out', default=os.path.join(FIXTURES_DIR, 'synthetic'))
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    if args.command == 'record':
+        record(args)
+    else:
+        synthetic(args)
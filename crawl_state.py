@@ -0,0 +1,136 @@
+import sqlite3
+import logging
+import json
+import time
+import os
+
+# Per-tender progress of op2.py, so an interrupted run can be resumed with --resume
+STATE_FILE = 'crawl_state.db'
+STATE_BATCH_ROWS = 50
+
+_uncommitted = 0
+
+def setup_state(state_file=None):
+    conn = sqlite3.connect(state_file or STATE_FILE, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS tenders
+                      (identificador TEXT PRIMARY KEY, link TEXT, status TEXT, error TEXT,
+                       resultado TEXT, modificaciones TEXT, adjudicaciones TEXT,
+                       attempts INTEGER, first_seen REAL, updated_at REAL,
+                       estado TEXT, documentos INTEGER)''')
+    columns = [info[1] for info in cursor.execute("PRAGMA table_info('tenders')")]
+    for column, definition in [('estado', 'TEXT'), ('documentos', 'INTEGER')]:
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE tenders ADD COLUMN {column} {definition}')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_status ON tenders(status)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS failed_urls
+                      (url TEXT PRIMARY KEY, status TEXT, failures INTEGER,
+                       first_failed REAL, last_failed REAL, resolved_at REAL)''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_failed_status ON failed_urls(status)''')
+    conn.commit()
+    return conn
+
+def tender_key(identificador):
+    return str(identificador)
+
+# A tender is retried on --resume if its page or one of its documents could not be fetched
+def tender_error(resultado):
+    if str(resultado.get('Modificado', '')).startswith('Error'):
+        return resultado['Modificado']
+    errors = [f"{key}: {value}" for key, value in resultado.items()
+              if key.endswith('/Error') and str(value).startswith('Failed to')]
+    return '; '.join(errors) or None
+
+# Number of dated rows of the myTablaDetalleVISUOE table, from the 'Fecha <documento>' columns
+def count_documents(resultado):
+    return sum(len(str(value).split(', ')) for key, value in resultado.items()
+               if key.startswith('Fecha ') and value)
+
+def record_tender(conn, identificador, link, resultado, tender_mods, tender_adjs, estado=None):
+    global _uncommitted
+    error = tender_error(resultado)
+    now = time.time()
+    try:
+        conn.execute('''INSERT INTO tenders
+                        (identificador, link, status, error, resultado, modificaciones, adjudicaciones,
+                         attempts, first_seen, updated_at, estado, documentos)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
+                        ON CONFLICT(identificador) DO UPDATE SET
+                        link = excluded.link, status = excluded.status, error = excluded.error,
+                        resultado = excluded.resultado, modificaciones = excluded.modificaciones,
+                        adjudicaciones = excluded.adjudicaciones, attempts = attempts + 1,
+                        updated_at = excluded.updated_at, estado = excluded.estado,
+                        documentos = excluded.documentos''',
+                     (tender_key(identificador), link, 'failed' if error else 'done', error,
+                      json.dumps(resultado, ensure_ascii=False), json.dumps(tender_mods, ensure_ascii=False),
+                      json.dumps(tender_adjs, ensure_ascii=False), now, now, estado,
+                      count_documents(resultado)))
+        _uncommitted += 1
+        if _uncommitted >= STATE_BATCH_ROWS:
+            conn.commit()
+            _uncommitted = 0
+    except sqlite3.Error as e:
+        logging.error("SQLite error saving crawl state for %s: %s", identificador, e)
+
+# Keys of the tenders that completed in earlier runs
+def load_completed(conn):
+    return {key for key, in conn.execute("SELECT identificador FROM tenders WHERE status = 'done'")}
+
+# Stored (resultado, modificaciones, adjudicaciones) of a tender
+def load_tender(conn, key):
+    resultado, mods, adjs = conn.execute(
+        'SELECT resultado, modificaciones, adjudicaciones FROM tenders WHERE identificador = ?', (key,)).fetchone()
+    return json.loads(resultado), json.loads(mods), json.loads(adjs)
+
+# Estado and document count of every completed tender at the time it was crawled
+def load_snapshot(conn):
+    return {key: (estado, documentos) for key, estado, documentos in conn.execute(
+        "SELECT identificador, estado, documentos FROM tenders WHERE status = 'done'")}
+
+def record_failed_urls(conn, urls):
+    now = time.time()
+    conn.executemany('''INSERT INTO failed_urls (url, status, failures, first_failed, last_failed)
+                        VALUES (?, 'pending', 1, ?, ?)
+                        ON CONFLICT(url) DO UPDATE SET
+                        status = 'pending', failures = failures + 1, last_failed = excluded.last_failed,
+                        resolved_at = NULL''',
+                     [(url, now, now) for url in set(urls)])
+    conn.commit()
+
+# Mark queued URLs as resolved once is_resolved(url) says they were fetched
+def resolve_failed_urls(conn, is_resolved):
+    now = time.time()
+    resolved = [(now, url) for url, in conn.execute("SELECT url FROM failed_urls WHERE status = 'pending'")
+                if is_resolved(url)]
+    conn.executemany("UPDATE failed_urls SET status = 'resolved', resolved_at = ? WHERE url = ?", resolved)
+    conn.commit()
+    return len(resolved)
+
+def pending_failed_urls(conn):
+    return conn.execute('''SELECT url, failures, last_failed FROM failed_urls
+                           WHERE status = 'pending' ORDER BY last_failed''').fetchall()
+
+def close_state(conn):
+    global _uncommitted
+    conn.commit()
+    _uncommitted = 0
+    conn.close()
+
+def print_state(action, state_file=None):
+    state_file = state_file or STATE_FILE
+    if not os.path.exists(state_file):
+        print(f"Crawl state file '{state_file}' does not exist")
+        return
+    conn = setup_state(state_file)
+    if action == 'failed':
+        for url, failures, last_failed in pending_failed_urls(conn):
+            print(f"{url}\t{failures} failures\tlast {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_failed))}")
+    else:
+        print(f"Crawl state: {state_file}")
+        for status, count, last in conn.execute('SELECT status, COUNT(*), MAX(updated_at) FROM tenders GROUP BY status'):
+            print(f"  {status}: {count} tenders, last updated {time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}")
+        for status, count in conn.execute('SELECT status, COUNT(*) FROM failed_urls GROUP BY status'):
+            print(f"  Failed URLs {status}: {count}")
+    close_state(conn)
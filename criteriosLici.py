@@ -1,33 +1,69 @@
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup, NavigableString
-import re
+import asyncio
+import argparse
+import sys
+from collections import deque
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
 import logging
+import url_cache
+import extraction_rules as rules
+import metrics
+import log_config
+import http_client
+from result_writer import ResultWriter, parse_formats
+from url_cache import DOC_TENDER, DOC_DOCUMENT, setup_cache, get_cached_content, close_cache, evict_cache
 
-# Configurar el logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Hojas del Excel de salida
+CRITERIA_SHEETS = ['Criterios Detallados', 'Resumen por Licitación']
 
-# Leer el archivo Excel de entrada
-df_links = pd.read_excel('resultados_licitaciones_combinado.xlsx')  # Cambiado al nombre proporcionado
+# Criterios y resúmenes extraídos, que se van escribiendo al disco según se extraen.
+# Un criterio se guarda una sola vez por (Link licitación, Criterio, Subtipo Criterio).
+class CriteriaStore:
+    def __init__(self, output_file, formats=('xlsx',)):
+        self.writer = ResultWriter(output_file, formats, CRITERIA_SHEETS)
+        self.keys = set()
 
-# Listas para almacenar los datos
-criterios_data = []  # Detalles de los criterios
-summary_data = []    # Resumen por licitación
+    # Devuelve False si el criterio ya estaba guardado
+    def add_criterion(self, entry, unique=True):
+        if unique:
+            key = (entry['Link licitación'], entry['Criterio'], entry['Subtipo Criterio'])
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+        self.writer.add_rows(0, 0, [entry])
+        return True
+
+    def add_summary(self, entry):
+        self.writer.add_rows(1, 0, [entry])
+
+    def close(self):
+        return self.writer.close()
+
+criterios = None  # CriteriaStore de la ejecución en curso, creado por open_results
+
+# Parámetros de descarga
+TIMEOUT = 30
+CONCURRENCY = 10
+RETRIES = 3
+MAX_ACCESS = 6000
+
+ENLACES_ADJUDICACION = SoupStrainer('a', href=rules.ENLACE_ADJUDICACION)
 
 # Función para extraer los criterios de adjudicación
+@metrics.timed('extract_seconds', page='criterios')
 def extract_criteria(adj_soup, link, identificador):
     # Búsqueda flexible de la sección de criterios
     section_headers = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'div']
     criteria_section = None
     for tag in section_headers:
-        criteria_section = adj_soup.find(tag, string=re.compile(r'(criterios\s*(de\s*adjudicación|adjudicación|evaluables|evaluación))', re.IGNORECASE))
+        criteria_section = adj_soup.find(tag, string=rules.SECCION_CRITERIOS)
         if criteria_section:
-            logging.info(f"Sección encontrada en etiqueta <{tag}> en {link}")
+            logging.debug("Sección encontrada en etiqueta <%s> en %s", tag, link)
             break
 
     has_juicio_valor = False
     has_formulas = False
     data_extracted = False
+    criterios_added = 0
 
     if criteria_section:
         parent_container = criteria_section.find_parent() or criteria_section.find_parent('div', class_=['boxWithBackground', 'box01', 'content'])
@@ -47,17 +83,18 @@ def extract_criteria(adj_soup, link, identificador):
             'Fórmula o Detalle': ''
         }
         for ul in ul_elements:
-            prev_h6 = ul.find_previous(['h6', 'h5', 'h4'], string=re.compile(r'(juicio\s*de\s*valor|fórmulas|evaluables)', re.IGNORECASE))
+            prev_h6 = ul.find_previous(['h6', 'h5', 'h4'], string=rules.CATEGORIA_CRITERIOS)
             if prev_h6:
                 h6_text = prev_h6.get_text(strip=True).strip()
-                if re.search(r'fórmulas', h6_text, re.IGNORECASE):
+                categoria = rules.classify_category(h6_text)
+                if categoria == 'formulas':
                     has_formulas = True
                     entry['Categoría'] = 'Criterios evaluables mediante aplicación de fórmulas'
-                    logging.info(f"Sección de fórmulas en {link}")
-                elif re.search(r'juicio\s*de\s*valor', h6_text, re.IGNORECASE):
+                    logging.debug("Sección de fórmulas en %s", link)
+                elif categoria == 'juicio_valor':
                     has_juicio_valor = True
                     entry['Categoría'] = 'Criterios evaluables mediante un juicio de valor'
-                    logging.info(f"Sección de juicio de valor en {link}")
+                    logging.debug("Sección de juicio de valor en %s", link)
                 else:
                     continue
             for li in ul.find_all('li', recursive=False):
@@ -67,7 +104,7 @@ def extract_criteria(adj_soup, link, identificador):
                     if not div.find('span'):
                         current_criterio = div_text
                         entry['Criterio'] = current_criterio
-                        logging.info(f"Criterio principal encontrado: {current_criterio} en {link}")
+                        logging.debug("Criterio principal encontrado: %s en %s", current_criterio, link)
                         continue
                     span = div.find('span')
                     if span:
@@ -80,24 +117,15 @@ def extract_criteria(adj_soup, link, identificador):
                             elif sibling.name in ['div', 'span']:
                                 value = sibling.get_text(strip=True)
                                 break
-                        if re.search(r'subtipo\s*criterio', span_text, re.IGNORECASE):
-                            entry['Subtipo Criterio'] = value
-                        elif re.search(r'ponderación', span_text, re.IGNORECASE):
-                            entry['Ponderación'] = value
-                        elif re.search(r'(puntuación|cantidad)\s*mínima', span_text, re.IGNORECASE):
-                            entry['Cantidad Mínima'] = value
-                        elif re.search(r'(puntuación|cantidad)\s*máxima', span_text, re.IGNORECASE):
-                            entry['Cantidad Máxima'] = value
-                        elif re.search(r'(expresión\s*de\s*evaluación|fórmula)', span_text, re.IGNORECASE) or re.match(r'P\s*=.*', span_text, re.IGNORECASE):
-                            entry['Fórmula o Detalle'] = value
+                        columna = rules.classify_criteria_label(span_text)
+                        if columna:
+                            entry[columna] = value
                     if entry['Subtipo Criterio'] and entry['Ponderación']:
                         new_entry = entry.copy()
-                        if not any(d['Link licitación'] == new_entry['Link licitación'] and
-                                   d['Criterio'] == new_entry['Criterio'] and
-                                   d['Subtipo Criterio'] == new_entry['Subtipo Criterio'] for d in criterios_data):
-                            criterios_data.append(new_entry)
+                        if criterios.add_criterion(new_entry):
                             data_extracted = True
-                            logging.info(f"Datos añadidos para {link}: Categoría={new_entry['Categoría']}, Criterio={new_entry['Criterio']}")
+                            criterios_added += 1
+                            logging.debug("Datos añadidos para %s: Categoría=%s, Criterio=%s", link, new_entry['Categoría'], new_entry['Criterio'])
                         entry['Criterio'] = current_criterio
                         entry['Subtipo Criterio'] = ''
                         entry['Ponderación'] = ''
@@ -105,21 +133,19 @@ def extract_criteria(adj_soup, link, identificador):
                         entry['Cantidad Máxima'] = ''
                         entry['Fórmula o Detalle'] = ''
         if entry['Subtipo Criterio'] and entry['Ponderación']:
-            if not any(d['Link licitación'] == entry['Link licitación'] and
-                       d['Criterio'] == entry['Criterio'] and
-                       d['Subtipo Criterio'] == entry['Subtipo Criterio'] for d in criterios_data):
-                criterios_data.append(entry.copy())
+            if criterios.add_criterion(entry.copy()):
                 data_extracted = True
-                logging.info(f"Datos finales añadidos para {link}: Categoría={entry['Categoría']}, Criterio={entry['Criterio']}")
+                criterios_added += 1
+                logging.debug("Datos finales añadidos para %s: Categoría=%s, Criterio=%s", link, entry['Categoría'], entry['Criterio'])
     else:
-        logging.warning(f"No se encontró sección de criterios en {link}. Buscando estructuras alternativas...")
+        logging.warning("No se encontró sección de criterios en %s. Buscando estructuras alternativas...", link)
         # Búsqueda alternativa en tablas
         tables = adj_soup.find_all('table')
         for table in tables:
             rows = table.find_all('tr')
             for row in rows:
                 cells = row.find_all(['td', 'th'])
-                if cells and any(re.search(r'(criterios|ponderación|subtipo)', cell.get_text(strip=True), re.IGNORECASE) for cell in cells):
+                if cells and any(rules.FILA_CRITERIOS.search(cell.get_text(strip=True)) for cell in cells):
                     entry = {
                         'Link licitación': link,
                         'Identificador': identificador,
@@ -133,22 +159,14 @@ def extract_criteria(adj_soup, link, identificador):
                     }
                     for cell in cells:
                         text = cell.get_text(strip=True)
-                        if re.search(r'criterio', text, re.IGNORECASE):
-                            entry['Criterio'] = text
-                        elif re.search(r'subtipo', text, re.IGNORECASE):
-                            entry['Subtipo Criterio'] = text
-                        elif re.search(r'ponderación', text, re.IGNORECASE):
-                            entry['Ponderación'] = text
-                        elif re.search(r'(puntuación|cantidad)\s*mínima', text, re.IGNORECASE):
-                            entry['Cantidad Mínima'] = text
-                        elif re.search(r'(puntuación|cantidad)\s*máxima', text, re.IGNORECASE):
-                            entry['Cantidad Máxima'] = text
-                        elif re.search(r'(fórmula|evaluación)', text, re.IGNORECASE):
-                            entry['Fórmula o Detalle'] = text
+                        columna = rules.classify_criteria_cell(text)
+                        if columna:
+                            entry[columna] = text
                     if entry['Criterio'] or entry['Subtipo Criterio']:
-                        criterios_data.append(entry.copy())
+                        criterios.add_criterion(entry.copy(), unique=False)
                         data_extracted = True
-                        logging.info(f"Datos extraídos de tabla para {link}: {entry}")
+                        criterios_added += 1
+                        logging.debug("Datos extraídos de tabla para %s: %s", link, entry)
 
     # Guardar resumen
     summary_entry = {
@@ -158,53 +176,180 @@ def extract_criteria(adj_soup, link, identificador):
         'Criterios evaluables mediante aplicación de fórmulas': 'Sí' if has_formulas else 'No',
         'Criterios Adjudicación Error': 'No se encontró sección de criterios' if not criteria_section else ''
     }
-    summary_data.append(summary_entry)
+    criterios.add_summary(summary_entry)
+    logging.info("Criterios de %s: %s añadidos, juicio de valor: %s, fórmulas: %s",
+                 link, criterios_added, summary_entry['Criterios evaluables mediante un juicio de valor'],
+                 summary_entry['Criterios evaluables mediante aplicación de fórmulas'])
     return data_extracted
 
-# Contador de accesos y límite
-access_count = 0
-max_access = 6000
-
-# Procesar cada enlace del Excel
-for index, row in df_links.iterrows():
-    if access_count >= max_access:
-        logging.info(f"Límite de {max_access} accesos alcanzado.")
-        break
-    link = row['Link licitación']
-    identificador = row['Identificador']
+# Leer una URL de la caché de URLs de op2.py (url_cache.db) o descargarla con el cliente HTTP de
+# op2.py, que reintenta los errores, pide las páginas caducadas de forma condicional y guarda
+# en la caché lo descargado. None si no se pudo descargar.
+async def fetch_page(session, url, conn, doc_class, timeout=TIMEOUT, retries=RETRIES):
+    content = get_cached_content(conn, url)
+    if content:
+        logging.debug("Usando caché para %s", url)
+        return content
+    url_class = 'main_page' if doc_class == DOC_TENDER else 'criterios'
+    return await http_client.fetch_url_async(session, url, timeout, conn, doc_class, url_class=url_class, retries=retries)
+
+# Descargar la página de licitación y su documento de adjudicación (None si no lo tiene o no se pudo descargar)
+async def fetch_tender(session, link, conn, timeout=TIMEOUT, retries=RETRIES):
+    content = await fetch_page(session, link, conn, DOC_TENDER, timeout, retries)
+    if content is None:
+        logging.error("No se pudo descargar la página de licitación %s", link)
+        return None
+    # Solo se construyen los enlaces al documento de adjudicación, no la página entera
+    with metrics.timer('parse_seconds', page='main_page'):
+        soup = BeautifulSoup(content, 'html.parser', parse_only=ENLACES_ADJUDICACION)
+
+    # Buscar el enlace de adjudicación
+    adj_link_tag = soup.find('a', href=rules.ENLACE_ADJUDICACION)
+    if not adj_link_tag:
+        logging.warning("No se encontró enlace de adjudicación en %s", link)
+        return None
+    adj_content = await fetch_page(session, adj_link_tag['href'], conn, DOC_DOCUMENT, timeout, retries)
+    if adj_content is None:
+        logging.error("No se pudo descargar el documento de adjudicación de %s", link)
+    return adj_content
+
+# Descargar las licitaciones de forma concurrente y extraer los criterios en el orden de rows,
+# con como mucho 2 * concurrency licitaciones descargadas por adelantado. Una licitación que
+# falla se registra y se salta, sin perder lo extraído de las demás. La sesión es la de
+# op2.py: mismas cabeceras y pool de conexiones, y como mucho rps peticiones por segundo.
+# Devuelve el número de licitaciones de las que se extrajeron datos.
+async def crawl(rows, conn, concurrency=CONCURRENCY, timeout=TIMEOUT, retries=RETRIES, max_access=MAX_ACCESS,
+                rps=http_client.REQUESTS_PER_SECOND):
+    access_count = 0
+    pending = deque()
+    rows = iter(rows)
+    async with http_client.make_session(concurrency, rps) as session:
+        def schedule():
+            while len(pending) < 2 * concurrency:
+                row = next(rows, None)
+                if row is None:
+                    return
+                identificador, link = row
+                pending.append((identificador, link, asyncio.ensure_future(fetch_tender(session, link, conn, timeout, retries))))
+
+        schedule()
+        try:
+            while pending:
+                if access_count >= max_access:
+                    logging.info("Límite de %s accesos alcanzado.", max_access)
+                    break
+                identificador, link, task = pending.popleft()
+                try:
+                    adj_content = await task
+                    if adj_content is None:
+                        continue
+                    with metrics.timer('parse_seconds', page='criterios'):
+                        adj_soup = BeautifulSoup(adj_content, 'html.parser')
+                    extraidos = extract_criteria(adj_soup, link, identificador)
+                except Exception as e:
+                    logging.error("Error al procesar la licitación %s (%s): %s", identificador, link, e)
+                    metrics.inc('tenders_failed')
+                    continue
+                finally:
+                    schedule()
+
+                # Incrementar el contador solo si se extrajeron datos
+                if extraidos:
+                    access_count += 1
+                    logging.info("Acceso exitoso #%s para %s", access_count, link)
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
+    return access_count
+
+def open_results(output_file='resultados_criterios_licitaciones.xlsx', formats=('xlsx',)):
+    global criterios
+    criterios = CriteriaStore(output_file, formats)
+
+# Guardar los criterios y resúmenes en el Excel de salida
+def save_results():
+    global criterios
+    written = criterios.close()
+    criterios = None
+    return written
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Extraer los criterios de adjudicación de las licitaciones")
+    parser.add_argument('--input', default='resultados_licitaciones_combinado.xlsx',
+                        help="Salida de unirResultados.py, .xlsx o .parquet; se lee su hoja Resultados (por defecto: %(default)s)")
+    parser.add_argument('--output', default='resultados_criterios_licitaciones.xlsx')
+    parser.add_argument('--formats', type=parse_formats, default=['xlsx'],
+                        help="Formatos de salida separados por comas: xlsx, csv, parquet (por defecto: xlsx)")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="Descargas simultáneas como máximo (por defecto: %(default)s)")
+    parser.add_argument('--rps', type=float, default=http_client.REQUESTS_PER_SECOND,
+                        help="Peticiones por segundo al portal de media; 0 quita el límite (por defecto: %(default)s)")
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help="Timeout HTTP en segundos (por defecto: %(default)s)")
+    parser.add_argument('--retries', type=int, default=RETRIES, help="Intentos por URL (por defecto: %(default)s)")
+    parser.add_argument('--max-access', type=int, default=MAX_ACCESS,
+                        help="Parar tras extraer datos de N licitaciones (por defecto: %(default)s)")
+    parser.add_argument('--cache-ttl', type=float, default=url_cache.CACHE_TTL / 3600,
+                        help="Horas antes de volver a descargar una página de licitación de la caché; 0 no caduca (por defecto: %(default)s)")
+    parser.add_argument('--debug', action='store_true',
+                        help="Registrar en el log cada campo extraído de cada página")
+    parser.add_argument('--metrics-json', default=None,
+                        help="Resumen de métricas de la ejecución (por defecto: metrics_criteriosLici.json)")
+    parser.add_argument('--metrics-textfile', default=None,
+                        help="Guardar también las métricas en formato textfile de Prometheus en esta ruta")
+    return parser.parse_args(argv)
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    url_cache.CACHE_TTL = args.cache_ttl * 3600
+    # Configurar el logging: a la consola desde un hilo aparte, el detalle de cada campo solo con --debug
+    log_config.setup_logging()
+    log_config.set_debug(args.debug)
+    # Las estadísticas son de esta ejecución aunque main se llame varias veces en el mismo proceso
+    url_cache.reset_stats()
+    http_client.reset_stats()
+    metrics.reset()
+    # Leer del archivo de entrada solo las columnas que se usan; pandas se importa solo aquí
+    import tables
+    columnas = ['Identificador', 'Link licitación']
     try:
-        # Obtener el contenido de la página de licitación
-        response = requests.get(link)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser', from_encoding='utf-8')
-
-        # Buscar el enlace de adjudicación
-        adj_link_tag = soup.find('a', href=re.compile('GetDocumentByIdServlet'))
-        if adj_link_tag:
-            adj_url = adj_link_tag['href']
-            # Obtener el contenido de la página de adjudicación
-            adj_response = requests.get(adj_url)
-            adj_response.raise_for_status()
-            adj_soup = BeautifulSoup(adj_response.content, 'html.parser', from_encoding='utf-8')
-
-            # Extraer la información de los criterios
-            data_extracted = extract_criteria(adj_soup, link, identificador)
-
-            # Incrementar el contador solo si se extrajeron datos
-            if data_extracted:
-                access_count += 1
-                logging.info(f"Acceso exitoso #{access_count} para {link}")
-        else:
-            logging.warning(f"No se encontró enlace de adjudicación en {link}")
-    except requests.RequestException as e:
-        logging.error(f"Error al acceder a {link}: {e}")
-
-# Crear DataFrames y guardar en un nuevo Excel
-df_criterios = pd.DataFrame(criterios_data)
-df_summary = pd.DataFrame(summary_data)
-
-with pd.ExcelWriter('resultados_criterios_licitaciones.xlsx') as writer:
-    df_criterios.to_excel(writer, sheet_name='Criterios Detallados', index=False)
-    df_summary.to_excel(writer, sheet_name='Resumen por Licitación', index=False)
-
-logging.info(f"Procesamiento completado. Se procesaron {access_count} licitaciones.")
\ No newline at end of file
+        with metrics.timer('stage_seconds', stage='read'):
+            df_links = tables.read_table(args.input, 'Resultados', columns=columnas)
+    except FileNotFoundError:
+        logging.error("No se encuentra el archivo de entrada %s", args.input)
+        print(f"Error: No se encuentra el archivo de entrada {args.input}")
+        return False
+    faltantes = [col for col in columnas if col not in df_links.columns]
+    if faltantes:
+        logging.error("Faltan las columnas %s en %s", faltantes, args.input)
+        print(f"Error: Faltan las columnas {faltantes} en {args.input}")
+        return False
+
+    # Procesar cada enlace del Excel
+    rows = zip(df_links['Identificador'].tolist(), df_links['Link licitación'].tolist())
+    open_results(args.output, args.formats)
+    conn_cache = setup_cache()
+    try:
+        with metrics.timer('stage_seconds', stage='crawl'):
+            access_count = asyncio.run(crawl(rows, conn_cache, args.concurrency, args.timeout, args.retries,
+                                               args.max_access, args.rps))
+    finally:
+        evict_cache(conn_cache)
+        close_cache(conn_cache)
+    for line in url_cache.format_run_stats() + http_client.format_run_stats():
+        logging.info(line)
+        print(line)
+
+    with metrics.timer('stage_seconds', stage='save'):
+        save_results()
+
+    logging.info("Procesamiento completado. Se procesaron %s licitaciones.", access_count)
+    metrics.inc('rows_processed', access_count)
+    metrics.record_stats('cache', url_cache.stats)
+    metrics.record_stats('http_client', http_client.stats)
+    metrics.report('criteriosLici', args.metrics_json, args.metrics_textfile)
+    return True
+
+if __name__ == '__main__':
+    sys.exit(1 if main(parse_args()) is False else 0)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import re
+from functools import lru_cache
+
+# Patterns used by op2.py and criteriosLici.py to find and classify the parts of PLACSP pages.
+# They are compiled once here instead of inside the per-row and per-<li> loops.
+
+# Main page: table of dated documents
+DOCUMENT_TABLE_ID = 'myTablaDetalleVISUOE'
+HTML_LINK_ATTRS = {'title': 'Este documento se abrirá en una nueva ventana', 'target': '_blank'}
+FECHA_DOCUMENTO = re.compile(r'(\d{2}/\d{2}/\d{4}\s*\d{2}:\d{2}(:\d{2})?)|(\d{2}/\d{2}/\d{4})')
+MODIFICACION = re.compile('Modificaci', re.IGNORECASE)
+ADJUDICACION = re.compile('Adjudicaci', re.IGNORECASE)
+ENLACE_ADJUDICACION = re.compile('GetDocumentByIdServlet')
+
+# Adjudication document: "Información Sobre las Ofertas" heading
+CABECERA_OFERTAS = re.compile(r'(Informaci|Datos).*Oferta.*', re.IGNORECASE)
+ESPACIOS = re.compile(r'[\s\xa0]+')
+
+# Adjudication document: award criteria
+SECCION_CRITERIOS = re.compile(r'(criterios\s*(de\s*adjudicación|adjudicación|evaluables|evaluación))', re.IGNORECASE)
+CATEGORIA_CRITERIOS = re.compile(r'(juicio\s*de\s*valor|fórmulas|evaluables)', re.IGNORECASE)
+FILA_CRITERIOS = re.compile(r'(criterios|ponderación|subtipo)', re.IGNORECASE)
+
+# Combined classifiers: one alternation per if/elif chain. Each branch is a lookahead tried at
+# position 0, so the first branch that matches anywhere in the text wins, as in the chains.
+TIPO_DOCUMENTO = re.compile(r'(?=.*?(?P<Modificación>Modificaci))'
+                            r'|(?=.*?(?P<Adjudicación>Adjudicaci))', re.IGNORECASE | re.DOTALL)
+TIPO_CATEGORIA = re.compile(r'(?=.*?(?P<formulas>fórmulas))'
+                            r'|(?=.*?(?P<juicio_valor>juicio\s*de\s*valor))', re.IGNORECASE | re.DOTALL)
+ETIQUETA_CRITERIO = re.compile(r'(?=.*?(?P<subtipo>subtipo\s*criterio))'
+                               r'|(?=.*?(?P<ponderacion>ponderación))'
+                               r'|(?=.*?(?P<minima>(?:puntuación|cantidad)\s*mínima))'
+                               r'|(?=.*?(?P<maxima>(?:puntuación|cantidad)\s*máxima))'
+                               r'|(?=.*?(?P<formula>expresión\s*de\s*evaluación|fórmula))'
+                               r'|(?P<expresion>P\s*=)', re.IGNORECASE | re.DOTALL)
+CELDA_CRITERIO = re.compile(r'(?=.*?(?P<criterio>criterio))'
+                            r'|(?=.*?(?P<subtipo>subtipo))'
+                            r'|(?=.*?(?P<ponderacion>ponderación))'
+                            r'|(?=.*?(?P<minima>(?:puntuación|cantidad)\s*mínima))'
+                            r'|(?=.*?(?P<maxima>(?:puntuación|cantidad)\s*máxima))'
+                            r'|(?=.*?(?P<formula>fórmula|evaluación))', re.IGNORECASE | re.DOTALL)
+
+# Column of the criteria sheet filled by each label group
+COLUMNAS_CRITERIO = {'criterio': 'Criterio', 'subtipo': 'Subtipo Criterio', 'ponderacion': 'Ponderación',
+                     'minima': 'Cantidad Mínima', 'maxima': 'Cantidad Máxima',
+                     'formula': 'Fórmula o Detalle', 'expresion': 'Fórmula o Detalle'}
+
+def classify(pattern, text):
+    match = pattern.match(text)
+    return match.lastgroup if match else None
+
+# 'Modificación', 'Adjudicación' or None for the Documento cell of the document table
+def classify_document(documento_text):
+    return classify(TIPO_DOCUMENTO, documento_text)
+
+# 'formulas', 'juicio_valor' or None for the heading above a list of criteria
+def classify_category(heading_text):
+    return classify(TIPO_CATEGORIA, heading_text)
+
+# Criteria sheet column for the <span> label of a criterion <li>, or None.
+# Labels repeat across documents, so results are memoized.
+@lru_cache(maxsize=4096)
+def classify_criteria_label(span_text):
+    return COLUMNAS_CRITERIO.get(classify(ETIQUETA_CRITERIO, span_text))
+
+# Criteria sheet column for a cell of a criteria table, or None
+@lru_cache(maxsize=4096)
+def classify_criteria_cell(text):
+    return COLUMNAS_CRITERIO.get(classify(CELDA_CRITERIO, text))
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+
+import metrics
+from url_cache import DOC_TENDER, cache_content, conditional_headers, revalidate_content
+
+# HTTP client of op2.py. Headers, timeout, retry policy, TLS verification and connection pools
+# are set here for both paths: a shared aiohttp session for the async crawl and a pooled
+# requests.Session for the cache misses of the row pass, so repeated requests to
+# contrataciondelestado.es reuse keep-alive connections instead of opening one per page.
+# aiohttp and requests are imported by the functions that use them: op2's cache and state
+# commands import this module for its settings without loading either.
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+TIMEOUT = 30
+RETRIES = 3
+BACKOFF = 0.3
+VERIFY_TLS = False
+THROTTLE_STATUSES = (429, 503)
+
+# Network settings: at most CONCURRENCY requests in flight and REQUESTS_PER_SECOND
+# on average to contrataciondelestado.es (0 disables the rate limit)
+CONCURRENCY = 10
+REQUESTS_PER_SECOND = 10.0
+rate_limiter = None
+
+# Counters for the current run, and the URLs that failed after all retries
+stats = {'requests': 0, 'retries': 0, 'bytes': 0}
+failed_urls = []
+
+_sync_session = None
+
+# Token bucket shared by all async requests. The rate is halved when the portal
+# answers 429/503 and grows back by 10% after each second's worth of successes.
+class RateLimiter:
+    def __init__(self, rate, min_rate=0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.successes = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self, retry_after=None):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.successes = 0
+        if retry_after and retry_after.isdigit():
+            self.paused_until = max(self.paused_until, time.monotonic() + int(retry_after))
+        logging.warning("Portal is throttling requests, slowing down to %.2f requests/s", self.rate)
+
+    def recover(self):
+        if self.rate >= self.max_rate:
+            return
+        self.successes += 1
+        if self.successes >= self.rate:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+            self.successes = 0
+            logging.info("Portal healthy, speeding up to %.2f requests/s", self.rate)
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+    failed_urls.clear()
+
+def merge_stats(other, other_failed_urls=()):
+    for key, value in other.items():
+        stats[key] += value
+    failed_urls.extend(other_failed_urls)
+
+def format_run_stats():
+    return [f"HTTP stats: Requests={stats['requests']}, Downloaded={stats['bytes'] / 1024 / 1024:.1f} MB, "
+            f"Retries={stats['retries']}, Failed URLs={len(set(failed_urls))}"]
+
+# Label of a URL in the HTTP metrics: main_page, adjudicacion, modificacion, criterios,
+# or documento when the caller does not know the document type
+def label_url(doc_class, url_class=None):
+    return url_class or ('main_page' if doc_class == DOC_TENDER else 'documento')
+
+# aiohttp hooks that time the DNS lookup, the connection setup (TCP and TLS) and the wait for
+# the response headers of each request. Requests pass {'url_class': ...} as trace_request_ctx.
+def trace_config():
+    import aiohttp
+    config = aiohttp.TraceConfig()
+
+    def url_class(context):
+        return (context.trace_request_ctx or {}).get('url_class', 'documento')
+
+    async def on_request_start(session, context, params):
+        context.start = context.ready = time.perf_counter()
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        context.dns = time.perf_counter() - context.dns_start
+        metrics.observe('http_phase_seconds', context.dns, phase='dns', url_class=url_class(context))
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = time.perf_counter()
+        context.dns = 0.0
+
+    async def on_connection_create_end(session, context, params):
+        context.ready = time.perf_counter()
+        metrics.observe('http_phase_seconds', context.ready - context.connect_start - context.dns,
+                        phase='connect', url_class=url_class(context))
+
+    async def on_connection_reuseconn(session, context, params):
+        context.ready = time.perf_counter()
+        metrics.inc('http_connections_reused', url_class=url_class(context))
+
+    async def on_request_end(session, context, params):
+        metrics.observe('http_phase_seconds', time.perf_counter() - context.ready,
+                        phase='ttfb', url_class=url_class(context))
+
+    config.on_request_start.append(on_request_start)
+    config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_connection_reuseconn.append(on_connection_reuseconn)
+    config.on_request_end.append(on_request_end)
+    return config
+
+# Shared aiohttp session: pooled keep-alive connections and cached DNS lookups
+def make_session(concurrency=CONCURRENCY, rps=REQUESTS_PER_SECOND):
+    global rate_limiter
+    import aiohttp
+    rate_limiter = RateLimiter(rps) if rps and rps > 0 else None
+    connector = aiohttp.TCPConnector(limit=concurrency * 2, limit_per_host=concurrency,
+                                     keepalive_timeout=60, ttl_dns_cache=600, ssl=VERIFY_TLS)
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS, trace_configs=[trace_config()])
+
+# requests.Session of this process, created on first use. Retries are done by fetch_url_sync,
+# so the adapter only pools connections.
+def sync_session():
+    global _sync_session
+    if _sync_session is None:
+        import requests
+        import urllib3
+        from requests.adapters import HTTPAdapter
+        # Suppress InsecureRequestWarning while TLS verification is off
+        if not VERIFY_TLS:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        _sync_session = requests.Session()
+        _sync_session.headers.update(HEADERS)
+        _sync_session.verify = VERIFY_TLS
+        adapter = HTTPAdapter(pool_connections=CONCURRENCY, pool_maxsize=CONCURRENCY, max_retries=0)
+        _sync_session.mount('https://', adapter)
+        _sync_session.mount('http://', adapter)
+    return _sync_session
+
+# Drop the pooled connections, e.g. in a new worker process that inherited the parent's
+def close_sync_session():
+    global _sync_session
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
+
+def backoff(attempt):
+    return BACKOFF * (2 ** attempt)
+
+# A 304 answer to a request without validators, for a page not in the cache: nothing to return.
+# The URL is queued with the failed ones so --resume fetches it again.
+def not_modified_failure(url):
+    logging.error("Failed to fetch %s: 304 Not Modified for a page not in the cache", url)
+    failed_urls.append(url)
+    return None
+
+# Fetch URL content asynchronously. With revalidate, a page already in the cache is requested
+# conditionally and a 304 answer returns the cached copy; if that copy is gone (evicted or
+# unreadable) the page is requested once more without validators.
+async def fetch_url_async(session, url, timeout, conn, doc_class=None, revalidate=True, url_class=None, retries=RETRIES):
+    import aiohttp
+    url_class = label_url(doc_class, url_class)
+    headers = conditional_headers(conn, url) if revalidate else {}
+    for attempt in range(retries):
+        try:
+            if rate_limiter:
+                await rate_limiter.acquire()
+            stats['requests'] += 1
+            async with session.get(url, timeout=timeout, headers=headers, ssl=VERIFY_TLS,
+                                   trace_request_ctx={'url_class': url_class}) as response:
+                metrics.inc('http_requests', url_class=url_class, status=response.status)
+                if response.status in THROTTLE_STATUSES and rate_limiter:
+                    rate_limiter.throttle(response.headers.get('Retry-After'))
+                if response.status == 304:
+                    content = revalidate_content(conn, url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                    if content is None:
+                        break
+                    if rate_limiter:
+                        rate_limiter.recover()
+                    return content
+                response.raise_for_status()
+                with metrics.timer('http_phase_seconds', phase='download', url_class=url_class):
+                    body = await response.read()
+                stats['bytes'] += len(body)
+                metrics.inc('http_bytes', len(body), url_class=url_class)
+                content = await response.text()
+                cache_content(conn, url, content, doc_class,
+                              response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                if rate_limiter:
+                    rate_limiter.recover()
+                logging.debug("Fetched content from %s", url)
+                return content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats['retries'] += 1
+            metrics.inc('http_errors', url_class=url_class)
+            logging.warning("Attempt %s failed for %s: %s", attempt + 1, url, e)
+            if attempt < retries - 1:
+                await asyncio.sleep(backoff(attempt))
+            else:
+                logging.error("Failed to fetch %s after %s attempts: %s", url, retries, e)
+                failed_urls.append(url)
+                return None
+    # Only a 304 without a cached copy gets here
+    if revalidate:
+        logging.warning("Not modified but no cached copy of %s, fetching it again", url)
+        return await fetch_url_async(session, url, timeout, conn, doc_class, False, url_class, retries)
+    return not_modified_failure(url)
+
+# Fetch URL content synchronously on the pooled session, revalidating cached pages like fetch_url_async.
+# requests has no DNS/connect hooks: ttfb is response.elapsed, which includes setting up a new
+# connection, and download is the rest of the call.
+def fetch_url_sync(url, timeout, conn, doc_class=None, revalidate=True, url_class=None, retries=RETRIES):
+    import requests
+    url_class = label_url(doc_class, url_class)
+    headers = conditional_headers(conn, url) if revalidate else {}
+    for attempt in range(retries):
+        try:
+            stats['requests'] += 1
+            start = time.perf_counter()
+            response = sync_session().get(url, timeout=timeout, headers=headers)
+            elapsed = time.perf_counter() - start
+            ttfb = min(response.elapsed.total_seconds(), elapsed)
+            metrics.observe('http_phase_seconds', ttfb, phase='ttfb', url_class=url_class)
+            metrics.observe('http_phase_seconds', elapsed - ttfb, phase='download', url_class=url_class)
+            metrics.inc('http_requests', url_class=url_class, status=response.status_code)
+            if response.status_code == 304:
+                content = revalidate_content(conn, url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                if content is None:
+                    break
+                return content
+            response.raise_for_status()
+            stats['bytes'] += len(response.content)
+            metrics.inc('http_bytes', len(response.content), url_class=url_class)
+            content = response.text
+            cache_content(conn, url, content, doc_class,
+                          response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            logging.debug("Fetched content from %s", url)
+            return content
+        except requests.exceptions.RequestException as e:
+            stats['retries'] += 1
+            metrics.inc('http_errors', url_class=url_class)
+            logging.warning("Attempt %s failed for %s: %s", attempt + 1, url, e)
+            if attempt < retries - 1:
+                time.sleep(backoff(attempt))
+            else:
+                logging.error("Failed to fetch %s after %s attempts: %s", url, retries, e)
+                failed_urls.append(url)
+                return None
+    # Only a 304 without a cached copy gets here
+    if revalidate:
+        logging.warning("Not modified but no cached copy of %s, fetching it again", url)
+        return fetch_url_sync(url, timeout, conn, doc_class, False, url_class, retries)
+    return not_modified_failure(url)
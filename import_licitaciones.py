@@ -1,21 +1,109 @@
-import pandas as pd
+import argparse
 import sqlite3
+import sys
 import logging
 import os
+import pandas as pd
+import metrics
+import tables
+
+TABLE = 'licitaciones'
+KEY = 'Identificador'
+# Columns filtered and looked up on besides the primary key
+INDEXED_COLUMNS = ['Estado', 'Tipo de contrato']
+MODES = ['upsert', 'replace']
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+# SQLite type of a DataFrame column. Integers are BIGINT rather than INTEGER so that a numeric
+# Identificador primary key is not an alias of the rowid: rows stay in import order, which is
+# the order op2.py processes them in.
+def column_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    return 'TEXT'
+
+# Values of a column as sqlite3 parameters: None for missing values, dates as text like to_sql
+def column_values(series):
+    values = series.astype(object).tolist()
+    missing = series.isna().tolist()
+    return [None if absent else value if isinstance(value, (int, float, str, bytes)) else str(value)
+            for value, absent in zip(values, missing)]
+
+# Create the table with a primary key on Identificador, or bring an existing one up to date:
+# a table written by an older import (DataFrame.to_sql, no primary key) is rebuilt keeping its
+# rows and order, and columns new in this input are added.
+def ensure_schema(conn, df):
+    existing = {row[1]: row for row in conn.execute(f"PRAGMA table_info({quote(TABLE)})")}
+    if existing and not existing.get(KEY, (None,) * 6)[5]:
+        logging.info(f"Rebuilding table '{TABLE}' with a primary key on {KEY}")
+        conn.execute(f"ALTER TABLE {quote(TABLE)} RENAME TO {quote(TABLE + '_old')}")
+        old_columns = list(existing)
+        create_table(conn, [(name, 'BIGINT' if row[2].upper() == 'INTEGER' else row[2] or 'TEXT')
+                            for name, row in existing.items()])
+        names = ', '.join(quote(name) for name in old_columns)
+        conn.execute(f"INSERT OR IGNORE INTO {quote(TABLE)} ({names}) SELECT {names} FROM {quote(TABLE + '_old')} "
+                     f"WHERE {quote(KEY)} IS NOT NULL ORDER BY rowid")
+        conn.execute(f"DROP TABLE {quote(TABLE + '_old')}")
+    if not existing:
+        create_table(conn, [(column, column_type(df[column].dtype)) for column in df.columns])
+    else:
+        for column in df.columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {quote(TABLE)} ADD COLUMN {quote(column)} {column_type(df[column].dtype)}")
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote(TABLE)})")]
+    for column in INDEXED_COLUMNS:
+        if column in columns:
+            index = 'idx_' + TABLE + '_' + column.lower().replace(' ', '_')
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(index)} ON {quote(TABLE)} ({quote(column)})")
+
+def create_table(conn, columns):
+    definitions = [f"{quote(name)} {column_type}{' PRIMARY KEY' if name == KEY else ''}" for name, column_type in columns]
+    conn.execute(f"CREATE TABLE {quote(TABLE)} ({', '.join(definitions)})")
 
-logging.basicConfig(filename='import_licitaciones.log', level=logging.INFO, 
-                    format='%(asctime)s - %(message)s')
+# Insert new tenders and update the changed ones in one transaction; rows equal to the stored
+# ones are not rewritten. Returns (inserted, updated).
+def upsert_rows(conn, df):
+    columns = list(df.columns)
+    names = ', '.join(quote(column) for column in columns)
+    placeholders = ', '.join('?' * len(columns))
+    others = [quote(column) for column in columns if column != KEY]
+    sql = f"INSERT INTO {quote(TABLE)} ({names}) VALUES ({placeholders}) ON CONFLICT({quote(KEY)}) DO "
+    if others:
+        sql += (f"UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in others)} "
+                f"WHERE {' OR '.join(f'{quote(TABLE)}.{name} IS NOT excluded.{name}' for name in others)}")
+    else:
+        sql += "NOTHING"
+    rows = zip(*(column_values(df[column]) for column in columns))
+    before = conn.execute(f"SELECT COUNT(*) FROM {quote(TABLE)}").fetchone()[0]
+    changes = conn.total_changes
+    conn.executemany(sql, rows)
+    changes = conn.total_changes - changes
+    inserted = conn.execute(f"SELECT COUNT(*) FROM {quote(TABLE)}").fetchone()[0] - before
+    return inserted, changes - inserted
 
-def import_excel_to_db(input_file='licitaciones_filtradas.xlsx', db_file='licitaciones.db'):
+# Import the filtered tenders into the licitaciones table. mode 'upsert' inserts new tenders
+# and updates changed ones, keeping the tenders of earlier imports; 'replace' empties the table
+# first. Rows without Identificador are skipped and a repeated Identificador keeps its last row.
+def import_excel_to_db(input_file='licitaciones_filtradas.xlsx', db_file='licitaciones.db', mode='upsert'):
     try:
         if not os.path.exists(input_file):
             logging.error(f"Input file {input_file} not found")
             print(f"Error: Input file {input_file} not found")
             return False
-        logging.info(f"Reading Excel file: {input_file}")
-        df = pd.read_excel(input_file)
-        logging.info(f"Excel file read successfully. {len(df)} rows")
-        print(f"Excel file read successfully. {len(df)} rows")
+        logging.info(f"Reading {tables.table_format(input_file)} file: {input_file}")
+        with metrics.timer('stage_seconds', stage='read'):
+            df = tables.read_table(input_file)
+        metrics.inc('rows_read', len(df))
+        logging.info(f"Input file read successfully. {len(df)} rows")
+        print(f"Input file read successfully. {len(df)} rows")
         required_columns = ['Identificador', 'Link licitación']
         if not all(col in df.columns for col in required_columns):
             missing = [col for col in required_columns if col not in df.columns]
@@ -33,10 +121,40 @@ def import_excel_to_db(input_file='licitaciones_filtradas.xlsx', db_file='licita
                 logging.error(f"Could not rename columns to match required: {required_columns}")
                 print(f"Error: Could not rename columns to match required: {required_columns}")
                 return False
-        conn = sqlite3.connect(db_file)
-        df.to_sql('licitaciones', conn, if_exists='replace', index=False)
-        logging.info(f"Imported {len(df)} rows to table 'licitaciones' in {db_file}")
-        print(f"Imported {len(df)} rows to table 'licitaciones' in {db_file}")
+        df = df.rename(columns=str)
+        missing_key = df[KEY].isna()
+        if missing_key.any():
+            logging.warning(f"Skipping {missing_key.sum()} rows without {KEY}")
+            df = df[~missing_key]
+        if pd.api.types.is_float_dtype(df[KEY].dtype) and (df[KEY] % 1 == 0).all():
+            df = df.astype({KEY: 'int64'})
+        duplicated = df.duplicated(KEY, keep='last')
+        if duplicated.any():
+            logging.warning(f"{duplicated.sum()} rows repeat an {KEY} of a later row and are skipped")
+            df = df[~duplicated]
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        with metrics.timer('stage_seconds', stage='import'):
+            conn.execute('BEGIN')
+            try:
+                if mode == 'replace':
+                    conn.execute(f"DROP TABLE IF EXISTS {quote(TABLE)}")
+                ensure_schema(conn, df)
+                inserted, updated = upsert_rows(conn, df)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        unchanged = len(df) - inserted - updated
+        metrics.inc('rows_imported', len(df))
+        metrics.inc('rows_inserted', inserted)
+        metrics.inc('rows_updated', updated)
+        metrics.inc('rows_unchanged', unchanged)
+        logging.info(f"Imported {len(df)} rows to table '{TABLE}' in {db_file}: "
+                     f"{inserted} new, {updated} updated, {unchanged} unchanged")
+        print(f"Imported {len(df)} rows to table '{TABLE}' in {db_file}: "
+              f"{inserted} new, {updated} updated, {unchanged} unchanged")
         conn.close()
         return True
     except Exception as e:
@@ -46,8 +164,29 @@ def import_excel_to_db(input_file='licitaciones_filtradas.xlsx', db_file='licita
             conn.close()
         return False
 
-if __name__ == '__main__':
-    if import_excel_to_db():
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Import the filtered tenders into the SQLite database read by op2.py")
+    parser.add_argument('--input', default='licitaciones_filtradas.xlsx',
+                        help="Output of FiltrarObrasResueltas.py, .xlsx, .csv or .parquet (default: %(default)s)")
+    parser.add_argument('--db', default='licitaciones.db', help="SQLite database (default: %(default)s)")
+    parser.add_argument('--mode', choices=MODES, default='upsert',
+                        help="upsert: add new tenders and update changed ones, keeping the rest; "
+                             "replace: reload the table from the input (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    # Configured here, not on import, so that importing the module has no side effects
+    logging.basicConfig(filename='import_licitaciones.log', level=logging.INFO,
+                        format='%(asctime)s - %(message)s')
+    imported = import_excel_to_db(args.input, args.db, args.mode)
+    if imported:
         print("Import completed successfully")
     else:
-        print("Import failed")
\ No newline at end of file
+        print("Import failed")
+    metrics.report('import_licitaciones')
+    return imported
+
+if __name__ == '__main__':
+    sys.exit(1 if main(parse_args()) is False else 0)
\ No newline at end of file
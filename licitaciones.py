@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import argparse
+import importlib
+import sys
+
+# Single entry point for the pipeline stages:
+#   python licitaciones.py filter Licitaciones2021.xlsx Licitaciones2022.xlsx --formats parquet
+#   python licitaciones.py import --input licitaciones_filtradas.parquet
+#   python licitaciones.py crawl --limit 50          (also: crawl cache stats, crawl merge ...)
+#   python licitaciones.py merge --resultados resultados_licitaciones.xlsx
+#   python licitaciones.py criteria --input resultados_licitaciones_combinado.xlsx
+# Only the module of the chosen stage is imported, so pandas, aiohttp, BeautifulSoup and the
+# rest load only for the stages that use them. The stages are library functions as well:
+# FiltrarObrasResueltas.filtrar, import_licitaciones.import_excel_to_db, op2.main,
+# unirResultados.combinar and criteriosLici.main, or module.main(module.parse_args([...])).
+
+# Subcommand -> (module, entry point, description)
+COMMANDS = {
+    'filter': ('FiltrarObrasResueltas', 'main', "Filter the tenders of the yearly PLACSP exports"),
+    'import': ('import_licitaciones', 'main', "Import the filtered tenders into licitaciones.db"),
+    'crawl': ('op2', 'run', "Extract modification and adjudication data for the tenders in licitaciones.db"),
+    'merge': ('unirResultados', 'main', "Add the filtered tenders' columns to the crawl results"),
+    'criteria': ('criteriosLici', 'main', "Extract the award criteria of the merged tenders"),
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='licitaciones', description="PLACSP tender pipeline",
+        epilog="Stages, in pipeline order:\n" + "\n".join(f"  {name:<10}{description}" for name, (_, _, description) in COMMANDS.items())
+               + "\n\nRun 'licitaciones <stage> --help' for the options of a stage.",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=list(COMMANDS), metavar='stage', help=', '.join(COMMANDS))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options of the stage")
+    return parser.parse_args(argv)
+
+# Runs a stage; its entry point returns False when the stage failed, for the exit code
+def main(argv=None):
+    args = parse_args(argv)
+    module_name, entry_point, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    options = module.parse_args(args.args, prog=f"licitaciones {args.command}")
+    return getattr(module, entry_point)(options)
+
+if __name__ == '__main__':
+    result = main()
+    sys.exit(1 if result is False else 0)
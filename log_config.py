@@ -0,0 +1,88 @@
+import atexit
+import logging
+import multiprocessing
+import queue
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Logging of the pipeline scripts. A log call on the processing thread only puts the record
+# on a queue; a QueueListener thread formats it and writes it to a rotating log file (or the
+# console), so file I/O stays off the crawl. Per-field extraction records are DEBUG and only
+# written with --debug; by default each tender gets one INFO summary record.
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+MAX_BYTES = 50 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Output handlers of this process and the listener threads feeding them
+handlers = []
+listeners = []
+
+# Queue handler for a listener in the same process: the record is queued as it is and the
+# listener thread merges msg and args, so the log call costs no formatting. Log arguments
+# must not be mutated after the call.
+class LocalQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+# Like logging.basicConfig, does nothing if the root logger already has handlers unless force
+def setup_logging(log_file=None, debug=False, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, force=False):
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    if log_file:
+        handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers.append(handler)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(LocalQueueHandler(log_queue))
+    set_debug(debug)
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    listeners.append(listener)
+
+def set_debug(debug):
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.INFO)
+
+# Flush the queued records and close the log file
+def stop_logging():
+    while listeners:
+        listeners.pop().stop()
+    while handlers:
+        handlers.pop().close()
+
+atexit.register(stop_logging)
+
+# Queue for the records of worker processes, written by this process's handlers while the
+# block runs. Yields None when logging was not set up by setup_logging.
+@contextmanager
+def worker_queue():
+    if not handlers:
+        yield None
+        return
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    try:
+        yield log_queue
+    finally:
+        listener.stop()
+        log_queue.close()
+
+# In a worker process: send the records to the parent's worker_queue() instead of the
+# handlers and listener threads copied from the parent
+def init_worker_logging(log_queue, level):
+    if log_queue is None:
+        return
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handlers.clear()
+    listeners.clear()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
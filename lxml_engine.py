@@ -0,0 +1,257 @@
+import html
+import logging
+from lxml import etree
+
+import extraction_rules as rules
+import metrics
+
+# lxml engine for op2.py's Adjudicación extractor (--parser-engine lxml). It walks a raw lxml
+# tree with compiled XPath instead of BeautifulSoup and gives the same Adj N/<label> keys and
+# values as op2.extract_adjudication: the helpers below reproduce the BeautifulSoup semantics
+# the extractor depends on (.string, get_text(strip=True), class matching, sibling strings).
+# benchmark/diff_engines.py compares both engines over a corpus or a URL cache.
+# document_table() finds the document table of a main page for op2.parse_document_table, and
+# table_rows(), matching_cells() and html_link() read it the way op2 used to with BeautifulSoup.
+
+HEADING_TAGS = ['h5', 'h4', 'h3']
+COLUMN_CLASSES = ['leftCol', 'rigCol', 'leftCo1', 'rigCo1']
+# Strings inside these tags are not NavigableStrings in BeautifulSoup and get_text() skips them
+STRING_CONTAINERS = ('rt', 'rp', 'style', 'script', 'template')
+
+_headings = {tag: etree.XPath(f'//{tag}') for tag in HEADING_TAGS}
+_all_headings = etree.XPath('//h5|//h4|//h3')
+_first_body = etree.XPath('(//body)[1]')
+_divs = etree.XPath('descendant::div')
+_child_uls = etree.XPath('ul')
+_child_lis = etree.XPath('li')
+_first_span = etree.XPath('descendant::span[1]')
+_first_ul = etree.XPath('descendant::ul[1]')
+_document_table = etree.XPath(f'(//table[@id="{rules.DOCUMENT_TABLE_ID}"])[1]')
+_rows = etree.XPath('descendant::tr')
+_cells = etree.XPath('descendant::td')
+# find_next('td') walks the cell's own descendants first, then the rest of the document
+_next_cell = etree.XPath('(descendant::td|following::td)[1]')
+_html_links = etree.XPath('descendant::a[@title=$title and @target=$target]')
+
+def parse_html(content):
+    return etree.fromstring(content.encode('utf-8'), etree.HTMLParser(encoding='utf-8'))
+
+@metrics.timed('parse_seconds', page='documento', engine='lxml')
+def parse_document(content):
+    return parse_html(content)
+
+# The first table myTablaDetalleVISUOE of a main page, or None. The element stays in the
+# page's tree, so html_link() can look past the table as find_next('td') did.
+def document_table(content):
+    tree = parse_html(content)
+    if tree is None:
+        return None
+    return first(_document_table, tree)
+
+# The <td> cells of each row of a table: table.find_all('tr'), then row.find_all('td')
+def table_rows(table):
+    return [_cells(row) for row in _rows(table)]
+
+# table.find_all('td', string=pattern)
+def matching_cells(table, pattern):
+    cells = []
+    for cell in _cells(table):
+        string = element_string(cell)
+        if string is not None and pattern.search(string):
+            cells.append(cell)
+    return cells
+
+# href of cell.find_next('td').find('a', attrs=rules.HTML_LINK_ATTRS, string='Html'), or None
+def html_link(cell):
+    next_cell = first(_next_cell, cell)
+    if next_cell is None:
+        return None
+    for link in _html_links(next_cell, **rules.HTML_LINK_ATTRS):
+        if element_string(link) == 'Html':
+            return link.get('href')
+    return None
+
+def is_string(node):
+    return node.tag is etree.Comment or node.tag is etree.ProcessingInstruction
+
+def has_class(element, name):
+    return name in (element.get('class') or '').split()
+
+# BeautifulSoup's Tag.string: the only child string, looking through single-child tags
+def element_string(element):
+    children = []
+    if element.text:
+        children.append(element.text)
+    for child in element:
+        children.append(child)
+        if child.tail:
+            children.append(child.tail)
+        if len(children) > 1:
+            return None
+    if len(children) != 1:
+        return None
+    child = children[0]
+    if isinstance(child, str):
+        return child
+    if is_string(child):
+        return child.text or ''
+    return element_string(child)
+
+# BeautifulSoup's get_text(strip=True)
+def get_text(element):
+    if any(ancestor.tag in STRING_CONTAINERS for ancestor in element.iterancestors()):
+        return ''
+    if next(element.iter(*STRING_CONTAINERS), None) is None:
+        return ''.join(text.strip() for text in element.itertext())
+    parts = []
+    _collect_text(element, False, parts)
+    return ''.join(parts)
+
+def _collect_text(element, special, parts):
+    if is_string(element):
+        return
+    special = special or element.tag in STRING_CONTAINERS
+    if element.text and not special and element.text.strip():
+        parts.append(element.text.strip())
+    for child in element:
+        _collect_text(child, special, parts)
+        if child.tail and not special and child.tail.strip():
+            parts.append(child.tail.strip())
+
+# The strings and tags following a <span> at the same level, as span.next_siblings yields them
+def next_siblings(element):
+    if element.tail:
+        yield element.tail
+    for sibling in element.itersiblings():
+        if is_string(sibling):
+            yield sibling.text or ''
+        else:
+            yield sibling
+        if sibling.tail:
+            yield sibling.tail
+
+def find_div(container, name):
+    for div in _divs(container):
+        if has_class(div, name):
+            return div
+    return None
+
+def find_parent_div(element, name=None):
+    for ancestor in element.iterancestors('div'):
+        if name is None or has_class(ancestor, name):
+            return ancestor
+    return None
+
+def first(xpath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+# Same contract as op2.extract_adjudication, on a tree from parse_document
+@metrics.timed('extract_seconds', page='adjudicacion', engine='lxml')
+def extract_adjudication(tree, adj_content, html_url, prefix, link, identificador):
+    datos_adjudicacion = {}
+    h5_ofertas = None
+    for tag in HEADING_TAGS:
+        for heading in _headings[tag](tree):
+            string = element_string(heading)
+            if string is not None and rules.CABECERA_OFERTAS.search(string):
+                h5_ofertas = heading
+                break
+        if h5_ofertas is not None:
+            h5_text = html.unescape(get_text(h5_ofertas))
+            h5_text_normalized = rules.ESPACIOS.sub(' ', h5_text).strip()
+            logging.debug("Matched <%s> with text: '%s' on %s", tag, h5_text_normalized, html_url)
+            break
+
+    if h5_ofertas is None:
+        heading_texts = [html.unescape(get_text(h)) for h in _all_headings(tree)]
+        if heading_texts:
+            logging.warning("No <h5/h4/h3> matched '(Informaci|Datos).*Oferta.*' on %s. Found %s heading tags with texts: %s", html_url, len(heading_texts), heading_texts)
+        else:
+            logging.warning("No <h5/h4/h3> tags found at all on %s", html_url)
+        logging.debug("HTML content (first 2000 chars) for %s: %s", html_url, adj_content[:2000])
+        if 'Informaci' in adj_content or 'Oferta' in adj_content:
+            logging.info("Raw HTML contains 'Informaci' or 'Oferta', indicating possible parsing issue on %s", html_url)
+        parent_container = find_div(tree, 'boxWithBackground')
+        if parent_container is None:
+            parent_container = first(_first_body, tree)
+            logging.info("No <div class='boxWithBackground'> found, falling back to <body> on %s", html_url)
+        else:
+            logging.info("No <h5/h4/h3> found, but located <div class='boxWithBackground'> on %s", html_url)
+    else:
+        parent_container = find_parent_div(h5_ofertas, 'boxWithBackground')
+        if parent_container is None:
+            parent_container = find_parent_div(h5_ofertas)
+            logging.info("No <div class='boxWithBackground'> parent found for <%s> on %s, using nearest <div>", h5_ofertas.tag, html_url)
+    if parent_container is None:
+        # Where the BeautifulSoup extractor fails calling .find on None
+        raise AttributeError("'NoneType' object has no attribute 'find'")
+
+    adj_data = {'Link licitación': link, 'Identificador': identificador}
+    data_found = False
+
+    for col_class in COLUMN_CLASSES:
+        col_div = find_div(parent_container, col_class)
+        if col_div is None:
+            logging.debug("No <div class='%s'> found in parent container on %s", col_class, html_url)
+            continue
+        for ul in _child_uls(col_div):
+            for li in _child_lis(ul):
+                span = first(_first_span, li)
+                if span is None:
+                    continue
+                span_text = get_text(span)
+                value = None
+                for sibling in next_siblings(span):
+                    if isinstance(sibling, str):
+                        text_value = sibling.strip()
+                        if text_value and text_value != '== $0':
+                            value = text_value
+                            break
+                    elif sibling.tag == 'div' and has_class(sibling, 'noremarca'):
+                        value = get_text(sibling)
+                        break
+                    elif sibling.tag == 'span':
+                        value = get_text(sibling)
+                        break
+                if value:
+                    key = f"{prefix}/{span_text}"
+                    datos_adjudicacion[key] = value
+                    adj_data[span_text] = value
+                    logging.debug("Column in %s on %s: %s, Value: %s", col_class, html_url, key, value)
+                    data_found = True
+                else:
+                    logging.debug("No value found for span '%s' in %s on %s", span_text, col_class, html_url)
+
+                nested_ul = first(_first_ul, li)
+                if nested_ul is None:
+                    continue
+                for nested_li in _child_lis(nested_ul):
+                    nested_span = first(_first_span, nested_li)
+                    nested_div = find_div(nested_li, 'noremarca')
+                    if nested_span is not None and nested_div is not None:
+                        nested_span_text = get_text(nested_span)
+                        nested_value = get_text(nested_div)
+                        if nested_value:
+                            key = f"{prefix}/{nested_span_text}"
+                            datos_adjudicacion[key] = nested_value
+                            adj_data[nested_span_text] = nested_value
+                            logging.debug("Nested column in %s on %s: %s, Value: %s", col_class, html_url, key, nested_value)
+                            data_found = True
+                    elif nested_div is not None:
+                        nested_value = get_text(nested_div)
+                        if nested_value:
+                            key = f"{prefix}/{span_text}"
+                            datos_adjudicacion[key] = nested_value
+                            adj_data[span_text] = nested_value
+                            logging.debug("Nested column (no span) in %s on %s: %s, Value: %s", col_class, html_url, key, nested_value)
+                            data_found = True
+
+    if data_found and not any(k in adj_data for k in ['Error']):
+        return datos_adjudicacion, adj_data
+    if not data_found:
+        datos_adjudicacion[f"{prefix}/Error"] = 'No data found in leftCol or rigCol'
+        logging.warning("No data found in <div class='leftCol'> or <div class='rigCol'> on %s", html_url)
+    if h5_ofertas is None:
+        datos_adjudicacion[f"{prefix}/Error"] = datos_adjudicacion.get(f"{prefix}/Error", '') + '; No <h5/h4/h3> found for Información Sobre las Ofertas'
+    return datos_adjudicacion, None
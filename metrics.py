@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Run metrics of the pipeline scripts (FiltrarObrasResueltas, import_licitaciones, op2,
+# unirResultados, criteriosLici): counters and latency histograms keyed by name and labels.
+# report() prints the stages sorted by total time, writes a JSON summary and, when asked,
+# a Prometheus textfile for node_exporter's textfile collector.
+#   http_phase_seconds{phase=dns|connect|ttfb|download, url_class=main_page|adjudicacion|modificacion|criterios}
+#   parse_seconds{page}, extract_seconds{page}, write_seconds{output}, stage_seconds{stage}
+JSON_FILE = 'metrics_{script}.json'
+PROMETHEUS_PREFIX = 'licitaciones'
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# (name, labels) -> value, and (name, labels) -> [bucket counts..., +Inf count], sum, max
+counters = {}
+histograms = {}
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = (name, label_key(labels))
+    counters[key] = counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    key = (name, label_key(labels))
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0}
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            histogram['buckets'][i] += 1
+            break
+    else:
+        histogram['buckets'][-1] += 1
+    histogram['sum'] += seconds
+    histogram['count'] += 1
+    histogram['max'] = max(histogram['max'], seconds)
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+# Decorator form of timer() for functions called once per page or row
+def timed(name, **labels):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorate
+
+# Counters of another module's stats dict (url_cache.stats, http_client.stats) as unlabeled
+# prefix_<key>. The prefix must differ from the names counted with labels through inc(), or
+# the unlabeled series would repeat the labeled ones and sums would count them twice.
+def record_stats(prefix, stats):
+    for key, value in stats.items():
+        counters[(f'{prefix}_{key}', ())] = value
+
+def reset():
+    counters.clear()
+    histograms.clear()
+
+# Picklable copy of the metrics, to send from a worker process to the parent
+def snapshot():
+    return {'counters': dict(counters), 'histograms': {key: dict(h, buckets=list(h['buckets'])) for key, h in histograms.items()}}
+
+def merge(other):
+    for key, value in other['counters'].items():
+        counters[key] = counters.get(key, 0) + value
+    for key, h in other['histograms'].items():
+        histogram = histograms.get(key)
+        if histogram is None:
+            histograms[key] = dict(h, buckets=list(h['buckets']))
+            continue
+        histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], h['buckets'])]
+        histogram['sum'] += h['sum']
+        histogram['count'] += h['count']
+        histogram['max'] = max(histogram['max'], h['max'])
+
+# Upper bound of the bucket holding the q-th quantile
+def quantile(histogram, q):
+    rank = q * histogram['count']
+    seen = 0
+    for bound, count in zip(BUCKETS + (histogram['max'],), histogram['buckets']):
+        seen += count
+        if seen >= rank:
+            return min(bound, histogram['max'])
+    return histogram['max']
+
+def format_labels(labels):
+    return ','.join(f'{key}={value}' for key, value in labels)
+
+def summary(script):
+    result = {'script': script, 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'counters': {}, 'histograms': {}}
+    for (name, labels), value in sorted(counters.items()):
+        result['counters'].setdefault(name, {})[format_labels(labels)] = value
+    for (name, labels), h in sorted(histograms.items()):
+        result['histograms'].setdefault(name, {})[format_labels(labels)] = {
+            'count': h['count'], 'total_s': round(h['sum'], 4),
+            'mean_ms': round(h['sum'] / h['count'] * 1000, 3) if h['count'] else None,
+            'p50_ms': round(quantile(h, 0.5) * 1000, 3), 'p95_ms': round(quantile(h, 0.95) * 1000, 3),
+            'max_ms': round(h['max'] * 1000, 3)}
+    return result
+
+def prometheus_text(script):
+    lines = []
+    base = (('script', script),)
+    for name in sorted({name for name, _ in counters}):
+        metric = f'{PROMETHEUS_PREFIX}_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f'{metric}{{{prometheus_labels(base + labels)}}} {value}')
+    for name in sorted({name for name, _ in histograms}):
+        metric = f'{PROMETHEUS_PREFIX}_{name}'
+        lines.append(f'# TYPE {metric} histogram')
+        for (histogram_name, labels), h in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), h['buckets']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{prometheus_labels(base + labels + (("le", str(bound)),))}}} {cumulative}')
+            lines.append(f'{metric}_sum{{{prometheus_labels(base + labels)}}} {h["sum"]}')
+            lines.append(f'{metric}_count{{{prometheus_labels(base + labels)}}} {h["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def prometheus_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+# Write through a temporary file so readers never see a partial file
+def write_file(path, text):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# Print the timed stages, slowest first, and save the JSON summary (and the Prometheus textfile).
+# json_file=False skips the JSON file. The METRICS_TEXTFILE environment variable sets the textfile
+# for scripts without options; {script} in it is replaced by the script name.
+def report(script, json_file=None, textfile=None):
+    result = summary(script)
+    rows = [(h['total_s'], name, labels, h) for name, by_labels in result['histograms'].items()
+            for labels, h in by_labels.items()]
+    if rows:
+        print(f"Stage times ({script}):")
+        for total, name, labels, h in sorted(rows, key=lambda row: row[0], reverse=True):
+            print(f"  {name + ('{' + labels + '}' if labels else ''):<60} {h['count']:>7} calls  {total:>9.3f}s  "
+                  f"mean {h['mean_ms']:>8.3f}ms  p95 <= {h['p95_ms']:>8.3f}ms")
+    if json_file is not False:
+        json_file = json_file or JSON_FILE.format(script=script)
+        write_file(json_file, json.dumps(result, ensure_ascii=False, indent=1))
+        logging.info("Metrics saved to %s", json_file)
+    textfile = textfile or os.environ.get('METRICS_TEXTFILE')
+    if textfile:
+        textfile = textfile.format(script=script)
+        write_file(textfile, prometheus_text(script))
+        logging.info("Prometheus metrics saved to %s", textfile)
+    return result
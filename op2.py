@@ -1,556 +1,760 @@
 #!/usr/bin/env python3
-import import_licitaciones
-import pandas as pd
-import requests
-import aiohttp
 import asyncio
-from bs4 import BeautifulSoup, NavigableString
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import sys
-import re
 from urllib.parse import urljoin
 import logging
-from tqdm import tqdm
 import time
 import sqlite3
 import html
-import openpyxl
-import urllib3
 import os
+import hashlib
+import url_cache
+import crawl_state
+import extraction_rules as rules
+import log_config
+from result_writer import ResultWriter, merge_workbooks, parse_formats
+import http_client
+import metrics
+from http_client import TIMEOUT, CONCURRENCY, REQUESTS_PER_SECOND, make_session, fetch_url_async, fetch_url_sync
+from url_cache import (DOC_TENDER, DOC_DOCUMENT, setup_cache, get_cached_content,
+                       flush_cache, close_cache, evict_cache, print_cache_stats)
 
-# Suppress InsecureRequestWarning (optional)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Log file of the crawl: rotating, written by a background thread (log_config.setup_logging)
+LOG_FILE = 'licitaciones.log'
 
-# Configure logging
-logging.basicConfig(filename='licitaciones.log', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+# BeautifulSoup, lxml, tqdm and requests are imported by the functions that use them (as are
+# aiohttp in http_client and openpyxl in result_writer), so the cache and state commands start
+# without loading them
 
 # Global counters
-cache_hits = 0
-cache_misses = 0
-retry_count = 0
 modificaciones = []
 adjudicaciones = []
-failed_urls = []
-
-# Set up SQLite cache
-def setup_cache():
-    conn = sqlite3.connect('url_cache.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS cache
-                      (url TEXT PRIMARY KEY, content TEXT)''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_url ON cache(url)''')
-    conn.commit()
-    return conn
-
-# SQLite cache functions
-def get_cached_content(conn, url):
-    global cache_hits, cache_misses
-    try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT content FROM cache WHERE url = ?', (url,))
-        cached = cursor.fetchone()
-        if cached:
-            cache_hits += 1
-            return cached[0]
-        cache_misses += 1
-        logging.warning(f"Cache miss for {url}")
-        return None
-    except sqlite3.Error as e:
-        logging.error(f"SQLite error reading cache for {url}: {e}")
-        return None
 
-def cache_content(conn, url, content):
-    try:
-        cursor = conn.cursor()
-        cursor.execute('INSERT OR REPLACE INTO cache (url, content) VALUES (?, ?)', (url, content))
-        conn.commit()
-    except sqlite3.Error as e:
-        logging.error(f"SQLite error saving cache for {url}: {e}")
-
-# Fetch URL content asynchronously
-async def fetch_url_async(session, url, timeout, conn):
-    global retry_count, failed_urls
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    for attempt in range(3):
-        try:
-            async with session.get(url, timeout=timeout, headers=headers, ssl=False) as response:
-                response.raise_for_status()
-                content = await response.text()
-                cache_content(conn, url, content)
-                logging.info(f"Fetched content from {url}")
-                return content
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            retry_count += 1
-            logging.warning(f"Attempt {attempt+1} failed for {url}: {e}")
-            if attempt < 2:
-                await asyncio.sleep(0.3 * (2 ** attempt))
-            else:
-                logging.error(f"Failed to fetch {url} after 3 attempts: {e}")
-                failed_urls.append(url)
-                return None
-    return None
-
-# Fetch URL content synchronously
-def fetch_url_sync(url, timeout, conn):
-    global retry_count, failed_urls
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    for attempt in range(3):
-        try:
-            response = requests.get(url, timeout=timeout, headers=headers, verify=False)
-            response.raise_for_status()
-            content = response.text
-            cache_content(conn, url, content)
-            logging.info(f"Fetched content from {url}")
-            return content
-        except requests.exceptions.RequestException as e:
-            retry_count += 1
-            logging.warning(f"Attempt {attempt+1} failed for {url}: {e}")
-            if attempt < 2:
-                time.sleep(0.3 * (2 ** attempt))
-            else:
-                logging.error(f"Failed to fetch {url} after 3 attempts: {e}")
-                failed_urls.append(url)
-                return None
-    return None
+# Parser of adjudication documents: 'bs4' (BeautifulSoup) or 'lxml' (lxml_engine, XPath on the raw tree)
+PARSER_ENGINE = 'bs4'
+PARSER_ENGINES = ['bs4', 'lxml']
+
+# Fetch URLs through a work queue with at most `concurrency` requests in flight,
+# so a slow page only holds up its own slot
+async def fetch_all(session, urls, timeout, conn, doc_class=None, concurrency=CONCURRENCY, desc=None, url_classes=None):
+    from tqdm import tqdm
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    
+    with tqdm(total=len(urls), desc=desc) as progress:
+        async def worker():
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await fetch_url_async(session, url, timeout, conn, doc_class,
+                                      url_class=url_classes.get(url) if url_classes else None)
+                progress.update(1)
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(urls)))))
 
 # Pre-fetch URLs with concurrency
-async def prefetch_urls(rows, timeout, conn):
-    global failed_urls
-    failed_urls = []
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+async def prefetch_urls(rows, timeout, conn, concurrency=CONCURRENCY, rps=REQUESTS_PER_SECOND):
+    import lxml_engine
+    http_client.failed_urls.clear()
     unique_urls = set()
-    new_urls = set()
+    new_urls = {}
     
     for row in rows:
         link = row[1]
         unique_urls.add(link)
     
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for link in tqdm(list(unique_urls), desc="Pre-fetching main pages"):
-            content = get_cached_content(conn, link)
-            if not content:
-                tasks.append(fetch_url_async(session, link, timeout, conn))
-            if len(tasks) >= 10:
-                await asyncio.gather(*tasks)
-                tasks = []
-        if tasks:
-            await asyncio.gather(*tasks)
+    async with make_session(concurrency, rps) as session:
+        pending = [link for link in unique_urls if not get_cached_content(conn, link)]
+        await fetch_all(session, pending, timeout, conn, DOC_TENDER, concurrency, "Pre-fetching main pages")
         
         for link in unique_urls:
             content = get_cached_content(conn, link)
-            if content:
-                try:
-                    soup = BeautifulSoup(content, 'lxml')
-                except Exception as e:
-                    logging.warning(f"Error with lxml on {link}: {e}. Using html.parser")
-                    soup = BeautifulSoup(content, 'html.parser')
-                
-                modificacion_rows = soup.find_all('td', string=re.compile('Modificaci', re.IGNORECASE))
-                for row in modificacion_rows:
-                    html_link = row.find_next('td').find('a', 
-                        attrs={'title': 'Este documento se abrirá en una nueva ventana', 'target': '_blank'},
-                        string='Html'
-                    )
-                    if html_link and 'href' in html_link.attrs:
-                        html_url = urljoin(link, html_link['href'])
-                        new_urls.add(html_url)
-                        logging.info(f"Found modification URL: {html_url}")
+            table = parse_document_table(content, link) if content else None
+            if table is not None:
+                for cell in lxml_engine.matching_cells(table, rules.MODIFICACION):
+                    href = lxml_engine.html_link(cell)
+                    if href is not None:
+                        html_url = urljoin(link, href)
+                        new_urls[html_url] = 'modificacion'
+                        logging.debug("Found modification URL: %s", html_url)
                 
-                adjudicacion_rows = soup.find_all('td', string=re.compile('Adjudicaci', re.IGNORECASE))
-                for row in adjudicacion_rows:
-                    html_link = row.find_next('td').find('a', 
-                        attrs={'title': 'Este documento se abrirá en una nueva ventana', 'target': '_blank'},
-                        string='Html'
-                    )
-                    if html_link and 'href' in html_link.attrs:
-                        html_url = urljoin(link, html_link['href'])
-                        new_urls.add(html_url)
-                        logging.info(f"Found adjudication URL: {html_url}")
+                for cell in lxml_engine.matching_cells(table, rules.ADJUDICACION):
+                    href = lxml_engine.html_link(cell)
+                    if href is not None:
+                        html_url = urljoin(link, href)
+                        new_urls.setdefault(html_url, 'adjudicacion')
+                        logging.debug("Found adjudication URL: %s", html_url)
     
         unique_urls.update(new_urls)
-        logging.info(f"Collected {len(new_urls)} additional URLs (total: {len(unique_urls)})")
+        logging.info("Collected %s additional URLs (total: %s)", len(new_urls), len(unique_urls))
         
-        tasks = []
-        for url in tqdm(unique_urls, desc="Pre-fetching remaining URLs"):
-            if not get_cached_content(conn, url):
-                tasks.append(fetch_url_async(session, url, timeout, conn))
-            if len(tasks) >= 10:
-                await asyncio.gather(*tasks)
-                tasks = []
-        if tasks:
-            await asyncio.gather(*tasks)
-    
-    logging.info(f"Pre-fetched {len(unique_urls)} unique URLs")
-    if failed_urls:
-        with open('failed_urls.txt', 'w') as f:
-            f.write('\n'.join(failed_urls))
-        logging.warning(f"{len(failed_urls)} URLs failed to fetch, saved to failed_urls.txt")
-        print(f"{len(failed_urls)} URLs failed to fetch, saved to failed_urls.txt")
+        pending = [url for url in unique_urls if not get_cached_content(conn, url)]
+        await fetch_all(session, pending, timeout, conn, None, concurrency, "Pre-fetching remaining URLs", new_urls)
+    
+    logging.info("Pre-fetched %s unique URLs", len(unique_urls))
 
-# Process a single row
-def process_row_sync(row, timeout, conn):
-    global retry_count, modificaciones, adjudicaciones, failed_urls
+# Parse an HTML document, falling back to html.parser if lxml fails
+@metrics.timed('parse_seconds', page='documento', engine='bs4')
+def parse_page(content, url):
+    from bs4 import BeautifulSoup
+    try:
+        return BeautifulSoup(content, 'lxml', from_encoding='utf-8')
+    except Exception as e:
+        logging.warning("Error with lxml on %s: %s. Using html.parser as fallback", url, e)
+        return BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
+
+# Table myTablaDetalleVISUOE of a main page as an lxml element, or None. No BeautifulSoup
+# tree is built for the page: list_documents reads the table with XPath.
+@metrics.timed('parse_seconds', page='main_page', engine='lxml')
+def parse_document_table(content, link):
+    from bs4 import BeautifulSoup
+    from lxml import etree
+    import lxml_engine
+    try:
+        return lxml_engine.document_table(content)
+    except (etree.LxmlError, ValueError) as e:
+        logging.warning("Error with lxml on %s: %s. Using html.parser as fallback", link, e)
+        table = BeautifulSoup(content, 'html.parser').find('table', id=rules.DOCUMENT_TABLE_ID)
+        return lxml_engine.document_table(str(table)) if table else None
+
+def find_modification_header(mod_soup):
+    return mod_soup.find('h3', string=rules.MODIFICACION)
+
+# List the dated documents of table myTablaDetalleVISUOE on a main page
+@metrics.timed('extract_seconds', page='main_page')
+def list_documents(table, link):
+    import lxml_engine
+    if table is None:
+        logging.warning("Table myTablaDetalleVISUOE not found on %s", link)
+        return []
+    logging.debug("Table myTablaDetalleVISUOE found on %s", link)
+    documentos = []
+    for cells in lxml_engine.table_rows(table):
+        if len(cells) >= 2:
+            fecha_text = lxml_engine.get_text(cells[0])
+            documento_text = lxml_engine.get_text(cells[1])
+            if rules.FECHA_DOCUMENTO.match(fecha_text):
+                tipo = rules.classify_document(documento_text)
+                html_url = None
+                if tipo:
+                    href = lxml_engine.html_link(cells[1])
+                    if href is not None:
+                        html_url = urljoin(link, href)
+                documentos.append({'fecha': fecha_text, 'documento': documento_text, 'tipo': tipo, 'html_url': html_url})
+    return documentos
+
+# Load a Modificación/Adjudicación document from cache or network, parsed once
+def load_document_sync(html_url, tipo, timeout, conn):
+    import lxml_engine
+    kind = 'modification' if tipo == 'Modificación' else 'adjudication'
+    url_class = 'modificacion' if tipo == 'Modificación' else 'adjudicacion'
+    content = get_cached_content(conn, html_url)
+    if content:
+        logging.debug("Using cache for %s", html_url)
+    else:
+        logging.warning("Cache miss for %s page %s, fetching now", kind, html_url)
+        content = fetch_url_sync(html_url, timeout, conn, DOC_DOCUMENT, url_class=url_class)
+        if not content:
+            logging.error("Failed to fetch %s page %s", kind, html_url)
+            return {'error': f'Failed to fetch {kind} page'}
+    if tipo == 'Adjudicación' and PARSER_ENGINE == 'lxml':
+        return {'tree': lxml_engine.parse_document(content), 'content': content}
+    soup = parse_page(content, html_url)
+    if tipo == 'Modificación' and not find_modification_header(soup):
+        log_missing_modification_header(soup, content, html_url)
+        content = fetch_url_sync(html_url, timeout, conn, DOC_DOCUMENT, revalidate=False, url_class=url_class)
+        return reparse_modification(content, html_url)
+    return {'soup': soup, 'content': content}
+
+async def load_document_async(session, html_url, tipo, timeout, conn, inflight):
+    import lxml_engine
+    kind = 'modification' if tipo == 'Modificación' else 'adjudication'
+    url_class = 'modificacion' if tipo == 'Modificación' else 'adjudicacion'
+    content = await get_or_fetch_async(session, html_url, timeout, conn, inflight, DOC_DOCUMENT, url_class)
+    if not content:
+        logging.error("Failed to fetch %s page %s", kind, html_url)
+        return {'error': f'Failed to fetch {kind} page'}
+    if tipo == 'Adjudicación' and PARSER_ENGINE == 'lxml':
+        return {'tree': lxml_engine.parse_document(content), 'content': content}
+    soup = parse_page(content, html_url)
+    if tipo == 'Modificación' and not find_modification_header(soup):
+        log_missing_modification_header(soup, content, html_url)
+        content = await fetch_url_async(session, html_url, timeout, conn, DOC_DOCUMENT, revalidate=False, url_class=url_class)
+        return reparse_modification(content, html_url)
+    return {'soup': soup, 'content': content}
+
+def log_missing_modification_header(mod_soup, mod_content, html_url):
+    h3_tags = mod_soup.find_all('h3')
+    if h3_tags:
+        logging.warning("No <h3> matched 'Modificaci.*' on %s. Found %s <h3> tags with texts: %s", html_url, len(h3_tags), [h3.get_text(strip=True) for h3 in h3_tags])
+    else:
+        logging.warning("No <h3> tags found at all on %s", html_url)
+    logging.debug("HTML content (first 1000 chars) for %s: %s", html_url, mod_content[:1000])
+    logging.info("Forcing re-fetch of %s to bypass cache", html_url)
+
+def reparse_modification(mod_content, html_url):
+    if not mod_content:
+        logging.error("Failed to re-fetch modification page %s", html_url)
+        return {'error': 'Failed to re-fetch modification page'}
+    mod_soup = parse_page(mod_content, html_url)
+    if not find_modification_header(mod_soup):
+        logging.error("Still no <h3> matched 'Modificaci.*' after re-fetch on %s", html_url)
+        return {'error': 'No <h3> found after re-fetch'}
+    return {'soup': mod_soup, 'content': mod_content}
+
+# Extract the "Modificación del contrato" section of a modification document
+@metrics.timed('extract_seconds', page='modificacion')
+def extract_modification(mod_soup, html_url, prefix, link, identificador):
+    from bs4 import NavigableString
+    datos_mod = {}
+    h3_mod = find_modification_header(mod_soup)
+    ul_mod = h3_mod.find_next('ul')
+    if not ul_mod:
+        datos_mod[f"{prefix}/Error"] = 'No <ul> found'
+        logging.warning("No <ul> found on %s", html_url)
+        return datos_mod, None
+    logging.debug("Section Modificación del contrato found on %s", html_url)
+    mod_data = {'Link licitación': link, 'Identificador': identificador}
+    for li in ul_mod.find_all('li', recursive=False):
+        span = li.find('span')
+        if span:
+            span_text = span.get_text(strip=True)
+            next_text = ''
+            for sibling in span.next_siblings:
+                if isinstance(sibling, NavigableString):
+                    next_text += sibling.strip()
+                elif sibling.name == 'span':
+                    break
+            next_text = next_text.strip()
+            if next_text:
+                key = f"{prefix}/{span_text}"
+                datos_mod[key] = next_text
+                mod_data[span_text] = next_text
+                logging.debug("Column on %s: %s, Value: %s", html_url, key, next_text)
+            else:
+                logging.debug("No direct value found for span: %s on %s", span_text, html_url)
+            
+            nested_ul = li.find('ul')
+            if nested_ul:
+                logging.debug("Nested <ul> found under %s on %s", span_text, html_url)
+                for nested_li in nested_ul.find_all('li', recursive=False):
+                    nested_span = nested_li.find('span')
+                    nested_div = nested_li.find('div', class_='noremarca')
+                    if nested_span and nested_div:
+                        nested_span_text = nested_span.get_text(strip=True)
+                        nested_value = nested_div.get_text(strip=True)
+                        if nested_value:
+                            key = f"{prefix}/{nested_span_text}"
+                            datos_mod[key] = nested_value
+                            mod_data[nested_span_text] = nested_value
+                            logging.debug("Nested column on %s: %s, Value: %s", html_url, key, nested_value)
+                    elif nested_div:
+                        nested_value = nested_div.get_text(strip=True)
+                        if nested_value:
+                            key = f"{prefix}/{span_text}"
+                            datos_mod[key] = nested_value
+                            mod_data[span_text] = nested_value
+                            logging.debug("Nested column (no span) on %s: %s, Value: %s", html_url, key, nested_value)
+    if any(k in mod_data for k in ['Error']):
+        return datos_mod, None
+    return datos_mod, mod_data
+
+# Extract "Información Sobre las Ofertas" from an adjudication document
+@metrics.timed('extract_seconds', page='adjudicacion', engine='bs4')
+def extract_adjudication(adj_soup, adj_content, html_url, prefix, link, identificador):
+    from bs4 import NavigableString
+    datos_adjudicacion = {}
+    h5_ofertas = None
+    for tag in ['h5', 'h4', 'h3']:
+        h5_ofertas = adj_soup.find(tag, string=rules.CABECERA_OFERTAS)
+        if h5_ofertas:
+            h5_text = html.unescape(h5_ofertas.get_text(strip=True))
+            h5_text_normalized = rules.ESPACIOS.sub(' ', h5_text).strip()
+            logging.debug("Matched <%s> with text: '%s' on %s", tag, h5_text_normalized, html_url)
+            break
+    
+    if not h5_ofertas:
+        heading_tags = adj_soup.find_all(['h5', 'h4', 'h3'])
+        heading_texts = [html.unescape(h.get_text(strip=True)) for h in heading_tags]
+        if heading_tags:
+            logging.warning("No <h5/h4/h3> matched '(Informaci|Datos).*Oferta.*' on %s. Found %s heading tags with texts: %s", html_url, len(heading_tags), heading_texts)
+        else:
+            logging.warning("No <h5/h4/h3> tags found at all on %s", html_url)
+        logging.debug("HTML content (first 2000 chars) for %s: %s", html_url, adj_content[:2000])
+        if 'Informaci' in adj_content or 'Oferta' in adj_content:
+            logging.info("Raw HTML contains 'Informaci' or 'Oferta', indicating possible parsing issue on %s", html_url)
+    
+    parent_container = None
+    if h5_ofertas:
+        parent_container = h5_ofertas.find_parent('div', class_='boxWithBackground')
+        if not parent_container:
+            parent_container = h5_ofertas.find_parent('div')
+            logging.info("No <div class='boxWithBackground'> parent found for <%s> on %s, using nearest <div>", h5_ofertas.name, html_url)
+    else:
+        parent_container = adj_soup.find('div', class_='boxWithBackground')
+        if parent_container:
+            logging.info("No <h5/h4/h3> found, but located <div class='boxWithBackground'> on %s", html_url)
+        else:
+            parent_container = adj_soup.find('body')
+            logging.info("No <div class='boxWithBackground'> found, falling back to <body> on %s", html_url)
+    
+    adj_data = {'Link licitación': link, 'Identificador': identificador}
+    data_found = False
+    
+    for col_class in ['leftCol', 'rigCol','leftCo1', 'rigCo1']:
+        col_div = parent_container.find('div', class_=col_class)
+        if col_div:
+            logging.debug("Found <div class='%s'> on %s", col_class, html_url)
+            ul_elements = col_div.find_all('ul', recursive=False)
+            for ul in ul_elements:
+                logging.debug("Processing <ul> in <div class='%s'> on %s", col_class, html_url)
+                for li in ul.find_all('li', recursive=False):
+                    span = li.find('span')
+                    if span:
+                        span_text = span.get_text(strip=True)
+                        value = None
+                        for sibling in span.next_siblings:
+                            if isinstance(sibling, NavigableString):
+                                text_value = sibling.strip()
+                                if text_value and text_value != '== $0':
+                                    value = text_value
+                                    logging.debug("Found value as plain text for span '%s' in %s on %s: %s", span_text, col_class, html_url, value)
+                                    break
+                            elif sibling.name == 'div' and 'noremarca' in sibling.get('class', []):
+                                value = sibling.get_text(strip=True)
+                                logging.debug("Found value in <div class='noremarca'> for span '%s' in %s on %s: %s", span_text, col_class, html_url, value)
+                                break
+                            elif sibling.name == 'span':
+                                value = sibling.get_text(strip=True)
+                                logging.debug("Found value in <span> for span '%s' in %s on %s: %s", span_text, col_class, html_url, value)
+                                break
+                        if value:
+                            key = f"{prefix}/{span_text}"
+                            datos_adjudicacion[key] = value
+                            adj_data[span_text] = value
+                            logging.debug("Column in %s on %s: %s, Value: %s", col_class, html_url, key, value)
+                            data_found = True
+                        else:
+                            logging.debug("No value found for span '%s' in %s on %s", span_text, col_class, html_url)
+                        
+                        nested_ul = li.find('ul')
+                        if nested_ul:
+                            logging.debug("Nested <ul> found under %s in %s on %s", span_text, col_class, html_url)
+                            for nested_li in nested_ul.find_all('li', recursive=False):
+                                nested_span = nested_li.find('span')
+                                nested_div = nested_li.find('div', class_='noremarca')
+                                if nested_span and nested_div:
+                                    nested_span_text = nested_span.get_text(strip=True)
+                                    nested_value = nested_div.get_text(strip=True)
+                                    if nested_value:
+                                        key = f"{prefix}/{nested_span_text}"
+                                        datos_adjudicacion[key] = nested_value
+                                        adj_data[nested_span_text] = nested_value
+                                        logging.debug("Nested column in %s on %s: %s, Value: %s", col_class, html_url, key, nested_value)
+                                        data_found = True
+                                elif nested_div:
+                                    nested_value = nested_div.get_text(strip=True)
+                                    if nested_value:
+                                        key = f"{prefix}/{span_text}"
+                                        datos_adjudicacion[key] = nested_value
+                                        adj_data[span_text] = nested_value
+                                        logging.debug("Nested column (no span) in %s on %s: %s, Value: %s", col_class, html_url, key, nested_value)
+                                        data_found = True
+        else:
+            logging.debug("No <div class='%s'> found in parent container on %s", col_class, html_url)
+    
+    if data_found and not any(k in adj_data for k in ['Error']):
+        return datos_adjudicacion, adj_data
+    if not data_found:
+        datos_adjudicacion[f"{prefix}/Error"] = 'No data found in leftCol or rigCol'
+        logging.warning("No data found in <div class='leftCol'> or <div class='rigCol'> on %s", html_url)
+    if not h5_ofertas:
+        datos_adjudicacion[f"{prefix}/Error"] = datos_adjudicacion.get(f"{prefix}/Error", '') + '; No <h5/h4/h3> found for Información Sobre las Ofertas'
+    return datos_adjudicacion, None
+
+# Build the result row of a tender from its document list and loaded documents.
+# Modification/adjudication rows are appended to tender_mods/tender_adjs as found.
+def build_result(identificador, link, documentos, cargados, tender_mods, tender_adjs):
+    import lxml_engine
+    datos_mod = {}
+    datos_adjudicacion = {}
+    fechas_por_documento = {}
+    modificado = 'No'
+    mod_num = 0
+    adj_num = 0
+    
+    for doc in documentos:
+        fecha_text = doc['fecha']
+        tipo = doc['tipo']
+        html_url = doc['html_url']
+        if tipo == 'Modificación':
+            modificado = 'Sí'
+            mod_num += 1
+            prefix = f"Mod {mod_num}"
+        elif tipo == 'Adjudicación':
+            adj_num += 1
+            prefix = f"Adj {adj_num}"
+        documento_text = tipo or doc['documento']
+        fechas_por_documento.setdefault(documento_text, []).append(fecha_text)
+        logging.debug("Date found on %s: %s, Document: %s", link, fecha_text, documento_text)
+        if not tipo:
+            continue
+        
+        datos = datos_mod if tipo == 'Modificación' else datos_adjudicacion
+        if not html_url:
+            kind = 'modification' if tipo == 'Modificación' else 'adjudication'
+            datos[f"{prefix}/Error"] = 'Html link not found'
+            logging.warning("Html link not found for %s %s on %s", kind, mod_num if tipo == 'Modificación' else adj_num, link)
+            continue
+        cargado = cargados[html_url]
+        if 'error' in cargado:
+            datos[f"{prefix}/Error"] = cargado['error']
+            continue
+        if tipo == 'Modificación':
+            datos_doc, mod_data = extract_modification(cargado['soup'], html_url, prefix, link, identificador)
+            if mod_data:
+                tender_mods.append(mod_data)
+                logging.debug("Added modification data for %s to modificaciones list", link)
+        else:
+            if 'tree' in cargado:
+                datos_doc, adj_data = lxml_engine.extract_adjudication(cargado['tree'], cargado['content'], html_url, prefix, link, identificador)
+            else:
+                datos_doc, adj_data = extract_adjudication(cargado['soup'], cargado['content'], html_url, prefix, link, identificador)
+            if adj_data:
+                tender_adjs.append(adj_data)
+                logging.debug("Added adjudication data for %s to adjudicaciones list", link)
+        datos.update(datos_doc)
+    
+    resultado = {
+        'Identificador': identificador,
+        'Link licitación': link,
+        'Modificado': modificado
+    }
+    resultado.update(datos_mod)
+    resultado.update(datos_adjudicacion)
+    logging.info("Processed %s: %s documents, %s modification and %s adjudication fields, %s errors",
+                 link, len(documentos), len(datos_mod), len(datos_adjudicacion),
+                 sum(key.endswith('/Error') for key in resultado))
+    
+    for doc, fechas in fechas_por_documento.items():
+        col_name = f"Fecha {doc}"
+        resultado[col_name] = ', '.join(fechas) if fechas else ''
+        if fechas:
+            logging.debug("Dates for %s on %s: %s", doc, link, fechas)
+    
+    return resultado
+
+def error_result(identificador, link, modificado):
+    return {
+        'Identificador': identificador,
+        'Link licitación': link,
+        'Modificado': modificado
+    }
+
+# Process a single tender synchronously, reading pages from the cache
+def process_tender_sync(row, timeout, conn):
+    import requests
     link = row[1]  # Link licitación
     identificador = row[0]  # Identificador
     
-    logging.info(f"Processing link (sync): {link}")
+    logging.debug("Processing link (sync): %s", link)
     
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    tender_mods = []
+    tender_adjs = []
     try:
         cached_content = get_cached_content(conn, link)
         if cached_content:
-            logging.info(f"Using cache for {link}")
+            logging.debug("Using cache for %s", link)
             content = cached_content
         else:
-            logging.warning(f"Cache miss for main page {link}, fetching now")
-            content = fetch_url_sync(link, timeout, conn)
+            logging.warning("Cache miss for main page %s, fetching now", link)
+            content = fetch_url_sync(link, timeout, conn, DOC_TENDER)
             if not content:
-                logging.error(f"Failed to fetch main page {link}")
-                return {
-                    'Identificador': identificador,
-                    'Link licitación': link,
-                    'Modificado': 'Error - Failed to fetch main page'
-                }
-        
-        try:
-            soup = BeautifulSoup(content, 'lxml', from_encoding='utf-8')
-        except Exception as e:
-            logging.warning(f"Error with lxml on {link}: {e}. Using html.parser as fallback")
-            soup = BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
-        
-        datos_mod = {}
-        datos_adjudicacion = {}
-        fechas_por_documento = {}
-        
-        texto_pagina = soup.get_text(strip=True)
-        modificado = 'No'
-        
-        table = soup.find('table', id='myTablaDetalleVISUOE')
-        if table:
-            logging.info(f"Table myTablaDetalleVISUOE found on {link}")
-            rows = table.find_all('tr')
-            mod_num = 0
-            adj_num = 0
-            for r in rows:
-                cells = r.find_all('td')
-                if len(cells) >= 2:
-                    fecha_text = cells[0].get_text(strip=True)
-                    documento_text = cells[1].get_text(strip=True)
-                    if re.match(r'(\d{2}/\d{2}/\d{4}\s*\d{2}:\d{2}(:\d{2})?)|(\d{2}/\d{2}/\d{4})', fecha_text):
-                        if re.search(r'Modificaci', documento_text, re.IGNORECASE):
-                            modificado = 'Sí'
-                            mod_num += 1
-                            prefix = f"Mod {mod_num}"
-                            documento_text = 'Modificación'
-                            fechas_por_documento[documento_text] = fechas_por_documento.get(documento_text, []) + [fecha_text]
-                            logging.info(f"Date found on {link}: {fecha_text}, Document: {documento_text}")
-                            
-                            html_link = cells[1].find_next('td').find('a', 
-                                attrs={'title': 'Este documento se abrirá en una nueva ventana', 'target': '_blank'},
-                                string='Html'
-                            )
-                            if html_link and 'href' in html_link.attrs:
-                                html_url = urljoin(link, html_link['href'])
-                                logging.info(f"Accessing modification link (sync): {html_url}")
-                                
-                                cached_mod_content = get_cached_content(conn, html_url)
-                                if cached_mod_content:
-                                    logging.info(f"Using cache for {html_url}")
-                                    mod_content = cached_mod_content
-                                else:
-                                    logging.warning(f"Cache miss for modification page {html_url}, fetching now")
-                                    mod_content = fetch_url_sync(html_url, timeout, conn)
-                                    if not mod_content:
-                                        logging.error(f"Failed to fetch modification page {html_url}")
-                                        datos_mod[f"{prefix}/Error"] = 'Failed to fetch modification page'
-                                        continue
-                                
-                                if mod_content:
-                                    try:
-                                        mod_soup = BeautifulSoup(mod_content, 'lxml', from_encoding='utf-8')
-                                    except Exception as e:
-                                        logging.warning(f"Error with lxml on {html_url}: {e}. Falling back to html.parser")
-                                        mod_soup = BeautifulSoup(mod_content, 'html.parser', from_encoding='utf-8')
-                                    
-                                    h3_mod = mod_soup.find('h3', string=re.compile('Modificaci.*', re.IGNORECASE))
-                                    if not h3_mod:
-                                        h3_tags = mod_soup.find_all('h3')
-                                        if h3_tags:
-                                            logging.warning(f"No <h3> matched 'Modificaci.*' on {html_url}. Found {len(h3_tags)} <h3> tags with texts: {[h3.get_text(strip=True) for h3 in h3_tags]}")
-                                        else:
-                                            logging.warning(f"No <h3> tags found at all on {html_url}")
-                                        logging.debug(f"HTML content (first 1000 chars) for {html_url}: {mod_content[:1000]}")
-                                        logging.info(f"Forcing re-fetch of {html_url} to bypass cache")
-                                        mod_content = fetch_url_sync(html_url, timeout, conn)
-                                        if not mod_content:
-                                            logging.error(f"Failed to re-fetch modification page {html_url}")
-                                            datos_mod[f"{prefix}/Error"] = 'Failed to re-fetch modification page'
-                                            continue
-                                        try:
-                                            mod_soup = BeautifulSoup(mod_content, 'lxml', from_encoding='utf-8')
-                                        except Exception as e:
-                                            logging.warning(f"Error with lxml on re-fetch {html_url}: {e}. Using html.parser")
-                                            mod_soup = BeautifulSoup(mod_content, 'html.parser', from_encoding='utf-8')
-                                        h3_mod = mod_soup.find('h3', string=re.compile('Modificaci.*', re.IGNORECASE))
-                                        if not h3_mod:
-                                            logging.error(f"Still no <h3> matched 'Modificaci.*' after re-fetch on {html_url}")
-                                            datos_mod[f"{prefix}/Error"] = 'No <h3> found after re-fetch'
-                                            continue
-                                    
-                                    ul_mod = h3_mod.find_next('ul')
-                                    if ul_mod:
-                                        logging.info(f"Section Modificación del contrato found on {html_url}")
-                                        mod_data = {'Link licitación': link, 'Identificador': identificador}
-                                        for li in ul_mod.find_all('li', recursive=False):
-                                            span = li.find('span')
-                                            if span:
-                                                span_text = span.get_text(strip=True)
-                                                next_text = ''
-                                                for sibling in span.next_siblings:
-                                                    if isinstance(sibling, NavigableString):
-                                                        next_text += sibling.strip()
-                                                    elif sibling.name == 'span':
-                                                        break
-                                                next_text = next_text.strip()
-                                                if next_text:
-                                                    key = f"{prefix}/{span_text}"
-                                                    datos_mod[key] = next_text
-                                                    mod_data[span_text] = next_text
-                                                    logging.info(f"Column on {html_url}: {key}, Value: {next_text}")
-                                                else:
-                                                    logging.warning(f"No direct value found for span: {span_text} on {html_url}")
-                                                
-                                                nested_ul = li.find('ul')
-                                                if nested_ul:
-                                                    logging.info(f"Nested <ul> found under {span_text} on {html_url}")
-                                                    for nested_li in nested_ul.find_all('li', recursive=False):
-                                                        nested_span = nested_li.find('span')
-                                                        nested_div = nested_li.find('div', class_='noremarca')
-                                                        if nested_span and nested_div:
-                                                            nested_span_text = nested_span.get_text(strip=True)
-                                                            nested_value = nested_div.get_text(strip=True)
-                                                            if nested_value:
-                                                                key = f"{prefix}/{nested_span_text}"
-                                                                datos_mod[key] = nested_value
-                                                                mod_data[nested_span_text] = nested_value
-                                                                logging.info(f"Nested column on {html_url}: {key}, Value: {nested_value}")
-                                                        elif nested_div:
-                                                            nested_value = nested_div.get_text(strip=True)
-                                                            if nested_value:
-                                                                key = f"{prefix}/{span_text}"
-                                                                datos_mod[key] = nested_value
-                                                                mod_data[span_text] = nested_value
-                                                                logging.info(f"Nested column (no span) on {html_url}: {key}, Value: {nested_value}")
-                                        if not any(k in mod_data for k in ['Error']):
-                                            modificaciones.append(mod_data)
-                                            logging.info(f"Added modification data for {link} to modificaciones list")
-                                    else:
-                                        datos_mod[f"{prefix}/Error"] = 'No <ul> found'
-                                        logging.warning(f"No <ul> found on {html_url}")
-                            else:
-                                datos_mod[f"{prefix}/Error"] = 'Html link not found'
-                                logging.warning(f"Html link not found for modification {mod_num} on {link}")
-                        
-                        elif re.search(r'Adjudicaci', documento_text, re.IGNORECASE):
-                            adj_num += 1
-                            prefix = f"Adj {adj_num}"
-                            documento_text = 'Adjudicación'
-                            fechas_por_documento[documento_text] = fechas_por_documento.get(documento_text, []) + [fecha_text]
-                            logging.info(f"Date found on {link}: {fecha_text}, Document: {documento_text}")
-                            
-                            html_link = cells[1].find_next('td').find('a', 
-                                attrs={'title': 'Este documento se abrirá en una nueva ventana', 'target': '_blank'},
-                                string='Html'
-                            )
-                            if html_link and 'href' in html_link.attrs:
-                                html_url = urljoin(link, html_link['href'])
-                                logging.info(f"Accessing adjudication link (sync): {html_url}")
-                                
-                                cached_adj_content = get_cached_content(conn, html_url)
-                                if cached_adj_content:
-                                    logging.info(f"Using cache for {html_url}")
-                                    adj_content = cached_adj_content
-                                else:
-                                    logging.warning(f"Cache miss for adjudication page {html_url}, fetching now")
-                                    adj_content = fetch_url_sync(html_url, timeout, conn)
-                                    if not adj_content:
-                                        logging.error(f"Failed to fetch adjudication page {html_url}")
-                                        datos_adjudicacion[f"{prefix}/Error"] = 'Failed to fetch adjudication page'
-                                        continue
-                                
-                                if adj_content:
-                                    try:
-                                        adj_soup = BeautifulSoup(adj_content, 'lxml', from_encoding='utf-8')
-                                    except Exception as e:
-                                        logging.warning(f"Error with lxml on {html_url}: {e}. Falling back to html.parser")
-                                        adj_soup = BeautifulSoup(adj_content, 'html.parser', from_encoding='utf-8')
-                                    
-                                    h5_ofertas = None
-                                    for tag in ['h5', 'h4', 'h3']:
-                                        h5_ofertas = adj_soup.find(tag, string=re.compile(r'(Informaci|Datos).*Oferta.*', re.IGNORECASE))
-                                        if h5_ofertas:
-                                            h5_text = html.unescape(h5_ofertas.get_text(strip=True))
-                                            h5_text_normalized = re.sub(r'[\s\xa0]+', ' ', h5_text).strip()
-                                            logging.info(f"Matched <{tag}> with text: '{h5_text_normalized}' on {html_url}")
-                                            break
-                                    
-                                    if not h5_ofertas:
-                                        heading_tags = adj_soup.find_all(['h5', 'h4', 'h3'])
-                                        heading_texts = [html.unescape(h.get_text(strip=True)) for h in heading_tags]
-                                        if heading_tags:
-                                            logging.warning(f"No <h5/h4/h3> matched '(Informaci|Datos).*Oferta.*' on {html_url}. Found {len(heading_tags)} heading tags with texts: {heading_texts}")
-                                        else:
-                                            logging.warning(f"No <h5/h4/h3> tags found at all on {html_url}")
-                                        logging.debug(f"HTML content (first 2000 chars) for {html_url}: {adj_content[:2000]}")
-                                        if 'Informaci' in adj_content or 'Oferta' in adj_content:
-                                            logging.info(f"Raw HTML contains 'Informaci' or 'Oferta', indicating possible parsing issue on {html_url}")
-                                    
-                                    parent_container = None
-                                    if h5_ofertas:
-                                        parent_container = h5_ofertas.find_parent('div', class_='boxWithBackground')
-                                        if not parent_container:
-                                            parent_container = h5_ofertas.find_parent('div')
-                                            logging.info(f"No <div class='boxWithBackground'> parent found for <{h5_ofertas.name}> on {html_url}, using nearest <div>")
-                                    else:
-                                        parent_container = adj_soup.find('div', class_='boxWithBackground')
-                                        if parent_container:
-                                            logging.info(f"No <h5/h4/h3> found, but located <div class='boxWithBackground'> on {html_url}")
-                                        else:
-                                            parent_container = adj_soup.find('body')
-                                            logging.info(f"No <div class='boxWithBackground'> found, falling back to <body> on {html_url}")
-                                    
-                                    adj_data = {'Link licitación': link, 'Identificador': identificador}
-                                    data_found = False
-                                    
-                                    for col_class in ['leftCol', 'rigCol','leftCo1', 'rigCo1']:
-                                        col_div = parent_container.find('div', class_=col_class)
-                                        if col_div:
-                                            logging.info(f"Found <div class='{col_class}'> on {html_url}")
-                                            ul_elements = col_div.find_all('ul', recursive=False)
-                                            for ul in ul_elements:
-                                                logging.info(f"Processing <ul> in <div class='{col_class}'> on {html_url}")
-                                                for li in ul.find_all('li', recursive=False):
-                                                    span = li.find('span')
-                                                    if span:
-                                                        span_text = span.get_text(strip=True)
-                                                        value = None
-                                                        for sibling in span.next_siblings:
-                                                            if isinstance(sibling, NavigableString):
-                                                                text_value = sibling.strip()
-                                                                if text_value and text_value != '== $0':
-                                                                    value = text_value
-                                                                    logging.info(f"Found value as plain text for span '{span_text}' in {col_class} on {html_url}: {value}")
-                                                                    break
-                                                            elif sibling.name == 'div' and 'noremarca' in sibling.get('class', []):
-                                                                value = sibling.get_text(strip=True)
-                                                                logging.info(f"Found value in <div class='noremarca'> for span '{span_text}' in {col_class} on {html_url}: {value}")
-                                                                break
-                                                            elif sibling.name == 'span':
-                                                                value = sibling.get_text(strip=True)
-                                                                logging.info(f"Found value in <span> for span '{span_text}' in {col_class} on {html_url}: {value}")
-                                                                break
-                                                        if value:
-                                                            key = f"{prefix}/{span_text}"
-                                                            datos_adjudicacion[key] = value
-                                                            adj_data[span_text] = value
-                                                            logging.info(f"Column in {col_class} on {html_url}: {key}, Value: {value}")
-                                                            data_found = True
-                                                        else:
-                                                            logging.warning(f"No value found for span '{span_text}' in {col_class} on {html_url}")
-                                                        
-                                                        nested_ul = li.find('ul')
-                                                        if nested_ul:
-                                                            logging.info(f"Nested <ul> found under {span_text} in {col_class} on {html_url}")
-                                                            for nested_li in nested_ul.find_all('li', recursive=False):
-                                                                nested_span = nested_li.find('span')
-                                                                nested_div = nested_li.find('div', class_='noremarca')
-                                                                if nested_span and nested_div:
-                                                                    nested_span_text = nested_span.get_text(strip=True)
-                                                                    nested_value = nested_div.get_text(strip=True)
-                                                                    if nested_value:
-                                                                        key = f"{prefix}/{nested_span_text}"
-                                                                        datos_adjudicacion[key] = nested_value
-                                                                        adj_data[nested_span_text] = nested_value
-                                                                        logging.info(f"Nested column in {col_class} on {html_url}: {key}, Value: {nested_value}")
-                                                                        data_found = True
-                                                                elif nested_div:
-                                                                    nested_value = nested_div.get_text(strip=True)
-                                                                    if nested_value:
-                                                                        key = f"{prefix}/{span_text}"
-                                                                        datos_adjudicacion[key] = nested_value
-                                                                        adj_data[span_text] = nested_value
-                                                                        logging.info(f"Nested column (no span) in {col_class} on {html_url}: {key}, Value: {nested_value}")
-                                                                        data_found = True
-                                        else:
-                                            logging.warning(f"No <div class='{col_class}'> found in parent container on {html_url}")
-                                    
-                                    if data_found and not any(k in adj_data for k in ['Error']):
-                                        adjudicaciones.append(adj_data)
-                                        logging.info(f"Added adjudication data for {link} to adjudicaciones list")
-                                    else:
-                                        if not data_found:
-                                            datos_adjudicacion[f"{prefix}/Error"] = 'No data found in leftCol or rigCol'
-                                            logging.warning(f"No data found in <div class='leftCol'> or <div class='rigCol'> on {html_url}")
-                                        if not h5_ofertas:
-                                            datos_adjudicacion[f"{prefix}/Error"] = datos_adjudicacion.get(f"{prefix}/Error", '') + '; No <h5/h4/h3> found for Información Sobre las Ofertas'
-                            else:
-                                datos_adjudicacion[f"{prefix}/Error"] = 'Html link not found'
-                                logging.warning(f"Html link not found for adjudication {adj_num} on {link}")
-                        else:
-                            if documento_text not in fechas_por_documento:
-                                fechas_por_documento[documento_text] = []
-                            fechas_por_documento[documento_text].append(fecha_text)
-                            logging.info(f"Date found on {link}: {fecha_text}, Document: {documento_text}")
-        else:
-            logging.warning(f"Table myTablaDetalleVISUOE not found on {link}")
+                logging.error("Failed to fetch main page %s", link)
+                return error_result(identificador, link, 'Error - Failed to fetch main page'), tender_mods, tender_adjs
         
-        resultado = {
-            'Identificador': identificador,
-            'Link licitación': link,
-            'Modificado': modificado
-        }
-        resultado.update(datos_mod)
-        resultado.update(datos_adjudicacion)
-        
-        for doc, fechas in fechas_por_documento.items():
-            col_name = f"Fecha {doc}"
-            resultado[col_name] = ', '.join(fechas) if fechas else ''
-            if fechas:
-                logging.info(f"Dates for {doc} on {link}: {fechas}")
-        
-        return resultado
-    
+        documentos = list_documents(parse_document_table(content, link), link)
+        cargados = {}
+        for doc in documentos:
+            if doc['html_url'] and doc['html_url'] not in cargados:
+                logging.debug("Accessing %s link (sync): %s", doc['tipo'], doc['html_url'])
+                cargados[doc['html_url']] = load_document_sync(doc['html_url'], doc['tipo'], timeout, conn)
+        resultado = build_result(identificador, link, documentos, cargados, tender_mods, tender_adjs)
     except requests.exceptions.SSLError as e:
-        logging.error(f"SSL error on {link}: {e}")
-        return {
-            'Identificador': identificador,
-            'Link licitación': link,
-            'Modificado': 'Error - SSL Verification Failed'
-        }
+        logging.error("SSL error on %s: %s", link, e)
+        resultado = error_result(identificador, link, 'Error - SSL Verification Failed')
     except requests.exceptions.RequestException as e:
-        logging.error(f"Request error on {link}: {e}")
-        return {
-            'Identificador': identificador,
-            'Link licitación': link,
-            'Modificado': 'Error'
-        }
+        logging.error("Request error on %s: %s", link, e)
+        resultado = error_result(identificador, link, 'Error')
+    except Exception as e:
+        logging.error("Unexpected error processing %s: %s", link, e)
+        resultado = error_result(identificador, link, f'Error - {str(e)}')
+    return resultado, tender_mods, tender_adjs
+
+# Process a single row
+def process_row_sync(row, timeout, conn):
+    resultado, tender_mods, tender_adjs = process_tender_sync(row, timeout, conn)
+    modificaciones.extend(tender_mods)
+    adjudicaciones.extend(tender_adjs)
+    return resultado
+
+# Read a URL from the cache or fetch it, sharing in-flight downloads between tenders
+async def get_or_fetch_async(session, url, timeout, conn, inflight, doc_class=None, url_class=None):
+    content = get_cached_content(conn, url)
+    if content:
+        return content
+    task = inflight.get(url)
+    if task is None:
+        task = asyncio.ensure_future(fetch_url_async(session, url, timeout, conn, doc_class, url_class=url_class))
+        inflight[url] = task
+        task.add_done_callback(lambda _: inflight.pop(url, None))
+    return await task
+
+# Process a single tender in the async pipeline: each page is fetched and parsed once
+async def process_tender_async(session, row, timeout, conn, inflight):
+    link = row[1]  # Link licitación
+    identificador = row[0]  # Identificador
+    
+    logging.debug("Processing link (async): %s", link)
+    
+    tender_mods = []
+    tender_adjs = []
+    try:
+        content = await get_or_fetch_async(session, link, timeout, conn, inflight, DOC_TENDER)
+        if not content:
+            logging.error("Failed to fetch main page %s", link)
+            return error_result(identificador, link, 'Error - Failed to fetch main page'), tender_mods, tender_adjs
+        
+        documentos = list_documents(parse_document_table(content, link), link)
+        urls = {}
+        for doc in documentos:
+            if doc['html_url']:
+                urls.setdefault(doc['html_url'], doc['tipo'])
+        cargados = await asyncio.gather(*(
+            load_document_async(session, html_url, tipo, timeout, conn, inflight)
+            for html_url, tipo in urls.items()
+        ))
+        resultado = build_result(identificador, link, documentos, dict(zip(urls, cargados)), tender_mods, tender_adjs)
     except Exception as e:
-        logging.error(f"Unexpected error processing {link}: {e}")
-        return {
-            'Identificador': identificador,
-            'Link licitación': link,
-            'Modificado': f'Error - {str(e)}'
-        }
-
-# Main function
-def main():
-    global cache_hits, cache_misses, retry_count, modificaciones, adjudicaciones, failed_urls
+        logging.error("Unexpected error processing %s: %s", link, e)
+        resultado = error_result(identificador, link, f'Error - {str(e)}')
+    return resultado, tender_mods, tender_adjs
+
+# Fetch, parse and extract all tenders concurrently. Results are returned in input order,
+# or handed to on_result(i, row, procesado) as soon as each tender is done.
+async def run_pipeline(rows, timeout, conn, concurrency=CONCURRENCY, rps=REQUESTS_PER_SECOND, on_result=None):
+    from tqdm import tqdm
+    resultados = [None] * len(rows)
+    inflight = {}
+    queue = asyncio.Queue()
+    for i, row in enumerate(rows):
+        queue.put_nowait((i, row))
+    
+    async with make_session(concurrency, rps) as session:
+        with tqdm(total=len(rows), desc="Processing tenders") as progress:
+            async def worker():
+                while True:
+                    try:
+                        i, row = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    procesado = await process_tender_async(session, row, timeout, conn, inflight)
+                    if on_result:
+                        on_result(i, row, procesado)
+                    else:
+                        resultados[i] = procesado
+                    logging.debug("Completed row %s: %s", i + 1, row[1])
+                    progress.update(1)
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    
+    return resultados
+
+# For --incremental: among the tenders completed in earlier runs, keep those whose Estado
+# is unchanged and whose document table has the same number of rows as when crawled
+def select_unchanged(rows, completed, estados, snapshot, timeout, conn, concurrency=CONCURRENCY, rps=REQUESTS_PER_SECOND):
+    candidates = []
+    for identificador, link in rows:
+        key = crawl_state.tender_key(identificador)
+        if key not in completed:
+            continue
+        estado, documentos = snapshot[key]
+        if estados and estados.get(key) != estado:
+            logging.info("Estado of %s changed from %s to %s", identificador, estado, estados.get(key))
+            continue
+        candidates.append((key, link, documentos))
+    unchanged = asyncio.run(check_document_tables(candidates, timeout, conn, concurrency, rps))
+    return unchanged
+
+async def check_document_tables(candidates, timeout, conn, concurrency=CONCURRENCY, rps=REQUESTS_PER_SECOND):
+    from tqdm import tqdm
+    links = list({link for _, link, _ in candidates})
+    async with make_session(concurrency, rps) as session:
+        pending = [link for link in links if not get_cached_content(conn, link)]
+        await fetch_all(session, pending, timeout, conn, DOC_TENDER, concurrency, "Checking tender pages")
+    unchanged = set()
+    for key, link, documentos in tqdm(candidates, desc="Comparing document tables"):
+        content = get_cached_content(conn, link)
+        if not content:
+            continue
+        count = len(list_documents(parse_document_table(content, link), link))
+        if count == documentos:
+            unchanged.add(key)
+        else:
+            logging.info("Document table of %s changed from %s to %s rows", link, documentos, count)
+    return unchanged
+
+# Cache connection of a --workers process, opened once per worker
+worker_conn = None
+
+def init_worker(cache_ttl=None, parser_engine=None, log_queue=None, log_level=logging.INFO):
+    global worker_conn, PARSER_ENGINE
+    log_config.init_worker_logging(log_queue, log_level)
+    if cache_ttl is not None:
+        url_cache.CACHE_TTL = cache_ttl
+    if parser_engine is not None:
+        PARSER_ENGINE = parser_engine
+    http_client.close_sync_session()
+    metrics.reset()
+    worker_conn = setup_cache()
+
+# Process one row in a worker and return plain dicts plus the worker's counters for it
+def process_row_worker(row, timeout):
+    url_cache.reset_stats()
+    http_client.reset_stats()
+    metrics.reset()
+    resultado, tender_mods, tender_adjs = process_tender_sync(row, timeout, worker_conn)
+    flush_cache(worker_conn)
+    stats = {'cache': dict(url_cache.stats), 'http': dict(http_client.stats), 'failed_urls': list(http_client.failed_urls),
+             'metrics': metrics.snapshot()}
+    return resultado, tender_mods, tender_adjs, stats
+
+# Process cached rows on a process pool; results come back in input order,
+# or are handed to on_result(i, row, procesado) one by one
+def run_workers(rows, timeout, workers, on_result=None):
+    from tqdm import tqdm
+    procesados = []
+    chunksize = max(1, min(50, len(rows) // (workers * 4)))
+    with log_config.worker_queue() as log_queue, \
+         ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(url_cache.CACHE_TTL, PARSER_ENGINE, log_queue, logging.getLogger().level)) as executor:
+        results = executor.map(partial(process_row_worker, timeout=timeout), rows, chunksize=chunksize)
+        for i, (resultado, tender_mods, tender_adjs, stats) in enumerate(tqdm(results, total=len(rows), desc="Processing rows")):
+            if on_result:
+                on_result(i, rows[i], (resultado, tender_mods, tender_adjs))
+            else:
+                procesados.append((resultado, tender_mods, tender_adjs))
+            url_cache.merge_stats(stats['cache'])
+            http_client.merge_stats(stats['http'], stats['failed_urls'])
+            metrics.merge(stats['metrics'])
+    return procesados
+
+# --shard i/N: deterministic partition of the tenders by a hash of their Identificador,
+# so several nodes can share licitaciones.db without coordinating
+def parse_shard(value):
+    try:
+        shard, shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/N")
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', i must be between 1 and N")
+    return shard, shards
+
+def in_shard(identificador, shard, shards):
+    digest = hashlib.sha1(crawl_state.tender_key(identificador).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards == shard - 1
+
+# Output workbook of a run; each shard gets its own unless --output is given
+def output_path(args):
+    if args.output:
+        return args.output
+    if args.shard:
+        return f"resultados_licitaciones_shard{args.shard[0]}of{args.shard[1]}.xlsx"
+    return 'resultados_licitaciones.xlsx'
+
+# Merge per-shard workbooks, ordering rows as they appear in licitaciones.db when it is available
+def merge_shards(args):
+    order = None
+    if os.path.exists('licitaciones.db'):
+        conn = sqlite3.connect('licitaciones.db')
+        order = {}
+        for position, (identificador,) in enumerate(conn.execute("SELECT Identificador FROM licitaciones ORDER BY rowid")):
+            order.setdefault(crawl_state.tender_key(identificador), []).append(position)
+        conn.close()
+    output_file = args.output or 'resultados_licitaciones.xlsx'
+    written, counts = merge_workbooks(args.files, output_file, args.formats, order)
+    logging.info("Merged %s workbooks into %s with %s rows", len(args.files), ', '.join(written), counts[0])
+    print(f"Merged {len(args.files)} workbooks into {', '.join(written)} with {counts[0]} rows")
+    return written
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Extract modification and adjudication data for the tenders in licitaciones.db")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Parse rows on N processes after pre-fetching all pages (default: 1, async pipeline)")
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help="HTTP timeout in seconds")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="Maximum number of requests in flight (default: %(default)s)")
+    parser.add_argument('--rps', type=float, default=REQUESTS_PER_SECOND,
+                        help="Average requests per second to the portal; 0 disables the limit (default: %(default)s)")
+    parser.add_argument('--cache-ttl', type=float, default=url_cache.CACHE_TTL / 3600,
+                        help="Hours before a cached tender page is fetched again; 0 keeps it forever (default: %(default)s)")
+    parser.add_argument('--cache-max-mb', type=float, default=url_cache.CACHE_MAX_BYTES / 1024 / 1024,
+                        help="Evict least recently used pages above this cache size; 0 disables eviction (default: %(default)s)")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Skip tenders completed in earlier runs according to {crawl_state.STATE_FILE}")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Like --resume, but also re-crawl completed tenders whose Estado changed or whose "
+                             "document table gained rows (tender pages older than --cache-ttl are re-fetched)")
+    parser.add_argument('--formats', type=parse_formats, default='xlsx',
+                        help="Comma-separated output formats among xlsx, csv and parquet (default: %(default)s)")
+    parser.add_argument('--offset', type=int, default=0, help="Skip the first N rows of licitaciones")
+    parser.add_argument('--limit', type=int, default=None, help="Process at most N rows of licitaciones")
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help="Process only shard i of N (1 <= i <= N), partitioned by Identificador")
+    parser.add_argument('--output', default=None,
+                        help="Output workbook (default: resultados_licitaciones.xlsx, or one per shard with --shard)")
+    parser.add_argument('--parser-engine', choices=PARSER_ENGINES, default=PARSER_ENGINE,
+                        help="Parser for adjudication documents; lxml skips BeautifulSoup (default: %(default)s)")
+    parser.add_argument('--debug', action='store_true',
+                        help="Log every field extracted from every page (large licitaciones.log)")
+    parser.add_argument('--metrics-json', default=None,
+                        help="Run metrics summary (default: metrics_op2.json)")
+    parser.add_argument('--metrics-textfile', default=None,
+                        help="Also write the run metrics in Prometheus textfile format to this path")
+    subparsers = parser.add_subparsers(dest='command')
+    cache_parser = subparsers.add_parser('cache', help="Inspect the URL cache")
+    cache_parser.add_argument('action', choices=['stats'])
+    state_parser = subparsers.add_parser('state', help="Inspect the crawl state and the failed URL queue")
+    state_parser.add_argument('action', choices=['stats', 'failed'])
+    merge_parser = subparsers.add_parser('merge', help="Combine the result workbooks of --shard runs into --output")
+    merge_parser.add_argument('files', nargs='+')
+    # Also accepted after the files; SUPPRESS keeps a value given before 'merge'
+    merge_parser.add_argument('--output', default=argparse.SUPPRESS,
+                              help="Merged workbook (default: resultados_licitaciones.xlsx)")
+    merge_parser.add_argument('--formats', type=parse_formats, default=argparse.SUPPRESS,
+                              help="Comma-separated output formats among xlsx, csv and parquet (default: xlsx)")
+    return parser.parse_args(argv)
+
+# Main function: returns the files written, or False if the crawl or the save failed
+def main(args=None):
+    global modificaciones, adjudicaciones, PARSER_ENGINE
+    if args is None:
+        args = parse_args([])
+    PARSER_ENGINE = args.parser_engine
+    log_config.setup_logging(LOG_FILE)
+    log_config.set_debug(args.debug)
+    url_cache.CACHE_TTL = args.cache_ttl * 3600
+    url_cache.CACHE_MAX_BYTES = args.cache_max_mb * 1024 * 1024
     modificaciones = []
     adjudicaciones = []
-    failed_urls = []
+    http_client.reset_stats()
+    metrics.reset()
     conn_cache = setup_cache()
-    resultados = []
+    conn_data = None
     
     try:
         conn_data = sqlite3.connect('licitaciones.db')
@@ -560,107 +764,142 @@ def main():
         required_columns = ['Identificador', 'Link licitación']
         if not all(col in columns for col in required_columns):
             missing = [col for col in required_columns if col not in columns]
-            logging.error(f"Missing required columns in 'licitaciones': {missing}")
+            logging.error("Missing required columns in 'licitaciones': %s", missing)
             print(f"Error: Missing required columns in 'licitaciones': {missing}")
             conn_data.close()
-            conn_cache.close()
-            sys.exit(1)
-        cursor.execute("SELECT Identificador, [Link licitación] FROM licitaciones")
+            close_cache(conn_cache)
+            return False
+        # In import order; without ORDER BY SQLite may scan the Identificador primary key instead
+        cursor.execute("SELECT Identificador, [Link licitación] FROM licitaciones ORDER BY rowid")
         rows = cursor.fetchall()
         if not rows:
             logging.error("Database table 'licitaciones' is empty. No rows to process.")
             print("Error: Database table 'licitaciones' is empty. No rows to process.")
             conn_data.close()
-            conn_cache.close()
-            return resultados
-        rows = rows[:100] #-------------------------------------------------------------------------> Modificacar esto para cambiar el numero de filas que procesa
-        logging.info(f"Database has {len(rows)} rows (limited to {len(rows)} for testing)")
-        print(f"Database has {len(rows)} rows (limited to {len(rows)} for testing)")
+            close_cache(conn_cache)
+            return []
+        total = len(rows)
+        rows = rows[args.offset:] if args.limit is None else rows[args.offset:args.offset + args.limit]
+        if args.shard:
+            rows = [row for row in rows if in_shard(row[0], *args.shard)]
+            logging.info("Database has %s rows, %s selected for shard %s/%s", total, len(rows), args.shard[0], args.shard[1])
+            print(f"Database has {total} rows, {len(rows)} selected for shard {args.shard[0]}/{args.shard[1]}")
+        else:
+            logging.info("Database has %s rows, %s selected", total, len(rows))
+            print(f"Database has {total} rows, {len(rows)} selected")
+        estados = {}
+        if 'Estado' in columns:
+            cursor.execute("SELECT Identificador, Estado FROM licitaciones")
+            estados = {crawl_state.tender_key(identificador): estado for identificador, estado in cursor.fetchall()}
     except sqlite3.Error as e:
-        logging.error(f"Error accessing database: {e}")
+        logging.error("Error accessing database: %s", e)
         print(f"Error accessing database: {e}")
-        conn_cache.close()
-        sys.exit(1)
+        if conn_data is not None:
+            conn_data.close()
+        close_cache(conn_cache)
+        return False
     
-    print("Pre-fetching URLs to populate cache...")
+    state = crawl_state.setup_state()
+    completed = crawl_state.load_completed(state) if args.resume or args.incremental else set()
+    if args.incremental:
+        with metrics.timer('stage_seconds', stage='select_unchanged'):
+            completed = select_unchanged(rows, completed, estados, crawl_state.load_snapshot(state),
+                                         args.timeout, conn_cache, args.concurrency, args.rps)
+    pending_rows = [row for row in rows if crawl_state.tender_key(row[0]) not in completed]
+    if args.resume or args.incremental:
+        logging.info("Reusing %s completed tenders, %s to process", len(rows) - len(pending_rows), len(pending_rows))
+        print(f"Reusing {len(rows) - len(pending_rows)} completed tenders, {len(pending_rows)} to process")
+    
+    # Results are streamed to disk as tenders complete, in the order of rows
+    output_file = output_path(args)
+    writer = ResultWriter(output_file, args.formats)
+    pending_index = [i for i, row in enumerate(rows) if crawl_state.tender_key(row[0]) not in completed]
+    for i, row in enumerate(rows):
+        if crawl_state.tender_key(row[0]) in completed:
+            writer.add(i, *crawl_state.load_tender(state, crawl_state.tender_key(row[0])))
+    
+    def on_result(i, row, procesado):
+        crawl_state.record_tender(state, row[0], row[1], *procesado, estado=estados.get(crawl_state.tender_key(row[0])))
+        writer.add(pending_index[i], *procesado)
+    
+    pipeline_failed = False
     try:
-        asyncio.run(prefetch_urls(rows, TIMEOUT, conn_cache))
+        if args.workers > 1:
+            print("Pre-fetching URLs to populate cache...")
+            with metrics.timer('stage_seconds', stage='prefetch'):
+                asyncio.run(prefetch_urls(pending_rows, args.timeout, conn_cache, args.concurrency, args.rps))
+                flush_cache(conn_cache)
+            print(f"Processing rows on {args.workers} worker processes...")
+            with metrics.timer('stage_seconds', stage='process'):
+                run_workers(pending_rows, args.timeout, args.workers, on_result)
+        else:
+            print("Fetching and processing tenders...")
+            with metrics.timer('stage_seconds', stage='pipeline'):
+                asyncio.run(run_pipeline(pending_rows, args.timeout, conn_cache, args.concurrency, args.rps, on_result))
     except Exception as e:
-        logging.error(f"Error in pre-fetching URLs: {e}")
-        print(f"Error in pre-fetching URLs: {e}")
+        logging.error("Error in processing pipeline: %s", e)
+        print(f"Error in processing pipeline: {e}")
+        pipeline_failed = True
+    finally:
+        state.commit()
+    if pipeline_failed:
+        writer.discard()
+        crawl_state.close_state(state)
         conn_data.close()
-        conn_cache.close()
-        sys.exit(1)
-    
-    for i, row in enumerate(tqdm(rows, total=len(rows), desc="Processing rows")):
-        logging.info(f"Processing row {i+1}/{len(rows)}")
-        try:
-            result = process_row_sync(row, TIMEOUT, conn_cache)
-            resultados.append(result)
-            logging.info(f"Completed row {i+1}: {row[1]}")
-        except Exception as e:
-            logging.error(f"Error processing row {i+1} ({row[1]}): {e}")
-            print(f"Error processing row {i+1} ({row[1]}): {e}")
-            result = {
-                'Identificador': row[0],
-                'Link licitación': row[1],
-                'Modificado': f'Error - {str(e)}'
-            }
-            resultados.append(result)
-    
-    logging.info(f"Processed {len(resultados)} rows out of {len(rows)}")
-    print(f"Processed {len(resultados)} rows out of {len(rows)}")
-    
-    output_file = 'resultados_licitaciones.xlsx'
-    try:
-        df_resultados = pd.DataFrame(resultados)
-        df_modificaciones = pd.DataFrame(modificaciones) if modificaciones else pd.DataFrame()
-        df_adjudicaciones = pd.DataFrame(adjudicaciones) if adjudicaciones else pd.DataFrame()
-        
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            df_resultados.to_excel(writer, sheet_name='Resultados', index=False)
-            if not df_modificaciones.empty:
-                df_modificaciones.to_excel(writer, sheet_name='Modificacion', index=False)
-                logging.info(f"Modification data saved to sheet 'Modificacion' in {output_file}")
-            else:
-                df_modificaciones.to_excel(writer, sheet_name='Modificacion', index=False)
-                logging.info(f"No modification data found, 'Modificacion' sheet created with headers")
-            if not df_adjudicaciones.empty:
-                df_adjudicaciones.to_excel(writer, sheet_name='Adjudicacion', index=False)
-                logging.info(f"Adjudication data saved to sheet 'Adjudicacion' in {output_file}")
-            else:
-                df_adjudicaciones.to_excel(writer, sheet_name='Adjudicacion', index=False)
-                logging.info(f"No adjudication data found, 'Adjudicacion' sheet created with headers")
-        logging.info(f"Results saved to {output_file} with {len(df_resultados)} rows")
-        print(f"Results saved to {output_file} with {len(df_resultados)} rows")
-    except Exception as e:
-        logging.error(f"Error saving results: {e}")
-        print(f"Error saving results: {e}")
+        close_cache(conn_cache)
+        return False
     
-    total_requests = cache_hits + cache_misses
-    hit_rate = (cache_hits / total_requests * 100) if total_requests > 0 else 0
-    logging.info(f"Cache stats: Hits={cache_hits}, Misses={cache_misses}, Hit Rate={hit_rate:.2f}%")
-    logging.info(f"Total retries: {retry_count}")
-    print(f"Cache stats: Hits={cache_hits}, Misses={cache_misses}, Hit Rate={hit_rate:.2f}%")
-    print(f"Total retries: {retry_count}")
+    failed_urls = http_client.failed_urls
+    if failed_urls:
+        crawl_state.record_failed_urls(state, failed_urls)
+        logging.warning("%s URLs failed to fetch, queued for retry in %s", len(set(failed_urls)), crawl_state.STATE_FILE)
+        print(f"{len(set(failed_urls))} URLs failed to fetch, queued for retry in {crawl_state.STATE_FILE}")
+    failed = set(failed_urls)
+    resolved = crawl_state.resolve_failed_urls(state, lambda url: url not in failed and url_cache.has_url(conn_cache, url))
+    if resolved:
+        logging.info("%s previously failed URLs fetched successfully", resolved)
+    crawl_state.close_state(state)
+    
+    logging.info("Processed %s rows out of %s", writer.counts[0], len(rows))
+    print(f"Processed {writer.counts[0]} rows out of {len(rows)}")
     
     try:
-        conn_cache.close()
-        if os.path.exists('url_cache.db'):
-            os.remove('url_cache.db')
-            logging.info("Cache file 'url_cache.db' deleted successfully")
-            print("Cache file 'url_cache.db' deleted successfully")
-        else:
-            logging.info("Cache file 'url_cache.db' does not exist, no cleanup needed")
+        with metrics.timer('stage_seconds', stage='save'):
+            written = writer.close()
+        logging.info("Results saved to %s with %s rows", ', '.join(written), writer.counts[0])
+        print(f"Results saved to {', '.join(written)} with {writer.counts[0]} rows")
     except Exception as e:
-        logging.error(f"Error deleting cache file 'url_cache.db': {e}")
-        print(f"Error deleting cache file 'url_cache.db': {e}")
+        logging.error("Error saving results: %s", e)
+        print(f"Error saving results: {e}")
+        written = False
     
+    evict_cache(conn_cache)
+    for line in url_cache.format_run_stats() + http_client.format_run_stats():
+        logging.info(line)
+        print(line)
+    metrics.inc('rows_processed', writer.counts[0])
+    metrics.record_stats('cache', url_cache.stats)
+    metrics.record_stats('http_client', http_client.stats)
+    metrics.report('op2', args.metrics_json, args.metrics_textfile)
+    
+    close_cache(conn_cache)
     conn_data.close()
-    return resultados
+    return written
 
-# Run the program
-if __name__ == "__main__":
+# Run the program: the cache/state/merge commands, or a crawl after checking licitaciones.db.
+# Returns False if the database is not usable or the crawl fails, else what main returns.
+def run(args):
+    log_config.setup_logging(LOG_FILE)
+    if args.command == 'cache':
+        print_cache_stats(ttl=args.cache_ttl * 3600)
+        return True
+    if args.command == 'state':
+        crawl_state.print_state(args.action)
+        return True
+    if args.command == 'merge':
+        merge_shards(args)
+        return True
+    
     try:
         conn = sqlite3.connect('licitaciones.db')
         cursor = conn.cursor()
@@ -669,28 +908,31 @@ if __name__ == "__main__":
             logging.error("Table 'licitaciones' not found in database")
             print("Error: Table 'licitaciones' not found in database")
             conn.close()
-            sys.exit(1)
+            return False
         cursor.execute("PRAGMA table_info('licitaciones')")
         columns = [info[1] for info in cursor.fetchall()]
         required_columns = ['Identificador', 'Link licitación']
         if not all(col in columns for col in required_columns):
-            logging.error(f"Missing required columns: {[col for col in required_columns if col not in columns]}")
+            logging.error("Missing required columns: %s", [col for col in required_columns if col not in columns])
             print(f"Error: Missing required columns: {[col for col in required_columns if col not in columns]}")
             conn.close()
-            sys.exit(1)
+            return False
         conn.close()
     except sqlite3.Error as e:
-        logging.error(f"Error connecting to database: {e}")
+        logging.error("Error connecting to database: %s", e)
         print(f"Error connecting to database: {e}")
-        sys.exit(1)
-    
-    TIMEOUT = 30
+        return False
     
     start_time = time.time()
+    result = False
     try:
-        resultados = main()
+        result = main(args)
     except Exception as e:
-        logging.error(f"Error in processing: {e}")
+        logging.error("Error in processing: %s", e)
         print(f"Error in processing: {e}")
     
-    print(f"Analysis completed. Total time: {time.time() - start_time:.2f} seconds")
\ No newline at end of file
+    print(f"Analysis completed. Total time: {time.time() - start_time:.2f} seconds")
+    return result
+
+if __name__ == "__main__":
+    sys.exit(1 if run(parse_args()) is False else 0)
\ No newline at end of file
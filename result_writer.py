@@ -0,0 +1,227 @@
+import argparse
+import sqlite3
+import logging
+import pickle
+import csv
+import datetime
+import os
+import tempfile
+
+import metrics
+
+# op2.py result sheets, in workbook order
+SHEETS = ['Resultados', 'Modificacion', 'Adjudicacion']
+SPOOL_BATCH_ROWS = 500
+PARQUET_BATCH_ROWS = 1000
+FORMATS = ['xlsx', 'csv', 'parquet']
+
+# argparse type of the --formats options: "xlsx,parquet" -> ['xlsx', 'parquet']
+def parse_formats(value):
+    formats = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"unknown output formats {unknown}, expected some of {FORMATS}")
+    return formats
+
+# Streams result rows to a temporary SQLite spool while the crawl runs and writes the
+# output files from it at the end, so memory does not grow with the number of tenders.
+# openpyxl and pyarrow are imported when a file is written, so importing this module for
+# parse_formats does not load them.
+# Rows may arrive in any order; they are written ordered by the index given to add().
+# The Python types seen in each column give the column types of the Parquet files.
+class ResultWriter:
+    def __init__(self, output_file, formats=('xlsx',), sheets=SHEETS):
+        self.output_file = output_file
+        self.formats = formats
+        self.sheets = sheets
+        fd, self.spool_file = tempfile.mkstemp(suffix='.db', prefix='results_spool_')
+        os.close(fd)
+        self.spool = sqlite3.connect(self.spool_file)
+        self.spool.execute('PRAGMA journal_mode=OFF')
+        self.spool.execute('PRAGMA synchronous=OFF')
+        self.spool.execute('CREATE TABLE rows (sheet INTEGER, idx INTEGER, data BLOB)')
+        self.uncommitted = 0
+        self.counts = [0] * len(sheets)
+        self.types = [{} for _ in sheets]
+
+    # Add the resultado row of the tender at position index and its modification/adjudication rows
+    def add(self, index, resultado, tender_mods, tender_adjs):
+        self.add_rows(0, index, [resultado])
+        self.add_rows(1, index, tender_mods)
+        self.add_rows(2, index, tender_adjs)
+
+    def add_rows(self, sheet, index, rows):
+        entries = [(sheet, index, pickle.dumps(row, pickle.HIGHEST_PROTOCOL)) for row in rows]
+        self.spool.executemany('INSERT INTO rows (sheet, idx, data) VALUES (?, ?, ?)', entries)
+        self.counts[sheet] += len(entries)
+        types = self.types[sheet]
+        for row in rows:
+            for key, value in row.items():
+                if value is not None:
+                    types.setdefault(key, set()).add(type(value))
+        self.uncommitted += len(entries)
+        if self.uncommitted >= SPOOL_BATCH_ROWS:
+            self.spool.commit()
+            self.uncommitted = 0
+
+    def iter_rows(self, sheet):
+        for data, in self.spool.execute('SELECT data FROM rows WHERE sheet = ? ORDER BY idx, rowid', (sheet,)):
+            yield pickle.loads(data)
+
+    # Columns of a sheet in order of first appearance, as pandas.DataFrame(list_of_dicts) would have them
+    def columns(self, sheet):
+        columns = {}
+        for row in self.iter_rows(sheet):
+            for key in row:
+                columns.setdefault(key, None)
+        return list(columns)
+
+    # Drop the spooled rows without writing any output
+    def discard(self):
+        self.spool.close()
+        os.remove(self.spool_file)
+
+    def close(self):
+        self.spool.commit()
+        self.spool.execute('CREATE INDEX idx_rows ON rows(sheet, idx)')
+        try:
+            schemas = [self.columns(sheet) for sheet in range(len(self.sheets))]
+            written = []
+            if 'xlsx' in self.formats:
+                with metrics.timer('write_seconds', output='xlsx'):
+                    self.write_xlsx(schemas)
+                written.append(self.output_file)
+            if 'csv' in self.formats:
+                with metrics.timer('write_seconds', output='csv'):
+                    written += self.write_csv(schemas)
+            if 'parquet' in self.formats:
+                with metrics.timer('write_seconds', output='parquet'):
+                    written += self.write_parquet(schemas)
+            return written
+        finally:
+            self.discard()
+
+    def write_xlsx(self, schemas):
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        for sheet, name in enumerate(self.sheets):
+            worksheet = workbook.create_sheet(name)
+            if schemas[sheet]:
+                worksheet.append(schemas[sheet])
+            for row in self.iter_rows(sheet):
+                worksheet.append([row.get(column) for column in schemas[sheet]])
+            logging.info("%s rows saved to sheet '%s' in %s", self.counts[sheet], name, self.output_file)
+        workbook.save(self.output_file)
+
+    # <output>_<sheet>.<extension>, or <output>.<extension> for a single sheet
+    def export_path(self, name, extension):
+        if len(self.sheets) == 1:
+            return f"{os.path.splitext(self.output_file)[0]}.{extension}"
+        return f"{os.path.splitext(self.output_file)[0]}_{name}.{extension}"
+
+    def write_csv(self, schemas):
+        paths = []
+        for sheet, name in enumerate(self.sheets):
+            path = self.export_path(name, 'csv')
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=schemas[sheet])
+                writer.writeheader()
+                for row in self.iter_rows(sheet):
+                    writer.writerow(row)
+            paths.append(path)
+        return paths
+
+    # Columns holding only numbers, booleans or dates keep their type; any other column is written
+    # as strings (the Mod N/... and Adj N/... values are free text)
+    def write_parquet(self, schemas):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logging.error("pyarrow is not installed, skipping Parquet output")
+            print("Error: pyarrow is not installed, skipping Parquet output")
+            return []
+        paths = []
+        for sheet, name in enumerate(self.sheets):
+            path = self.export_path(name, 'parquet')
+            types = [arrow_type(pa, self.types[sheet].get(column, set())) for column in schemas[sheet]]
+            schema = pa.schema([(str(column), column_type) for column, column_type in zip(schemas[sheet], types)])
+            columns = [(column, str(column), column_type == pa.string()) for column, column_type in zip(schemas[sheet], types)]
+            with pq.ParquetWriter(path, schema) as writer:
+                batch = []
+                for row in self.iter_rows(sheet):
+                    values = {}
+                    for column, field, string in columns:
+                        value = row.get(column)
+                        values[field] = str(value) if string and value is not None else value
+                    batch.append(values)
+                    if len(batch) >= PARQUET_BATCH_ROWS:
+                        writer.write_table(pa.Table.from_pylist(batch, schema))
+                        batch = []
+                if batch:
+                    writer.write_table(pa.Table.from_pylist(batch, schema))
+            paths.append(path)
+        return paths
+
+# Arrow type of a column from the Python types of its values
+def arrow_type(pa, types):
+    if not types:
+        return pa.string()
+    if types == {bool}:
+        return pa.bool_()
+    if types <= {int}:
+        return pa.int64()
+    if types <= {int, float}:
+        return pa.float64()
+    if types <= {datetime.datetime}:
+        return pa.timestamp('us')
+    if types <= {datetime.date}:
+        return pa.date32()
+    return pa.string()
+
+# Rows of each result sheet of a workbook written by ResultWriter, as dicts without the empty cells
+def read_workbook(path):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    sheets = []
+    for name in SHEETS:
+        rows = []
+        if name in workbook.sheetnames:
+            values = workbook[name].iter_rows(values_only=True)
+            header = next(values, ())
+            for row in values:
+                rows.append({column: value for column, value in zip(header, row) if value is not None})
+        sheets.append(rows)
+    workbook.close()
+    return sheets
+
+# Combine the workbooks of several --shard runs into one with the same sheets as a single run.
+# order maps each Identificador to its positions in the input, so rows keep the input order;
+# a tender listed several times has its rows split evenly across its listings.
+def merge_workbooks(paths, output_file, formats=('xlsx',), order=None):
+    order = order or {}
+    unknown = sum(len(positions) for positions in order.values())
+    writer = ResultWriter(output_file, formats)
+    for number, path in enumerate(paths):
+        sheets = read_workbook(path)
+        listings = {}
+        for row in sheets[0]:
+            key = str(row.get('Identificador'))
+            listings[key] = listings.get(key, 0) + 1
+        for sheet, rows in enumerate(sheets):
+            totals, seen = {}, {}
+            for row in rows:
+                key = str(row.get('Identificador'))
+                totals[key] = totals.get(key, 0) + 1
+            for row in rows:
+                key = str(row.get('Identificador'))
+                positions = order.get(key)
+                if positions:
+                    listing = seen.get(key, 0) * listings.get(key, 1) // totals[key]
+                    position = positions[min(listing, len(positions) - 1)]
+                else:
+                    position = unknown + number
+                seen[key] = seen.get(key, 0) + 1
+                writer.add_rows(sheet, position, [row])
+        logging.info("Merged %s", path)
+    return writer.close(), writer.counts
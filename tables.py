@@ -0,0 +1,238 @@
+import argparse
+import glob
+import logging
+import os
+import openpyxl
+import pandas as pd
+from xlsx_reader import XlsxReader
+
+# Hand-off files between the pipeline stages (FiltrarObrasResueltas -> import_licitaciones -> op2
+# -> unirResultados -> criteriosLici). A table is an Excel sheet, a CSV file or a Parquet file,
+# chosen by the file extension. The tables of a multi-sheet output are written next to each other
+# as <base>_<sheet>.parquet (or .csv), as ResultWriter does, and read_table('<base>.parquet', sheet)
+# finds them. Parquet keeps the column types and reads only the columns asked for, so stages can
+# pass Parquet to each other and leave Excel as the final report:
+#   python tables.py resultados_criterios_licitaciones.parquet resultados_criterios_licitaciones.xlsx
+
+def table_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return 'xlsx' if extension in ('xlsx', 'xlsm') else extension
+
+# File holding one table of an output: <base>_<sheet>.<extension> when it exists, else path itself
+def table_path(path, sheet=None):
+    if sheet is None or table_format(path) == 'xlsx':
+        return path
+    base, extension = os.path.splitext(path)
+    sheet_file = f"{base}_{sheet}{extension}"
+    return sheet_file if os.path.exists(sheet_file) else path
+
+# Names of the tables of an output. For csv and parquet, the <base>_<name> files in the order
+# they were written, or only the known names in their order, so that the tables of an output
+# whose name starts with base (resultados_licitaciones_combinado_*) are not taken; None stands
+# for a single-table file.
+def sheet_names(path, known=None):
+    if table_format(path) == 'xlsx':
+        reader = XlsxReader(path)
+        reader.close()
+        return reader.sheetnames
+    base, extension = os.path.splitext(path)
+    if known is not None:
+        names = [name for name in known if os.path.exists(f"{base}_{name}{extension}")]
+    else:
+        files = sorted(glob.glob(f"{glob.escape(base)}_*{extension}"), key=os.path.getmtime)
+        names = [os.path.basename(f)[len(os.path.basename(base)) + 1:-len(extension)] for f in files]
+    if not names:
+        return [None] if os.path.exists(path) else []
+    return names
+
+def table_columns(path, sheet=None):
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(table_path(path, sheet)).names
+    if fmt == 'csv':
+        return list(pd.read_csv(table_path(path, sheet), nrows=0).columns)
+    reader = XlsxReader(path)
+    try:
+        return reader.values(next(reader.rows(excel_sheet(reader, sheet)), []))
+    finally:
+        reader.close()
+
+# Text that read_excel reads as a missing value (pandas' default na_values)
+NA_STRINGS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+              '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+def excel_sheet(reader, sheet):
+    return sheet if sheet in reader.sheets else reader.sheetnames[0]
+
+# Cell value as pandas' openpyxl reader gives it to its parser: '' for empty cells, NaN for
+# errors and integral numbers as int
+def excel_value(reader, cell):
+    if cell is None:
+        return ''
+    if cell.get('t') == 'e':
+        return float('nan')
+    value = reader.value(cell)
+    if value is None:
+        return ''
+    if type(value) is float and value.is_integer():
+        return int(value)
+    return value
+
+# Sheets of an xlsx file as DataFrames, equal to what pandas.read_excel gives, but read in one
+# pass over the archive with XlsxReader: only the cells of the columns asked for are decoded.
+# sheets missing from the file give its first sheet.
+def read_xlsx(path, sheets=None, columns=None):
+    reader = XlsxReader(path)
+    try:
+        return {sheet: read_xlsx_sheet(reader, excel_sheet(reader, sheet), columns)
+                for sheet in (sheets or reader.sheetnames)}
+    finally:
+        reader.close()
+
+def read_xlsx_sheet(reader, sheet, columns=None):
+    rows = reader.rows(sheet, fill=True)
+    if columns is None:
+        data = []
+        for cells in rows:
+            values = [excel_value(reader, cell) for cell in cells]
+            while values and values[-1] == '':
+                values.pop()
+            data.append(values)
+        width = max(map(len, data), default=0)
+        data = [values + [''] * (width - len(values)) for values in data]
+    else:
+        header = [excel_value(reader, cell) for cell in next(rows, [])]
+        positions = [i for i, name in enumerate(header) if name in columns]
+        if not positions:
+            return pd.DataFrame(columns=[])
+        data = [[header[i] for i in positions]]
+        for cells in rows:
+            data.append([excel_value(reader, cells[i]) if i < len(cells) else '' for i in positions])
+    while data and not any(value != '' for value in data[-1]):
+        data.pop()
+    if not data:
+        return pd.DataFrame()
+    return excel_frame(data)
+
+# Header names as read_excel gives them: 'Unnamed: n' for empty headers, X.1, X.2... for repeated ones
+def header_names(header):
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name == '':
+            name = f"Unnamed: {i}"
+        count = seen.get(name, 0)
+        while count > 0:
+            seen[name] = count + 1
+            name = f"{name}.{count}"
+            count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(name)
+    return names
+
+# DataFrame of the rows of a sheet (header first) with the types read_excel infers: the
+# NA_STRINGS are missing values, columns that are all numbers are numeric and the others take
+# the type of their values
+def excel_frame(data):
+    names = header_names(data[0])
+    df = pd.DataFrame(data[1:], columns=range(len(names)), dtype=object)
+    if df.empty:
+        return df.set_axis(names, axis=1)
+    df = df.mask(df.isin(NA_STRINGS))
+    return pd.DataFrame({i: excel_column(series) for i, series in df.items()}).set_axis(names, axis=1)
+
+def excel_column(series):
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series.infer_objects()
+
+# Read a table as a DataFrame. sheet picks a table of a multi-sheet output; a file without it
+# gives its first (or only) table. With columns, only those are read; the ones missing from the
+# table are left out, so the caller can report them.
+def read_table(path, sheet=None, columns=None):
+    fmt = table_format(path)
+    if fmt == 'xlsx':
+        return read_xlsx(path, [sheet], columns)[sheet]
+    if columns is not None:
+        available = set(table_columns(path, sheet))
+        columns = [column for column in columns if column in available]
+    if fmt == 'parquet':
+        return pd.read_parquet(table_path(path, sheet), columns=columns)
+    return pd.read_csv(table_path(path, sheet), usecols=columns)
+
+# Every table of an output, reading an xlsx workbook once
+def read_tables(path, known=None):
+    names = sheet_names(path, known)
+    if table_format(path) == 'xlsx':
+        return read_xlsx(path, names)
+    return {sheet: read_table(path, sheet) for sheet in names}
+
+# Parquet needs one type per column: object columns mixing types are written as strings
+def parquet_frame(df):
+    df = df.rename(columns=str)
+    for column in df.columns[df.dtypes == object]:
+        values = df[column].dropna()
+        types = set(map(type, values))
+        if len(types) > 1 and not types <= {int, float}:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+# Values of a DataFrame row by row as openpyxl cells take them: None for missing values
+def excel_rows(df):
+    columns = []
+    for _, series in df.items():
+        values = series.astype(object).tolist()
+        if series.hasnans:
+            values = [None if missing else value for value, missing in zip(values, series.isna().tolist())]
+        columns.append(values)
+    return zip(*columns)
+
+# All sheets in one streamed workbook (openpyxl write_only, as ResultWriter writes op2's results),
+# much faster and lighter than DataFrame.to_excel for large tables
+def write_xlsx(path, tables):
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, df in tables.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(list(df.columns))
+        for row in excel_rows(df):
+            worksheet.append(row)
+    workbook.save(path)
+
+# Write DataFrames (sheet name -> DataFrame) in each format; returns the files written.
+# xlsx gives one workbook; csv and parquet one file per sheet named like ResultWriter's.
+def write_tables(output_file, tables, formats=('xlsx',)):
+    base = os.path.splitext(output_file)[0]
+    written = []
+    for fmt in formats:
+        if fmt == 'xlsx':
+            path = f"{base}.xlsx"
+            write_xlsx(path, tables)
+            written.append(path)
+            continue
+        for sheet_name, df in tables.items():
+            path = f"{base}.{fmt}" if len(tables) == 1 else f"{base}_{sheet_name}.{fmt}"
+            if fmt == 'csv':
+                df.to_csv(path, index=False)
+            else:
+                parquet_frame(df).to_parquet(path, index=False)
+            written.append(path)
+    logging.info("Tables %s written to %s", list(tables), ', '.join(written))
+    return written
+
+# Convert an output to other formats, e.g. the Parquet tables of a stage to an Excel report
+def export(path, output_file, known=None):
+    tables = {sheet or os.path.splitext(os.path.basename(path))[0]: read_table(path, sheet)
+              for sheet in sheet_names(path, known)}
+    return write_tables(output_file, tables, [table_format(output_file)])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the tables of a pipeline output to another format")
+    parser.add_argument('input', help="Output of a stage, e.g. resultados_licitaciones.parquet")
+    parser.add_argument('output', help="File to write; its extension gives the format, e.g. resultados_licitaciones.xlsx")
+    parser.add_argument('--sheets', type=lambda value: value.split(','), default=None,
+                        help="Comma-separated tables to convert, in order (default: every <input>_<name> file)")
+    args = parser.parse_args()
+    for path in export(args.input, args.output, args.sheets):
+        print(f"Saved {path}")
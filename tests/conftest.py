@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The pipeline modules live at the top of the repository and the synthetic page generators in
+# benchmark/; neither is an installed package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmark'))
+sys.path.insert(0, ROOT)
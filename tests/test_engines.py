@@ -0,0 +1,60 @@
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+import extraction_rules as rules
+import lxml_engine
+import op2
+from diff_engines import IDENTIFICADOR, LINK, perturb, run_engine
+from fixtures import BASE_PLACEHOLDER, DOCUMENT_PATH, synthetic_adjudication_page, synthetic_main_page
+
+# Differential checks of op2's --parser-engine on synthetic pages, as diff_engines.py does on a
+# recorded corpus: the bs4 and lxml Adjudicación extractors must give the same keys, values and
+# errors, also on the perturbed markup the portal produces.
+
+def both_engines(content):
+    bs4_output = run_engine(op2.extract_adjudication, lambda page: op2.parse_page(page, LINK), content, LINK)
+    lxml_output = run_engine(lxml_engine.extract_adjudication, lxml_engine.parse_document, content, LINK)
+    return bs4_output, lxml_output
+
+@pytest.mark.parametrize('seed', range(10))
+def test_adjudication_engines_agree(seed):
+    rng = random.Random(seed)
+    page = synthetic_adjudication_page(100000 + seed, seed % 3, rng)
+    bs4_output, lxml_output = both_engines(page)
+    assert bs4_output[0] != 'error' and bs4_output[1]
+    assert bs4_output == lxml_output
+    for _ in range(5):
+        bs4_output, lxml_output = both_engines(perturb(page, rng))
+        assert bs4_output == lxml_output
+
+@pytest.mark.parametrize('page', [
+    '<html><body><h5>Datos generales</h5><div class="boxWithBackground"><ul></ul></div></body></html>',
+    '<html><body><p>Documento sin cabeceras</p></body></html>',
+    '<html></html>',
+])
+def test_adjudication_engines_agree_without_offers(page):
+    bs4_output, lxml_output = both_engines(page)
+    assert bs4_output == lxml_output
+
+# The document table read with lxml and XPath, and through the html.parser fallback, gives the
+# dated documents with the Html link of the typed ones
+def test_document_table():
+    documentos = [('01/02/2021 10:00', 'Anuncio de Licitación', None),
+                  ('03/03/2021 12:00:01', 'Adjudicación', DOCUMENT_PATH.format(1)),
+                  ('05/05/2022', 'Modificación de contrato', DOCUMENT_PATH.format(2)),
+                  ('sin fecha', 'Pliego', None)]
+    page = synthetic_main_page(IDENTIFICADOR, documentos, 2).replace(BASE_PLACEHOLDER, 'https://contrataciondelestado.es')
+    fallback = lxml_engine.document_table(str(BeautifulSoup(page, 'html.parser').find('table', id=rules.DOCUMENT_TABLE_ID)))
+    listed = op2.list_documents(op2.parse_document_table(page, LINK), LINK)
+    assert listed == op2.list_documents(fallback, LINK)
+    assert [(d['fecha'], d['tipo'], d['html_url']) for d in listed] == [
+        ('01/02/2021 10:00', rules.classify_document('Anuncio de Licitación'), None),
+        ('03/03/2021 12:00:01', 'Adjudicación', 'https://contrataciondelestado.es' + DOCUMENT_PATH.format(1)),
+        ('05/05/2022', 'Modificación', 'https://contrataciondelestado.es' + DOCUMENT_PATH.format(2)),
+    ]
+
+def test_missing_document_table():
+    assert op2.parse_document_table('<html><body><p>Sin tabla</p></body></html>', LINK) is None
+    assert op2.list_documents(None, LINK) == []
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pandas as pd
+
+import import_licitaciones
+from import_licitaciones import KEY, TABLE, import_excel_to_db
+
+def write_input(path, rows):
+    pd.DataFrame(rows, columns=[KEY, 'Link licitación', 'Estado']).to_csv(path, index=False)
+    return str(path)
+
+def stored(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute(f'SELECT {KEY}, "Link licitación", Estado FROM {TABLE} ORDER BY rowid').fetchall()
+    finally:
+        conn.close()
+
+def primary_key(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})") if row[5]]
+    finally:
+        conn.close()
+
+# A second import keeps the earlier tenders, updates the changed ones and appends the new ones
+def test_upsert(tmp_path):
+    db_file = str(tmp_path / 'licitaciones.db')
+    first = write_input(tmp_path / 'a.csv', [(1, 'https://a/1', 'Resuelta'), (2, 'https://a/2', 'Resuelta')])
+    second = write_input(tmp_path / 'b.csv', [(2, 'https://a/2', 'Anulada'), (3, 'https://a/3', 'Resuelta')])
+    assert import_excel_to_db(first, db_file) is True
+    assert import_excel_to_db(second, db_file) is True
+    assert stored(db_file) == [(1, 'https://a/1', 'Resuelta'), (2, 'https://a/2', 'Anulada'), (3, 'https://a/3', 'Resuelta')]
+    assert primary_key(db_file) == [KEY]
+
+# Rows without Identificador are skipped and a repeated Identificador keeps its last row
+def test_upsert_skips_missing_and_repeated_keys(tmp_path):
+    db_file = str(tmp_path / 'licitaciones.db')
+    rows = [(1, 'https://a/1', 'Resuelta'), (None, 'https://a/x', 'Resuelta'), (1, 'https://a/1', 'Anulada')]
+    assert import_excel_to_db(write_input(tmp_path / 'a.csv', rows), db_file) is True
+    assert stored(db_file) == [(1, 'https://a/1', 'Anulada')]
+
+def test_replace(tmp_path):
+    db_file = str(tmp_path / 'licitaciones.db')
+    first = write_input(tmp_path / 'a.csv', [(1, 'https://a/1', 'Resuelta'), (2, 'https://a/2', 'Resuelta')])
+    second = write_input(tmp_path / 'b.csv', [(3, 'https://a/3', 'Resuelta')])
+    assert import_excel_to_db(first, db_file) is True
+    assert import_excel_to_db(second, db_file, mode='replace') is True
+    assert stored(db_file) == [(3, 'https://a/3', 'Resuelta')]
+
+# A table written by the old DataFrame.to_sql import has no primary key: it is rebuilt with one,
+# keeping its rows in order, before the upsert
+def test_upsert_rebuilds_table_without_primary_key(tmp_path):
+    db_file = str(tmp_path / 'licitaciones.db')
+    conn = sqlite3.connect(db_file)
+    pd.DataFrame([(2, 'https://a/2', 'Resuelta'), (1, 'https://a/1', 'Resuelta')],
+                 columns=[KEY, 'Link licitación', 'Estado']).to_sql(TABLE, conn, index=False)
+    conn.close()
+    second = write_input(tmp_path / 'b.csv', [(1, 'https://a/1', 'Anulada'), (3, 'https://a/3', 'Resuelta')])
+    assert import_excel_to_db(second, db_file) is True
+    assert stored(db_file) == [(2, 'https://a/2', 'Resuelta'), (1, 'https://a/1', 'Anulada'), (3, 'https://a/3', 'Resuelta')]
+    assert primary_key(db_file) == [KEY]
+
+# main writes its metrics file to the working directory
+def test_missing_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert import_excel_to_db(str(tmp_path / 'nope.csv'), str(tmp_path / 'licitaciones.db')) is False
+    assert import_licitaciones.main(import_licitaciones.parse_args(['--input', str(tmp_path / 'nope.csv'),
+                                                                     '--db', str(tmp_path / 'licitaciones.db')])) is False
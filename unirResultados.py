@@ -1,8 +1,14 @@
+import argparse
+import sys
 import pandas as pd
+import metrics
+import tables
+from result_writer import SHEETS, parse_formats
 
-# Definir las rutas de los archivos Excel
-ruta_excel_1 = 'licitaciones_filtradas.xlsx'  # Cambia por la ruta real del primer Excel
-ruta_resultados_licitaciones = 'resultados_licitaciones.xlsx'  # Cambia por la ruta real del segundo Excel
+# Rutas por defecto de los archivos de entrada (Excel o Parquet, según la extensión) y de salida
+ruta_excel_1 = 'licitaciones_filtradas.xlsx'
+ruta_resultados_licitaciones = 'resultados_licitaciones.xlsx'
+ruta_salida = 'resultados_licitaciones_combinado.xlsx'
 
 # Columnas que se desean añadir desde el primer Excel a resultados_licitaciones
 columnas_a_anadir = [
@@ -20,74 +26,121 @@ columnas_a_anadir = [
 # Nombre de la columna identificadora común en ambos archivos
 columna_identificador = 'Identificador'  # Ajusta si el nombre exacto es diferente
 
-# Leer el primer archivo Excel
-try:
-    df_excel_1 = pd.read_excel(ruta_excel_1)
-    print("Columnas en el primer Excel:", df_excel_1.columns.tolist())
-    print("\nPrimeras 5 filas del primer Excel:\n", df_excel_1.head().to_string())
-except Exception as e:
-    print(f"Error al leer el primer Excel: {e}")
-    exit()
+# Qué fila del primer archivo se usa cuando un Identificador aparece varias veces
+DUPLICADOS = {'ultimo': 'last', 'primero': 'first', 'error': False}
 
-# Verificar las hojas disponibles en resultados_licitaciones.xlsx
-with pd.ExcelFile(ruta_resultados_licitaciones) as xls:
-    print("\nHojas disponibles en resultados_licitaciones.xlsx:", xls.sheet_names)
+# Identificador como texto para unir: 123, 123.0 y '123' son la misma licitación
+def claves(serie):
+    if pd.api.types.is_float_dtype(serie.dtype):
+        enteros = serie.dropna() % 1 == 0
+        if enteros.all():
+            serie = serie.astype('Int64')
+    return serie.astype('string').str.strip()
 
-# Leer la hoja 'Resultados' del segundo Excel
-try:
-    df_resultados = pd.read_excel(ruta_resultados_licitaciones, sheet_name='Resultados')
-    print("\nColumnas en la hoja 'Resultados' de resultados_licitaciones.xlsx:", df_resultados.columns.tolist())
-    print("\nPrimeras 5 filas de la hoja 'Resultados':\n", df_resultados.head().to_string())
-except ValueError as e:
-    print(f"Error: No se encontró la hoja 'Resultados' en {ruta_resultados_licitaciones}. Error: {e}")
-    exit()
+# Lee del primer archivo solo la columna identificadora y las columnas a añadir
+def leer_filtradas(ruta=ruta_excel_1, columnas=columnas_a_anadir):
+    df = tables.read_table(ruta, columns=[columna_identificador] + columnas)
+    if columna_identificador not in df.columns:
+        raise ValueError(f"La columna '{columna_identificador}' no se encuentra en {ruta}.")
+    faltantes = [col for col in columnas if col not in df.columns]
+    if faltantes:
+        raise ValueError(f"Las siguientes columnas no se encuentran en {ruta}: {faltantes}")
+    return df
 
-# Verificar que la columna identificadora existe en ambos DataFrames
-if columna_identificador not in df_excel_1.columns:
-    print(f"Error: La columna '{columna_identificador}' no se encuentra en el primer Excel.")
-    print("Intenta con uno de estos nombres de columnas:", df_excel_1.columns.tolist())
-    exit()
-if columna_identificador not in df_resultados.columns:
-    print(f"Error: La columna '{columna_identificador}' no se encuentra en la hoja 'Resultados' de resultados_licitaciones.xlsx.")
-    exit()
+# Lee todas las hojas de resultados_licitaciones de una vez
+def leer_resultados(ruta=ruta_resultados_licitaciones):
+    hojas = tables.read_tables(ruta, SHEETS)
+    if 'Resultados' not in hojas:
+        raise ValueError(f"No se encontró la hoja 'Resultados' en {ruta}. Hojas disponibles: {list(hojas)}")
+    if columna_identificador not in hojas['Resultados'].columns:
+        raise ValueError(f"La columna '{columna_identificador}' no se encuentra en la hoja 'Resultados' de {ruta}.")
+    return hojas
 
-# Verificar que las columnas solicitadas existen en el primer Excel
-columnas_faltantes = [col for col in columnas_a_anadir if col not in df_excel_1.columns]
-if columnas_faltantes:
-    print(f"Error: Las siguientes columnas no se encuentran en el primer Excel: {columnas_faltantes}")
-    exit()
+# Añade a cada fila de df_resultados las columnas de la fila del primer archivo con su mismo
+# Identificador. La unión es por índice: los Identificadores del primer archivo son las
+# categorías y cada fila de resultados toma la fila de su código, así que el número de filas no
+# cambia aunque una licitación aparezca varias veces en alguno de los archivos. Los repetidos en
+# el primer archivo se resuelven según duplicados ('ultimo', 'primero' o 'error').
+def unir(df_resultados, df_filtradas, columnas=columnas_a_anadir, duplicados='ultimo'):
+    claves_filtradas = claves(df_filtradas[columna_identificador])
+    con_clave = claves_filtradas.notna()
+    df_filtradas, claves_filtradas = df_filtradas[con_clave], claves_filtradas[con_clave]
+    repetidas = claves_filtradas.duplicated(keep=False)
+    if repetidas.any():
+        ejemplos = claves_filtradas[repetidas].unique()[:5].tolist()
+        mensaje = f"{claves_filtradas[repetidas].nunique()} Identificadores aparecen varias veces en el primer archivo, p. ej. {ejemplos}"
+        if not DUPLICADOS[duplicados]:
+            raise ValueError(mensaje)
+        print(f"Aviso: {mensaje}; se usa la {'última' if duplicados == 'ultimo' else 'primera'} fila de cada uno")
+        unicas = ~claves_filtradas.duplicated(keep=DUPLICADOS[duplicados])
+        df_filtradas, claves_filtradas = df_filtradas[unicas], claves_filtradas[unicas]
 
-# Realizar la unión (merge) de los DataFrames usando la columna identificadora
-df_combinado = pd.merge(
-    df_resultados,
-    df_excel_1[[columna_identificador] + columnas_a_anadir],
-    on=columna_identificador,
-    how='left'
-)
+    codigos = pd.Categorical(claves(df_resultados[columna_identificador]), categories=claves_filtradas).codes
+    sin_datos = int((codigos < 0).sum())
+    if sin_datos:
+        print(f"Aviso: {sin_datos} filas de 'Resultados' no tienen su Identificador en el primer archivo")
+    # Con valores que faltan, take promueve los tipos igual que merge(how='left'): enteros a float, fechas a NaT
+    anadidas = pd.DataFrame({col: pd.api.extensions.take(df_filtradas[col].array, codigos, allow_fill=True)
+                             for col in columnas}, index=df_resultados.index)
+    comunes = [col for col in columnas if col in df_resultados.columns]
+    if comunes:
+        df_resultados = df_resultados.rename(columns={col: f"{col}_x" for col in comunes})
+        anadidas = anadidas.rename(columns={col: f"{col}_y" for col in comunes})
+    return pd.concat([df_resultados, anadidas], axis=1)
 
-# Limpiar columnas que contengan 'Error' en su nombre
-print("\nColumnas antes de la limpieza:", df_combinado.columns.tolist())
-columnas_error = [col for col in df_combinado.columns if 'error' in str(col).lower().replace('/', '').replace('\\', '')]
-if columnas_error:
-    df_combinado = df_combinado.drop(columns=columnas_error, errors='ignore')
-    print(f"Se eliminaron {len(columnas_error)} columnas que contenían 'Error': {columnas_error}")
-else:
+# Quita las columnas que contengan 'Error' en su nombre
+def limpiar_errores(df):
+    columnas_error = [col for col in df.columns if 'error' in str(col).lower().replace('/', '').replace('\\', '')]
+    if columnas_error:
+        print(f"Se eliminaron {len(columnas_error)} columnas que contenían 'Error': {columnas_error}")
+        return df.drop(columns=columnas_error)
     print("No se encontraron columnas con 'Error' en el nombre.")
-print("Columnas después de la limpieza:", df_combinado.columns.tolist())
+    return df
 
-# Leer el archivo resultados_licitaciones como un libro de Excel para mantener todas las hojas
-with pd.ExcelFile(ruta_resultados_licitaciones) as xls:
-    hojas = {sheet: pd.read_excel(xls, sheet_name=sheet) for sheet in xls.sheet_names}
+# Lee cada archivo una vez, une y escribe todas las hojas en cada formato. Devuelve los archivos guardados.
+def combinar(ruta_filtradas=ruta_excel_1, ruta_resultados=ruta_resultados_licitaciones, salida=ruta_salida,
+             formats=('xlsx',), duplicados='ultimo'):
+    with metrics.timer('stage_seconds', stage='read'):
+        df_filtradas = leer_filtradas(ruta_filtradas)
+        hojas = leer_resultados(ruta_resultados)
+    print(f"{ruta_filtradas}: {len(df_filtradas)} filas; {ruta_resultados}: hojas {list(hojas)}, "
+          f"{len(hojas['Resultados'])} filas en 'Resultados'")
+    with metrics.timer('stage_seconds', stage='merge'):
+        df_combinado = unir(hojas['Resultados'], df_filtradas, duplicados=duplicados)
+    metrics.inc('rows_merged', len(df_combinado))
+    hojas['Resultados'] = limpiar_errores(df_combinado)
+    with metrics.timer('stage_seconds', stage='write'):
+        return tables.write_tables(salida, hojas, formats)
 
-# Reemplazar la hoja 'Resultados' con los datos combinados y limpios
-hojas['Resultados'] = df_combinado
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Añadir a resultados_licitaciones las columnas de licitaciones_filtradas")
+    parser.add_argument('--filtradas', default=ruta_excel_1,
+                        help="Salida de FiltrarObrasResueltas.py (por defecto: %(default)s)")
+    parser.add_argument('--resultados', default=ruta_resultados_licitaciones,
+                        help="Salida de op2.py; con .parquet se leen sus archivos _<hoja>.parquet (por defecto: %(default)s)")
+    parser.add_argument('--output', default=ruta_salida, help="Archivo de salida (por defecto: %(default)s)")
+    parser.add_argument('--formats', type=parse_formats, default=['xlsx'],
+                        help="Formatos de salida separados por comas: xlsx, csv, parquet (por defecto: xlsx)")
+    parser.add_argument('--duplicados', choices=list(DUPLICADOS), default='ultimo',
+                        help="Fila del primer archivo que se usa si un Identificador se repite, "
+                             "o 'error' para no combinar (por defecto: %(default)s)")
+    return parser.parse_args(argv)
 
-# Guardar el nuevo archivo Excel con todas las hojas
-ruta_salida = 'resultados_licitaciones_combinado.xlsx'
-try:
-    with pd.ExcelWriter(ruta_salida, engine='openpyxl') as writer:
-        for sheet_name, df in hojas.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    print(f"\nArchivo combinado y limpio guardado en: {ruta_salida}")
-except Exception as e:
-    print(f"Error al guardar el archivo: {e}")
\ No newline at end of file
+# Devuelve False si no se pudo combinar
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    try:
+        guardados = combinar(args.filtradas, args.resultados, args.output, args.formats, args.duplicados)
+    except FileNotFoundError as e:
+        print(f"Error: No se encuentra el archivo {e.filename}")
+        return False
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+    print(f"\nArchivo combinado y limpio guardado en: {', '.join(guardados)}")
+    metrics.report('unirResultados')
+    return True
+
+if __name__ == '__main__':
+    sys.exit(1 if main(parse_args()) is False else 0)
@@ -0,0 +1,359 @@
+import sqlite3
+import logging
+import time
+import os
+import zlib
+import html
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cache settings: tender pages expire after CACHE_TTL seconds, Adjudicación/Modificación
+# documents never do. The cache is trimmed to CACHE_MAX_BYTES (least recently used first).
+CACHE_FILE = 'url_cache.db'
+CACHE_TTL = 24 * 3600
+CACHE_MAX_BYTES = 4096 * 1024 * 1024
+DOC_TENDER = 'licitacion'
+DOC_DOCUMENT = 'documento'
+
+# Pages are stored compressed and written in batches of CACHE_BATCH_ROWS rows,
+# or when CACHE_BATCH_MS have passed since the last commit
+CACHE_CODEC = 'zstd' if zstandard else 'zlib'
+CACHE_BATCH_ROWS = 200
+CACHE_BATCH_MS = 500
+
+# Counters for the current run. 'revalidated' counts expired entries that a conditional request
+# found unchanged (304 Not Modified); they are moved from 'misses' and 'expired' to 'hits'.
+stats = {'hits': 0, 'misses': 0, 'expired': 0, 'revalidated': 0, 'written': 0,
+         'bytes_raw': 0, 'bytes_stored': 0, 'write_time': 0.0}
+
+_compressor = None
+_decompressor = None
+
+# SQLite connection that keeps the cache writes and access times waiting for the next commit
+class CacheConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+        self.accessed = {}
+        self.revalidated = {}
+        self.last_flush = time.monotonic()
+
+def classify_url(url):
+    return DOC_TENDER if 'detalle_licitacion' in url else DOC_DOCUMENT
+
+# Cache key of a URL, so op2.py and criteriosLici.py share entries for links written differently:
+# HTML entities unescaped (&amp;), scheme and host lowercased, default port and fragment dropped
+def normalize_url(url):
+    parts = urlsplit(html.unescape(url.strip()))
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rpartition(':')[2]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rpartition(':')[0]
+    return urlunsplit((scheme, netloc, parts.path, parts.query, ''))
+
+def compress(content, codec=None):
+    global _compressor
+    codec = codec or CACHE_CODEC
+    data = content.encode('utf-8')
+    if codec == 'zstd':
+        if _compressor is None:
+            _compressor = zstandard.ZstdCompressor(level=3)
+        return _compressor.compress(data)
+    return zlib.compress(data, 6)
+
+def decompress(blob, codec):
+    global _decompressor
+    if codec is None:
+        # Rows written before compression was added
+        return blob if isinstance(blob, str) else blob.decode('utf-8')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstandard is not installed, cannot read zstd cache entries")
+        if _decompressor is None:
+            _decompressor = zstandard.ZstdDecompressor()
+        return _decompressor.decompress(blob).decode('utf-8')
+    return zlib.decompress(blob).decode('utf-8')
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0.0 if key == 'write_time' else 0
+
+def merge_stats(other):
+    for key, value in other.items():
+        stats[key] += value
+
+# Set up SQLite cache
+def setup_cache(cache_file=None):
+    conn = sqlite3.connect(cache_file or CACHE_FILE, check_same_thread=False, factory=CacheConnection)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS cache
+                      (url TEXT PRIMARY KEY, content BLOB, codec TEXT, doc_class TEXT,
+                       fetched_at REAL, accessed_at REAL, etag TEXT, last_modified TEXT,
+                       size INTEGER, raw_size INTEGER)''')
+    migrate_cache(conn)
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_url ON cache(url)''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_accessed ON cache(accessed_at)''')
+    conn.commit()
+    return conn
+
+# Bring caches written by older versions (plain TEXT pages, no metadata) to the current schema
+def migrate_cache(conn, batch_size=1000):
+    cursor = conn.cursor()
+    columns = [info[1] for info in cursor.execute("PRAGMA table_info('cache')")]
+    for column, definition in [('codec', 'TEXT'), ('doc_class', 'TEXT'), ('fetched_at', 'REAL'),
+                               ('accessed_at', 'REAL'), ('etag', 'TEXT'), ('last_modified', 'TEXT'),
+                               ('size', 'INTEGER'), ('raw_size', 'INTEGER')]:
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE cache ADD COLUMN {column} {definition}')
+    conn.commit()
+    migrated = 0
+    now = time.time()
+    while True:
+        rows = cursor.execute('''SELECT rowid, url, content, doc_class, fetched_at FROM cache
+                                 WHERE codec IS NULL LIMIT ?''', (batch_size,)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for rowid, url, content, doc_class, fetched_at in rows:
+            content = decompress(content or '', None)
+            blob = compress(content)
+            updates.append((blob, CACHE_CODEC, doc_class or classify_url(url), fetched_at or now,
+                            fetched_at or now, len(blob), len(content.encode('utf-8')), rowid))
+        cursor.executemany('''UPDATE cache SET content = ?, codec = ?, doc_class = ?, fetched_at = ?,
+                              accessed_at = COALESCE(accessed_at, ?), size = ?, raw_size = ?
+                              WHERE rowid = ?''', updates)
+        conn.commit()
+        migrated += len(rows)
+        logging.info("Migrated %s cache entries to compressed storage", migrated)
+    if migrated:
+        print(f"Migrated {migrated} cache entries to compressed storage, compacting cache file...")
+        conn.execute('VACUUM')
+    # Version 1: entries are keyed by normalize_url
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < 1:
+        renamed = [(normalize_url(url), url) for url, in cursor.execute('SELECT url FROM cache')
+                   if normalize_url(url) != url]
+        cursor.executemany('UPDATE OR REPLACE cache SET url = ? WHERE url = ?', renamed)
+        cursor.execute('PRAGMA user_version = 1')
+        conn.commit()
+        if renamed:
+            logging.info("Normalized the URL of %s cache entries", len(renamed))
+
+def is_expired(doc_class, fetched_at, ttl=None):
+    ttl = CACHE_TTL if ttl is None else ttl
+    return doc_class == DOC_TENDER and ttl > 0 and (fetched_at or 0) < time.time() - ttl
+
+# SQLite cache functions
+def get_cached_content(conn, url):
+    url = normalize_url(url)
+    pending = conn.pending.get(url)
+    if pending:
+        stats['hits'] += 1
+        return pending['content']
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT content, codec, doc_class, fetched_at FROM cache WHERE url = ?', (url,))
+        cached = cursor.fetchone()
+        if cached and url not in conn.revalidated and is_expired(cached[2], cached[3]):
+            stats['expired'] += 1
+            logging.debug("Cache entry expired for %s", url)
+            cached = None
+        if cached:
+            content = decompress(cached[0], cached[1])
+            stats['hits'] += 1
+            conn.accessed[url] = time.time()
+            return content
+        stats['misses'] += 1
+        logging.debug("Cache miss for %s", url)
+        return None
+    except (sqlite3.Error, ValueError, zlib.error) as e:
+        logging.error("Error reading cache for %s: %s", url, e)
+        return None
+
+def has_url(conn, url):
+    url = normalize_url(url)
+    if url in conn.pending:
+        return True
+    try:
+        return conn.execute('SELECT 1 FROM cache WHERE url = ?', (url,)).fetchone() is not None
+    except sqlite3.Error as e:
+        logging.error("SQLite error reading cache for %s: %s", url, e)
+        return False
+
+# If-None-Match/If-Modified-Since headers from the validators stored with a cached page,
+# expired or not, so the server can answer 304 instead of sending the page again
+def conditional_headers(conn, url):
+    url = normalize_url(url)
+    entry = conn.pending.get(url)
+    if entry:
+        etag, last_modified = entry['etag'], entry['last_modified']
+    else:
+        try:
+            row = conn.execute('SELECT etag, last_modified FROM cache WHERE url = ?', (url,)).fetchone()
+        except sqlite3.Error as e:
+            logging.error("SQLite error reading cache for %s: %s", url, e)
+            row = None
+        etag, last_modified = row or (None, None)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+# The server answered 304: return the cached page and restart its TTL. None if the entry is
+# gone, leaving the stats untouched. If the entry was expired, the lookup that led to the
+# request was counted as an expired miss, so it becomes a hit.
+def revalidate_content(conn, url, etag=None, last_modified=None):
+    url = normalize_url(url)
+    now = time.time()
+    entry = conn.pending.get(url)
+    if entry:
+        entry['fetched_at'] = now
+        content = entry['content']
+        expired = False
+    else:
+        try:
+            row = conn.execute('SELECT content, codec, doc_class, fetched_at FROM cache WHERE url = ?', (url,)).fetchone()
+            content = decompress(row[0], row[1]) if row else None
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            logging.error("Error reading cache for %s: %s", url, e)
+            content = None
+        if content is None:
+            return None
+        expired = url not in conn.revalidated and is_expired(row[2], row[3])
+        conn.revalidated[url] = (now, etag, last_modified)
+    stats['revalidated'] += 1
+    if expired:
+        stats['hits'] += 1
+        stats['misses'] -= 1
+        stats['expired'] -= 1
+    logging.debug("Not modified, cache entry revalidated for %s", url)
+    return content
+
+def cache_content(conn, url, content, doc_class=None, etag=None, last_modified=None):
+    url = normalize_url(url)
+    conn.pending[url] = {'content': content, 'doc_class': doc_class or classify_url(url), 'fetched_at': time.time(),
+                         'etag': etag, 'last_modified': last_modified}
+    if (len(conn.pending) >= CACHE_BATCH_ROWS
+            or (time.monotonic() - conn.last_flush) * 1000 >= CACHE_BATCH_MS):
+        flush_cache(conn)
+
+# Commit the buffered pages and access times in one transaction
+def flush_cache(conn):
+    conn.last_flush = time.monotonic()
+    if not conn.pending and not conn.accessed and not conn.revalidated:
+        return
+    start = time.perf_counter()
+    rows = []
+    bytes_raw = bytes_stored = 0
+    for url, entry in conn.pending.items():
+        raw_size = len(entry['content'].encode('utf-8'))
+        blob = compress(entry['content'])
+        bytes_raw += raw_size
+        bytes_stored += len(blob)
+        rows.append((url, blob, CACHE_CODEC, entry['doc_class'], entry['fetched_at'], entry['fetched_at'],
+                     entry['etag'], entry['last_modified'], len(blob), raw_size))
+    try:
+        with conn:
+            conn.executemany('''INSERT OR REPLACE INTO cache
+                                (url, content, codec, doc_class, fetched_at, accessed_at, etag, last_modified, size, raw_size)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            conn.executemany('UPDATE cache SET accessed_at = ? WHERE url = ?',
+                             [(accessed_at, url) for url, accessed_at in conn.accessed.items()])
+            conn.executemany('''UPDATE cache SET fetched_at = ?, accessed_at = ?, etag = COALESCE(?, etag),
+                                last_modified = COALESCE(?, last_modified) WHERE url = ?''',
+                             [(fetched_at, fetched_at, etag, last_modified, url)
+                              for url, (fetched_at, etag, last_modified) in conn.revalidated.items()])
+        stats['written'] += len(rows)
+        stats['bytes_raw'] += bytes_raw
+        stats['bytes_stored'] += bytes_stored
+    except sqlite3.Error as e:
+        logging.error("SQLite error saving %s cache entries: %s", len(rows), e)
+    conn.pending.clear()
+    conn.accessed.clear()
+    conn.revalidated.clear()
+    stats['write_time'] += time.perf_counter() - start
+
+def close_cache(conn):
+    flush_cache(conn)
+    conn.close()
+
+# Delete least recently used entries until the cache holds at most max_bytes of content
+def evict_cache(conn, max_bytes=None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    flush_cache(conn)
+    if max_bytes <= 0:
+        return 0
+    try:
+        cursor = conn.cursor()
+        total = cursor.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        evicted = []
+        for url, size in cursor.execute('SELECT url, size FROM cache ORDER BY accessed_at').fetchall():
+            if total <= max_bytes:
+                break
+            evicted.append((url,))
+            total -= size or 0
+        cursor.executemany('DELETE FROM cache WHERE url = ?', evicted)
+        conn.commit()
+        logging.info("Evicted %s cache entries to stay under %.1f MB", len(evicted), max_bytes / 1024 / 1024)
+        print(f"Evicted {len(evicted)} cache entries to stay under {max_bytes / 1024 / 1024:.1f} MB")
+        return len(evicted)
+    except sqlite3.Error as e:
+        logging.error("SQLite error evicting cache entries: %s", e)
+        return 0
+
+# One-line summaries of the counters of the current run
+def format_run_stats():
+    total_requests = stats['hits'] + stats['misses']
+    hit_rate = (stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+    lines = [f"Cache stats: Hits={stats['hits']} ({stats['revalidated']} revalidated with 304), "
+             f"Misses={stats['misses']} ({stats['expired']} expired), Hit Rate={hit_rate:.2f}%"]
+    if stats['written']:
+        ratio = stats['bytes_raw'] / stats['bytes_stored'] if stats['bytes_stored'] else 0
+        rate = stats['written'] / stats['write_time'] if stats['write_time'] > 0 else 0
+        lines.append(f"Cache writes: {stats['written']} pages, {stats['bytes_raw'] / 1024 / 1024:.1f} MB -> "
+                     f"{stats['bytes_stored'] / 1024 / 1024:.1f} MB ({CACHE_CODEC}, ratio {ratio:.1f}x), "
+                     f"{rate:.0f} pages/s")
+    return lines
+
+# Summary of the cache contents for the 'cache stats' command
+def cache_stats(conn, ttl=None):
+    summary = {}
+    for doc_class, entries, size, raw_size, oldest, newest in conn.execute(
+            '''SELECT doc_class, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0),
+                      MIN(fetched_at), MAX(fetched_at)
+               FROM cache GROUP BY doc_class'''):
+        summary[doc_class] = {'entries': entries, 'size': size, 'raw_size': raw_size,
+                              'oldest': oldest, 'newest': newest, 'expired': 0}
+    for doc_class, fetched_at in conn.execute('SELECT doc_class, fetched_at FROM cache WHERE doc_class = ?', (DOC_TENDER,)):
+        if is_expired(doc_class, fetched_at, ttl):
+            summary[doc_class]['expired'] += 1
+    return summary
+
+def print_cache_stats(cache_file=None, ttl=None):
+    cache_file = cache_file or CACHE_FILE
+    if not os.path.exists(cache_file):
+        print(f"Cache file '{cache_file}' does not exist")
+        return
+    conn = setup_cache(cache_file)
+    summary = cache_stats(conn, ttl)
+    close_cache(conn)
+    print(f"Cache file: {cache_file} ({os.path.getsize(cache_file) / 1024 / 1024:.1f} MB on disk)")
+    for doc_class, s in sorted(summary.items(), key=lambda item: str(item[0])):
+        oldest = time.strftime('%Y-%m-%d %H:%M', time.localtime(s['oldest'])) if s['oldest'] else '-'
+        newest = time.strftime('%Y-%m-%d %H:%M', time.localtime(s['newest'])) if s['newest'] else '-'
+        print(f"  {doc_class}: {s['entries']} entries, {s['raw_size'] / 1024 / 1024:.1f} MB "
+              f"({s['size'] / 1024 / 1024:.1f} MB compressed), {s['expired']} expired, fetched {oldest} .. {newest}")
+    size = sum(s['size'] for s in summary.values())
+    raw_size = sum(s['raw_size'] for s in summary.values())
+    ratio = raw_size / size if size else 0
+    print(f"  Total: {sum(s['entries'] for s in summary.values())} entries, {raw_size / 1024 / 1024:.1f} MB "
+          f"({size / 1024 / 1024:.1f} MB compressed, ratio {ratio:.1f}x)")
@@ -0,0 +1,181 @@
+import posixpath
+from zipfile import ZipFile
+from lxml import etree
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from openpyxl.xml.constants import PKG_REL_NS, REL_NS, SHEET_MAIN_NS
+
+# Streaming reader of the sheets of an .xlsx file for FiltrarObrasResueltas.py and tables.py.
+# The workbook parts (sheet list, shared strings, styles) are read from the archive with lxml,
+# using only openpyxl's public number format and date helpers; the sheet XML is walked row by
+# row with lxml.etree.iterparse and a cell is only decoded when value() is called on it, so a
+# filter decodes its own columns and the rest of the row only when it matches. Values are those
+# of openpyxl.load_workbook(read_only=True, data_only=True).
+
+ROW_TAG = f'{{{SHEET_MAIN_NS}}}row'
+CELL_TAG = f'{{{SHEET_MAIN_NS}}}c'
+VALUE_TAG = f'{{{SHEET_MAIN_NS}}}v'
+INLINE_STRING_TAG = f'{{{SHEET_MAIN_NS}}}is'
+TEXT_TAG = f'{{{SHEET_MAIN_NS}}}t'
+RUN_TAG = f'{{{SHEET_MAIN_NS}}}r'
+PHONETIC_TAG = f'{{{SHEET_MAIN_NS}}}rPh'
+SHARED_STRING_TAG = f'{{{SHEET_MAIN_NS}}}si'
+RELATIONSHIP_TAG = f'{{{PKG_REL_NS}}}Relationship'
+DIGITS = '0123456789'
+
+_column_indexes = {}
+
+# 0-based index of the column of a cell reference such as 'AB12'
+def column_index(reference):
+    letters = reference.rstrip(DIGITS)
+    index = _column_indexes.get(letters)
+    if index is None:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - 64
+        index = _column_indexes[letters] = index - 1
+    return index
+
+# Relationships of a part of the archive ('' for the package), as id -> (type, target path)
+def relationships(archive, part):
+    folder, name = posixpath.split(part)
+    path = posixpath.join(folder, '_rels', name + '.rels')
+    if path not in archive.NameToInfo:
+        return {}
+    rels = {}
+    for rel in etree.fromstring(archive.read(path)).iter(RELATIONSHIP_TAG):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        target = target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
+
+def part_of_type(rels, kind, default=None):
+    return next((target for rel_type, target in rels.values() if rel_type.endswith('/' + kind)), default)
+
+# Text of each shared string: its runs, without the phonetic ones, as openpyxl reads them
+def read_shared_strings(source):
+    strings = []
+    for _, item in etree.iterparse(source, events=('end',), tag=SHARED_STRING_TAG):
+        text = ''.join(t.text or '' for t in item.iter(TEXT_TAG) if t.getparent().tag != PHONETIC_TAG)
+        strings.append(text.replace('x005F_', ''))
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+    return strings
+
+# Indexes of the cell styles with a date and with a duration number format
+def read_date_styles(source):
+    tree = etree.fromstring(source)
+    custom = {int(fmt.get('numFmtId')): fmt.get('formatCode')
+              for fmt in tree.iterfind(f'{{{SHEET_MAIN_NS}}}numFmts/{{{SHEET_MAIN_NS}}}numFmt')}
+    date_styles, timedelta_styles = set(), set()
+    for index, xf in enumerate(tree.iterfind(f'{{{SHEET_MAIN_NS}}}cellXfs/{{{SHEET_MAIN_NS}}}xf')):
+        number_format = int(xf.get('numFmtId', 0))
+        code = custom[number_format] if number_format in custom else builtin_format_code(number_format)
+        if is_date_format(code):
+            date_styles.add(index)
+        if is_timedelta_format(code):
+            timedelta_styles.add(index)
+    return date_styles, timedelta_styles
+
+class XlsxReader:
+    def __init__(self, path):
+        self.archive = ZipFile(path)
+        try:
+            workbook = part_of_type(relationships(self.archive, ''), 'officeDocument', 'xl/workbook.xml')
+            rels = relationships(self.archive, workbook)
+            tree = etree.fromstring(self.archive.read(workbook))
+            properties = tree.find(f'{{{SHEET_MAIN_NS}}}workbookPr')
+            date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+            self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+            self.sheets = {}
+            for sheet in tree.iterfind(f'{{{SHEET_MAIN_NS}}}sheets/{{{SHEET_MAIN_NS}}}sheet'):
+                rel_type, target = rels.get(sheet.get(f'{{{REL_NS}}}id'), ('', None))
+                if 'chartsheet' not in rel_type and target in self.archive.NameToInfo:
+                    self.sheets[sheet.get('name')] = target
+            self.shared_strings = []
+            strings = part_of_type(rels, 'sharedStrings')
+            if strings in self.archive.NameToInfo:
+                with self.archive.open(strings) as source:
+                    self.shared_strings = read_shared_strings(source)
+            self.date_styles, self.timedelta_styles = set(), set()
+            styles = part_of_type(rels, 'styles')
+            if styles in self.archive.NameToInfo:
+                self.date_styles, self.timedelta_styles = read_date_styles(self.archive.read(styles))
+        except BaseException:
+            self.archive.close()
+            raise
+
+    @property
+    def sheetnames(self):
+        return list(self.sheets)
+
+    # Cells of each row of a sheet as a list indexed by column (None where there is no cell).
+    # Rows missing from the file are skipped, or given as empty lists with fill, as openpyxl
+    # does. A row is only valid until the next one is read.
+    def rows(self, sheet, fill=False):
+        with self.archive.open(self.sheets[sheet]) as source:
+            number = 0
+            for _, row in etree.iterparse(source, events=('end',), tag=ROW_TAG):
+                number += 1
+                if fill and row.get('r'):
+                    while number < int(row.get('r')):
+                        yield []
+                        number += 1
+                cells = []
+                for position, cell in enumerate(row.iterchildren(CELL_TAG)):
+                    reference = cell.get('r')
+                    index = column_index(reference) if reference else position
+                    if index >= len(cells):
+                        cells.extend([None] * (index + 1 - len(cells)))
+                    cells[index] = cell
+                yield cells
+                row.clear()
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+
+    # Value of a cell element from rows(), as openpyxl reads it
+    def value(self, cell):
+        if cell is None:
+            return None
+        data_type = cell.get('t', 'n')
+        if data_type == 'inlineStr':
+            text = cell.find(INLINE_STRING_TAG)
+            if text is None:
+                return None
+            if len(text) == 1 and text[0].tag == TEXT_TAG:
+                return text[0].text or ''
+            return ''.join(t.text or '' for t in text.iter(TEXT_TAG) if t.getparent().tag != PHONETIC_TAG)
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        if data_type != 'n':
+            return value
+        if '.' in value or 'E' in value or 'e' in value:
+            value = float(value)
+        else:
+            value = int(value)
+        style = int(cell.get('s', 0))
+        if style in self.date_styles:
+            try:
+                return from_excel(value, self.epoch, timedelta=style in self.timedelta_styles)
+            except (OverflowError, ValueError):
+                return '#VALUE!'
+        return value
+
+    def values(self, cells, width=0):
+        values = [self.value(cell) for cell in cells]
+        if len(values) < width:
+            values.extend([None] * (width - len(values)))
+        return values
+
+    def close(self):
+        self.archive.close()